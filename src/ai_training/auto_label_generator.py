@@ -120,14 +120,38 @@
    # 5分钟线数据
    python ai_training_data/auto_label_generator.py --period 5min
 
+8. 多进程并行（全市场生成）
+   --------------------------------
+   # 按股票分片到32个进程，结果与单进程一致
+   python ai_training_data/auto_label_generator.py --workers 32
+   
+   # 配合本地K线库（各进程共享内存映射文件）
+   python ai_training_data/auto_label_generator.py --bar-store ./bar_store --workers 32
+
+9. 全市场均匀采样（蓄水池）
+   --------------------------------
+   # 单遍扫描全部股票，每类随机保留10000个样本（不受股票顺序影响）
+   python ai_training_data/auto_label_generator.py --sampling reservoir --up 10000 --down 10000 --sideways 10000 --seed 42
+
+10. 多周期、多阈值扫描（单遍读取K线）
+   --------------------------------
+   # 4个观察周期 × 3个阈值 = 12个数据集，K线只读取一次
+   python ai_training_data/auto_label_generator.py --future-days 3 5 10 15 --threshold 0.03 0.05 0.08
+   
+   # 输出: ai_training_data/day_kline_training_{N}d_{阈值}pct/，如 day_kline_training_5d_3pct/
+
 ═══════════════════════════════════════════════════════════════════════
 📁 输出目录结构
 ═══════════════════════════════════════════════════════════════════════
 
 ai_training_data/{period}_kline_training/  # period = day/week/1hour/30min/15min/5min
-  ├── up_trend/data.json      # 上涨样本（未来5天涨幅>3%）
-  ├── down_trend/data.json    # 下跌样本（未来5天跌幅<-3%）
-  └── sideways/data.json      # 横盘样本（未来5天涨跌幅在±3%之间）
+  ├── up_trend/               # 上涨样本（未来5天涨幅>3%）
+  │   ├── meta.json           # 生成参数 + 周期 {"generation_params": {...}, "type": "day"}
+  │   └── data.jsonl          # 每行一个样本 {"stock_code": "600000", "date": "2023-01-16", "return": 0.041}
+  ├── down_trend/             # 下跌样本（未来5天跌幅<-3%）
+  └── sideways/               # 横盘样本（未来5天涨跌幅在±3%之间）
+
+  同一股票的不同日期可以同时作为样本；--format json 输出旧格式 data.json（每只股票每类一个样本）
 
 示例：
   - ai_training_data/day_kline_training/     # 日线训练数据
@@ -235,11 +259,16 @@ ai_training_data/{period}_kline_training/  # period = day/week/1hour/30min/15min
 --period        K线周期 (day/week/1hour/30min/15min/5min) (默认: day)
 --start         训练数据起始日期 (默认: 2020-01-01)
 --end           训练数据结束日期 (默认: 2024-10-31)
---future-days   未来观察天数 (默认: 5)
---threshold     涨跌阈值（绝对值） (默认: 0.03 即3%)
+--future-days   未来观察天数，可指定多个 (默认: 5)
+--threshold     涨跌阈值（绝对值），可指定多个 (默认: 0.03 即3%)
 --up            上涨样本数量 (默认: 2000)
 --down          下跌样本数量 (默认: 2000)
 --sideways      横盘样本数量 (默认: 2000)
+--bar-store     本地K线库目录（可选，见 bar_store.py；指定后不连接数据库）
+--workers       并行进程数 (默认: 1)
+--sampling      采样方式 greedy/reservoir (默认: greedy)
+--seed          蓄水池采样随机种子 (默认: 42)
+--format        输出格式 jsonl/json (默认: jsonl)
 
 ═══════════════════════════════════════════════════════════════════════
 """
@@ -248,32 +277,25 @@ import sys
 import os
 import json
 import argparse
+import copy
+import heapq
+import multiprocessing
 from datetime import datetime, timedelta
 from pathlib import Path
 import numpy as np
 import shutil
 
 # 导入数据库模块
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-try:
-    from src.ai_training.kline_data_loader import StockImageAnalyzer
-    from database.config import SessionLocal
-    from database.models import stock_kline_day, stock_kline_week, stock_kline_1hour, stock_kline_30min, stock_kline_15min, stock_kline_5min
-except ImportError as e:
-    print(f"❌ 导入失败: {e}")
-    print("请确保数据库配置正确")
-    sys.exit(1)
-
-# K线周期与数据库表的映射
-PERIOD_MODEL_MAP = {
-    'day': stock_kline_day.StockKlineDay,
-    'week': stock_kline_week.StockKlineWeek,
-    '1hour': stock_kline_1hour.StockKline1Hour,
-    '30min': stock_kline_30min.StockKline30Min,
-    '15min': stock_kline_15min.StockKline15Min,
-    '5min': stock_kline_5min.StockKline5Min
-}
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ai_training.kline_window import KlineWindow, format_kline_date
+
+# 数据库模块（sqlalchemy、K线表模型）在创建数据库会话/读取K线时才导入，--help 和本地K线库模式不加载
+from src.ai_training.kline_data_loader import DATE_FIELD_MAP, get_kline_model, kline_columns
+from src.ai_training.db_session import DATABASE_AVAILABLE, create_session, stream_rows
+
+# 支持的K线周期
+SUPPORTED_PERIODS = ['day', 'week', '1hour', '30min', '15min', '5min']
 
 # ═══════════════════════════════════════════════════════════════════════════
 # 🔥 全局配置：核心参数（修改后必须重新生成数据+重新训练模型）
@@ -311,6 +333,117 @@ THRESHOLD_DOWN = -0.03  # 下跌阈值：-3%
 
 # ═══════════════════════════════════════════════════════════════════════════
 
+# 历史窗口长度（特征提取使用的K线根数）
+HISTORY_BARS = 120
+
+# 标签顺序（label_bars 返回的标签编码即此列表下标）
+TREND_LABELS = ['up_trend', 'down_trend', 'sideways']
+
+# 采样方式
+SAMPLING_MODES = ['greedy', 'reservoir']
+
+# 输出格式
+OUTPUT_FORMATS = ['jsonl', 'json']
+
+# 样本状态编码
+STATUS_OK = 0
+STATUS_SUSPENDED = 1   # 当天或未来停牌
+STATUS_LIMIT = 2       # 当天涨跌停
+STATUS_INVALID = 3     # 数据缺失/异常（不计入停牌、涨跌停统计）
+
+
+def label_bars(klines, future_days=FUTURE_DAYS, up_threshold=THRESHOLD_UP, down_threshold=THRESHOLD_DOWN,
+               history_bars=HISTORY_BARS):
+    """
+    向量化生成一只股票全部候选样本的标签（与 generate_label_for_sample 逐根判断结果一致）
+
+    候选位置为 [history_bars, len(klines) - future_days)，一次性计算:
+        - 未来收益率: close 向后平移 future_days
+        - 未来停牌: 成交量为0标记在未来窗口上的滑动最大值
+        - 涨跌停: 收盘价=最高/最低价 且 |涨跌幅|>9.5% 的数组掩码
+
+    参数:
+        klines: KlineWindow（时间正序）
+        future_days: 未来观察K线数
+        up_threshold, down_threshold: 涨跌阈值
+        history_bars: 历史窗口长度
+
+    返回:
+        dict: {
+            'index':  候选位置 (int64),
+            'status': 样本状态 STATUS_* (int8),
+            'label':  标签编码，TREND_LABELS 下标，无效样本为 -1 (int8),
+            'return': 未来收益率 (float64，无效样本为 nan)
+        }
+    """
+    n = len(klines)
+    index = np.arange(history_bars, max(history_bars, n - future_days))
+    if len(index) == 0 or future_days < 1:
+        return {
+            'index': index,
+            'status': np.full(len(index), STATUS_INVALID, dtype=np.int8),
+            'label': np.full(len(index), -1, dtype=np.int8),
+            'return': np.full(len(index), np.nan),
+        }
+
+    open_ = klines.open[index]
+    high = klines.high[index]
+    low = klines.low[index]
+    close = klines.close[index]
+    volume = klines.volume[index]
+    future_close = klines.close[index + future_days]
+
+    # 未来窗口 [idx+1, idx+future_days] 的停牌/缺失标记（滑动窗口最大值）
+    future_windows = np.lib.stride_tricks.sliding_window_view(klines.volume[1:], future_days)[index]
+    future_suspended = (future_windows == 0).any(axis=1)
+    future_missing = np.isnan(future_windows).any(axis=1)
+
+    # 只有收盘价=最高/最低价时才按开盘价计算涨跌幅，开盘价为0的K线也只在这时无效（与 check_data_quality 一致）
+    at_high_low = (np.abs(close - high) < 0.01) | (np.abs(close - low) < 0.01)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.abs((close - open_) / open_)
+        limit = at_high_low & (change > 0.095)
+        returns = (future_close - close) / close
+
+    price_missing = (np.isnan(open_) | np.isnan(high) | np.isnan(low) | np.isnan(close)
+                     | ((open_ == 0) & at_high_low))
+    status = np.select(
+        [
+            np.isnan(volume),
+            volume == 0,
+            price_missing,
+            limit,
+            future_missing,
+            future_suspended,
+            ~np.isfinite(returns),
+        ],
+        [STATUS_INVALID, STATUS_SUSPENDED, STATUS_INVALID, STATUS_LIMIT,
+         STATUS_INVALID, STATUS_SUSPENDED, STATUS_INVALID],
+        default=STATUS_OK,
+    ).astype(np.int8)
+
+    ok = status == STATUS_OK
+    label = np.select([returns > up_threshold, returns < down_threshold], [0, 1], default=2).astype(np.int8)
+    label[~ok] = -1
+    returns[~ok] = np.nan
+
+    return {'index': index, 'status': status, 'label': label, 'return': returns}
+
+
+def relabel_bars(labeled, up_threshold, down_threshold):
+    """
+    用新的涨跌阈值重新划分 label_bars() 的结果（同一观察周期的收益率、停牌/涨跌停判断可复用）
+
+    返回:
+        新的结果字典（status/return/index 与原结果共享）
+    """
+    ok = labeled['status'] == STATUS_OK
+    with np.errstate(invalid='ignore'):
+        label = np.select([labeled['return'] > up_threshold, labeled['return'] < down_threshold],
+                          [0, 1], default=2).astype(np.int8)
+    label[~ok] = -1
+    return dict(labeled, label=label)
+
 
 class AutoLabelGenerator:
     """自动标签生成器"""
@@ -322,7 +455,12 @@ class AutoLabelGenerator:
                  future_days=FUTURE_DAYS,        # ✅ 使用全局常量作为默认值
                  up_threshold=THRESHOLD_UP,      # ✅ 使用全局常量作为默认值
                  down_threshold=THRESHOLD_DOWN,  # ✅ 使用全局常量作为默认值
-                 max_samples_per_class=2000):  # ⭐ 默认2000个/类：统计学性价比最优点
+                 max_samples_per_class=2000,  # ⭐ 默认2000个/类：统计学性价比最优点
+                 bar_store=None,
+                 sampling='greedy',
+                 random_seed=42,
+                 output_format='jsonl',
+                 verbose=True):
         """
         初始化标签生成器
         
@@ -406,6 +544,20 @@ class AutoLabelGenerator:
                 → 500-3000个/类：推荐区间
                 → 2000个/类：权重稳定±0.7%，性价比最优
                 → >5000个/类：收益递减，不推荐
+            
+            bar_store: 本地K线库（BarStore / MemmapBarStore），指定后从本地库读取K线，不连接数据库
+            
+            sampling: 采样方式
+                → 'greedy': 按股票顺序收集，各类别满后提前结束（样本集中在靠前的股票）
+                → 'reservoir': 扫描全部股票，每类保留固定大小的蓄水池，
+                  样本在股票和日期上均匀分布，内存占用 O(max_samples_per_class)
+            random_seed: 蓄水池采样的随机种子（相同种子+相同数据 → 相同结果）
+            
+            output_format: 输出格式
+                → 'jsonl': data.jsonl + meta.json，按 (股票代码, 日期) 保存，同一股票可贡献多个样本 ⭐
+                → 'json': 旧格式 data.json，按股票代码保存，每只股票每类只保留一个样本
+            
+            verbose: 是否打印初始化信息（数据库连接/本地K线库），进程池子进程中为 False
         """
         self.period = period
         self.start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -415,10 +567,25 @@ class AutoLabelGenerator:
         self.down_threshold = down_threshold
         self.max_samples_per_class = max_samples_per_class
         
+        self.bar_store = bar_store
+        
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"不支持的采样方式: {sampling}, 可选: {SAMPLING_MODES}")
+        self.sampling = sampling
+        self.random_seed = random_seed
+        self.output_dir = None  # None: ./ai_training_data/{period}_kline_training
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}, 可选: {OUTPUT_FORMATS}")
+        self.output_format = output_format
+        self.verbose = verbose
+        
         # 获取对应周期的数据库模型
-        if period not in PERIOD_MODEL_MAP:
-            raise ValueError(f"不支持的周期: {period}, 可选: {list(PERIOD_MODEL_MAP.keys())}")
-        self.kline_model = PERIOD_MODEL_MAP[period]
+        if period not in SUPPORTED_PERIODS:
+            raise ValueError(f"不支持的周期: {period}, 可选: {SUPPORTED_PERIODS}")
+        if bar_store is None and not DATABASE_AVAILABLE:
+            raise RuntimeError("数据库未配置，请检查数据库配置或使用本地K线库（--bar-store）")
+        # K线周期对应的数据库表（使用本地K线库时不需要）
+        self.kline_model = get_kline_model(period) if bar_store is None else None
         
         # 检查时间截断规则
         today = datetime.now().date()
@@ -427,13 +594,36 @@ class AutoLabelGenerator:
             self.end_date = today - timedelta(days=future_days+1)
         
         # 初始化数据库连接
-        print("\n正在初始化数据库连接...")
-        self.db = SessionLocal()
-        print("✅ 数据库连接成功")
+        self.db = None
+        if bar_store is None:
+            if verbose:
+                print("\n正在初始化数据库连接...")
+            self.db = create_session()
+            if verbose:
+                print("✅ 数据库连接成功")
+        elif verbose:
+            print(f"\n✅ 使用本地K线库: {bar_store.root}")
         
+        self.reset_samples()
+    
+    def close(self):
+        """关闭数据库会话（连接归还连接池；会话再次使用时从连接池重新取出连接）"""
+        if self.db is not None:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def reset_samples(self):
+        """清空已收集的样本、统计信息和蓄水池"""
         # 初始化数据分类字典
+        # jsonl: {(股票代码, 日期): {'date': 日期, 'return': 收益率}}
+        # json:  {股票代码: {'date': 日期, 'return': 收益率}}
         self.data_by_trend = {
-            'up_trend': {},      # 上涨样本：{'股票代码': '日期', ...}
+            'up_trend': {},      # 上涨样本
             'down_trend': {},    # 下跌样本
             'sideways': {}       # 横盘样本
         }
@@ -448,14 +638,36 @@ class AutoLabelGenerator:
             'skipped_suspended': 0,  # 跳过停牌
             'skipped_limit': 0       # 跳过涨跌停
         }
+        
+        self.rng = np.random.RandomState(self.random_seed)
+        # 蓄水池：每类一个大小不超过 max_samples_per_class 的堆，元素为 (-随机键, 股票代码, 日期, 收益率)
+        self.reservoirs = {label: [] for label in TREND_LABELS}
+    
+    def with_config(self, future_days, up_threshold, down_threshold):
+        """
+        创建使用不同观察周期/阈值的生成器（共享数据库会话和本地K线库，样本与统计独立）
+        
+        用于多周期、多阈值扫描：K线只读取一次，每个组合各自计算标签并输出到独立目录
+        """
+        variant = copy.copy(self)
+        variant.future_days = future_days
+        variant.up_threshold = up_threshold
+        variant.down_threshold = down_threshold
+        variant.output_dir = (f'./ai_training_data/{self.period}_kline_training_'
+                              f'{future_days}d_{up_threshold*100:g}pct')
+        variant.reset_samples()
+        return variant
     
     def get_all_stock_codes(self):
         """获取所有股票代码"""
         try:
-            # 查询所有不重复的股票代码
-            result = self.db.query(self.kline_model.stock_code).distinct().all()
-            stock_codes = [row[0] for row in result]
-            return stock_codes
+            if self.bar_store is not None:
+                return self.bar_store.list_stock_codes(self.period)
+            
+            from sqlalchemy import select
+            
+            # 查询所有不重复的股票代码（只取列，不加载 ORM 对象）
+            return list(self.db.execute(select(self.kline_model.stock_code).distinct()).scalars())
         except Exception as e:
             print(f"❌ 获取股票列表失败: {e}")
             return []
@@ -534,11 +746,15 @@ class AutoLabelGenerator:
                 label = 'sideways'
             
             # 元数据
+            if isinstance(klines, KlineWindow):
+                date_str = format_kline_date(klines.dates[idx])
+            else:
+                date_str = str(klines[idx].trade_date)
             metadata = {
                 'return_pct': return_pct,
                 'current_close': current_close,
                 'future_close': future_close,
-                'date': str(klines[idx].trade_date)
+                'date': date_str
             }
             
             return label, return_pct, metadata
@@ -546,69 +762,282 @@ class AutoLabelGenerator:
         except Exception as e:
             return None, 0, f"计算失败:{str(e)[:20]}"
     
-    def generate_for_stock(self, stock_code):
+    def load_stock_bars(self, stock_code):
         """
-        为单只股票生成标签数据
+        读取单只股票在 [start_date, end_date] 内的全部K线（时间正序）
+        
+        返回:
+            KlineWindow
+        """
+        if self.bar_store is not None:
+            end = self.end_date if self.bar_store.date_field(self.period) == 'trade_date' \
+                else datetime.combine(self.end_date, datetime.max.time())
+            return self.bar_store.read_bars(self.period, stock_code, self.start_date, end)
+        
+        from sqlalchemy import select
+        
+        date_field = DATE_FIELD_MAP[self.period]
+        date_column = getattr(self.kline_model, date_field)
+        end = self.end_date if date_field == 'trade_date' else datetime.combine(self.end_date, datetime.max.time())
+        try:
+            # 流式读取元组行直接写入K线窗口，不保留行对象
+            return KlineWindow.from_rows(stream_rows(
+                self.db,
+                select(*kline_columns(self.kline_model, date_field))
+                .where(
+                    self.kline_model.stock_code == stock_code,
+                    date_column >= self.start_date,
+                    date_column <= end
+                )
+                .order_by(date_column)
+            ), date_field)
+        finally:
+            # 每只股票读取后结束事务并清空会话（连接归还连接池），扫描全市场时会话不累积状态
+            self.db.close()
+    
+    def label_stock(self, stock_code):
+        """
+        计算单只股票的全部候选样本（不受样本上限影响，可在子进程中执行）
+        
+        参数:
+            stock_code: 股票代码
+        
+        返回:
+            dict: label_bars() 的结果，并附带 'dates'（候选样本日期）；数据不足时返回 None
+        """
+        config = (self.future_days, self.up_threshold, self.down_threshold)
+        return self.label_stock_configs(stock_code, [config])[0]
+    
+    def label_stock_configs(self, stock_code, configs):
+        """
+        读取一次K线，按多组 (观察周期, 上涨阈值, 下跌阈值) 计算候选样本
+        
+        同一观察周期只计算一次收益率和停牌/涨跌停判断，不同阈值仅重新划分标签
+        
+        返回:
+            list: 与 configs 一一对应的 label_stock() 结果
+        """
+        # 查询该股票的所有K线数据
+        klines = self.load_stock_bars(stock_code)
+        
+        by_horizon = {}
+        results = []
+        for future_days, up_threshold, down_threshold in configs:
+            if len(klines) < HISTORY_BARS + future_days:
+                results.append(None)
+                continue
+            
+            if future_days not in by_horizon:
+                # 一次性计算全部候选样本的标签
+                labeled = label_bars(klines, future_days, up_threshold, down_threshold)
+                labeled['dates'] = klines.dates[labeled['index']]
+                by_horizon[future_days] = labeled
+            else:
+                labeled = relabel_bars(by_horizon[future_days], up_threshold, down_threshold)
+            results.append(labeled)
+        
+        return results
+    
+    def merge_stock_labels(self, stock_code, labeled):
+        """
+        按样本上限规则将一只股票的候选样本并入 data_by_trend
+        
+        逐类别模拟原逐根遍历的规则：
+            - 类别未满时保存样本（同一股票在同一类别中只保留一条，后出现的覆盖先出现的）
+            - 所有类别都满后立即停止遍历
         
         参数:
             stock_code: 股票代码
+            labeled: label_stock() 的返回值
         
         返回:
             生成的样本数量
         """
-        try:
-            # 查询该股票的所有K线数据
-            klines = self.db.query(self.kline_model).filter(
-                self.kline_model.stock_code == stock_code,
-                self.kline_model.trade_date >= self.start_date,
-                self.kline_model.trade_date <= self.end_date
-            ).order_by(self.kline_model.trade_date).all()
+        if labeled is None:
+            self.stats['data_insufficient'] += 1
+            return 0
+        
+        if self.sampling == 'reservoir':
+            return self.sample_stock_labels(stock_code, labeled)
+        if self.output_format == 'jsonl':
+            return self._merge_all_samples(stock_code, labeled)
+        
+        status = labeled['status']
+        label_codes = labeled['label']
+        
+        positions = {label: np.flatnonzero(label_codes == code) for code, label in enumerate(TREND_LABELS)}
+        counts = {label: len(samples) for label, samples in self.data_by_trend.items()}
+        present = {label: stock_code in samples for label, samples in self.data_by_trend.items()}
+        
+        stop = len(status)
+        if all(count >= self.max_samples_per_class for count in counts.values()):
+            stop = 0
+        else:
+            first_saves = sorted(
+                (positions[label][0], label) for label in TREND_LABELS
+                if len(positions[label]) and not present[label] and counts[label] < self.max_samples_per_class
+            )
+            simulated = dict(counts)
+            for pos, label in first_saves:
+                simulated[label] += 1
+                if all(count >= self.max_samples_per_class for count in simulated.values()):
+                    stop = int(pos) + 1
+                    break
+        
+        self.stats['total_processed'] += stop
+        self.stats['skipped_suspended'] += int(np.count_nonzero(status[:stop] == STATUS_SUSPENDED))
+        self.stats['skipped_limit'] += int(np.count_nonzero(status[:stop] == STATUS_LIMIT))
+        
+        sample_count = 0
+        for label in TREND_LABELS:
+            pos = positions[label][positions[label] < stop]
+            if len(pos) == 0 or counts[label] >= self.max_samples_per_class:
+                continue
             
-            if len(klines) < 120 + self.future_days:
-                self.stats['data_insufficient'] += 1
-                return 0
+            # 第一条保存后类别已满，则后续样本都被跳过
+            if counts[label] + (0 if present[label] else 1) >= self.max_samples_per_class:
+                pos = pos[:1]
             
-            # 遍历每个可能的标注日期
-            sample_count = 0
+            last = pos[-1]
+            # ✅ 修改：保存实际收益率，而不只是日期
+            # 格式：{"股票代码": {"date": "日期", "return": 实际收益率}}
+            self.data_by_trend[label][stock_code] = {
+                'date': format_kline_date(labeled['dates'][last]),
+                'return': float(labeled['return'][last])  # ✅ 保存实际收益率
+            }
+            self.stats[label] += len(pos)
+            sample_count += len(pos)
+        
+        return sample_count
+    
+    def _merge_all_samples(self, stock_code, labeled):
+        """
+        按 (股票代码, 日期) 保存：每个候选样本都占一个名额，按日期顺序收集直到类别已满，
+        所有类别都满后立即停止遍历
+        """
+        status = labeled['status']
+        label_codes = labeled['label']
+        
+        accepted = {}
+        full_at = []
+        for code, label in enumerate(TREND_LABELS):
+            needed = max(0, self.max_samples_per_class - len(self.data_by_trend[label]))
+            pos = np.flatnonzero(label_codes == code)
+            accepted[label] = pos[:needed]
+            # 该类别在哪个位置被填满（已满为 -1，填不满为 None）
+            if needed == 0:
+                full_at.append(-1)
+            elif len(pos) >= needed:
+                full_at.append(int(pos[needed - 1]))
+            else:
+                full_at.append(None)
+        
+        stop = len(status) if None in full_at else max(full_at) + 1
+        
+        self.stats['total_processed'] += stop
+        self.stats['skipped_suspended'] += int(np.count_nonzero(status[:stop] == STATUS_SUSPENDED))
+        self.stats['skipped_limit'] += int(np.count_nonzero(status[:stop] == STATUS_LIMIT))
+        
+        sample_count = 0
+        for label in TREND_LABELS:
+            samples = self.data_by_trend[label]
+            for pos in accepted[label]:
+                date_str = format_kline_date(labeled['dates'][pos])
+                samples[(stock_code, date_str)] = {'date': date_str, 'return': float(labeled['return'][pos])}
+            self.stats[label] += len(accepted[label])
+            sample_count += len(accepted[label])
+        
+        return sample_count
+    
+    def sample_stock_labels(self, stock_code, labeled):
+        """
+        蓄水池采样：将一只股票的候选样本放入各类别的蓄水池
+        
+        每个候选样本分配一个均匀随机键，每类保留键最小的 max_samples_per_class 个样本，
+        等价于对全部样本随机排序后取前N个（与股票遍历顺序无关）。
+        旧 json 格式中每只股票每类只能保存一条样本，此时同一股票只保留键最小的候选。
+        
+        返回:
+            该股票的候选样本数量
+        """
+        status = labeled['status']
+        label_codes = labeled['label']
+        keys = self.rng.random_sample(len(status))
+        
+        self.stats['total_processed'] += len(status)
+        self.stats['skipped_suspended'] += int(np.count_nonzero(status == STATUS_SUSPENDED))
+        self.stats['skipped_limit'] += int(np.count_nonzero(status == STATUS_LIMIT))
+        
+        sample_count = 0
+        for code, label in enumerate(TREND_LABELS):
+            pos = np.flatnonzero(label_codes == code)
+            if len(pos) == 0:
+                continue
+            self.stats[label] += len(pos)
+            sample_count += len(pos)
             
-            for idx in range(120, len(klines) - self.future_days):
-                # 检查是否已经收集够了样本
-                if all(len(samples) >= self.max_samples_per_class for samples in self.data_by_trend.values()):
+            if self.output_format == 'json':
+                pos = pos[[np.argmin(keys[pos])]]
+            else:
+                pos = pos[np.argsort(keys[pos], kind='stable')]
+            
+            reservoir = self.reservoirs[label]
+            for best in pos:
+                if len(reservoir) >= self.max_samples_per_class and keys[best] >= -reservoir[0][0]:
+                    # 按键升序遍历，后面的样本也不会进入蓄水池
                     break
-                
-                self.stats['total_processed'] += 1
-                
-                # 生成标签
-                label, return_pct, metadata = self.generate_label_for_sample(klines, idx)
-                
-                if label is None:
-                    if '停牌' in str(metadata):
-                        self.stats['skipped_suspended'] += 1
-                    elif '涨停' in str(metadata) or '跌停' in str(metadata):
-                        self.stats['skipped_limit'] += 1
-                    continue
-                
-                # 检查该类别是否已满
-                if len(self.data_by_trend[label]) >= self.max_samples_per_class:
-                    continue
-                
-                # 保存样本
-                date_str = metadata['date']
-                # ✅ 修改：保存实际收益率，而不只是日期
-                # 格式：{"股票代码": {"date": "日期", "return": 实际收益率}}
-                self.data_by_trend[label][stock_code] = {
-                    'date': date_str,
-                    'return': float(return_pct)  # ✅ 保存实际收益率
+                item = (-float(keys[best]), stock_code,
+                        format_kline_date(labeled['dates'][best]), float(labeled['return'][best]))
+                if len(reservoir) < self.max_samples_per_class:
+                    heapq.heappush(reservoir, item)
+                else:
+                    heapq.heapreplace(reservoir, item)
+        
+        return sample_count
+    
+    def finalize_reservoirs(self):
+        """将蓄水池中的样本写入 data_by_trend（按股票代码、日期排序）"""
+        for label, reservoir in self.reservoirs.items():
+            samples = sorted(reservoir, key=lambda item: (item[1], item[2]))
+            self.data_by_trend[label] = {
+                (stock_code if self.output_format == 'json' else (stock_code, date_str)): {
+                    'date': date_str, 'return': return_pct
                 }
-                self.stats[label] += 1
-                sample_count += 1
-            
-            return sample_count
+                for _, stock_code, date_str, return_pct in samples
+            }
+    
+    def generate_for_stock(self, stock_code):
+        """
+        为单只股票生成标签数据
+        
+        参数:
+            stock_code: 股票代码
+        
+        返回:
+            生成的样本数量
+        """
+        try:
+            return self.merge_stock_labels(stock_code, self.label_stock(stock_code))
         
         except Exception as e:
             print(f"  ❌ 处理失败: {str(e)[:50]}")
             return 0
     
+    def worker_config(self):
+        """子进程重建生成器所需的参数（见 _init_label_worker）"""
+        return {
+            'period': self.period,
+            'start_date': str(self.start_date),
+            'end_date': str(self.end_date),
+            'future_days': self.future_days,
+            'up_threshold': self.up_threshold,
+            'down_threshold': self.down_threshold,
+            'max_samples_per_class': self.max_samples_per_class,
+            'random_seed': self.random_seed,
+            'output_format': self.output_format,
+            'bar_store': None if self.bar_store is None else (type(self.bar_store), str(self.bar_store.root)),
+        }
+    
     def backup_old_data(self, output_dir):
         """
         备份旧数据，保留最近3份备份
@@ -626,8 +1055,8 @@ class AutoLabelGenerator:
         # 检查是否有数据文件
         has_data = False
         for trend_name in ['up_trend', 'down_trend', 'sideways']:
-            json_file = output_path / trend_name / 'data.json'
-            if json_file.exists():
+            trend_path = output_path / trend_name
+            if (trend_path / 'data.json').exists() or (trend_path / 'data.jsonl').exists():
                 has_data = True
                 break
         
@@ -684,7 +1113,7 @@ class AutoLabelGenerator:
     
     def save_to_json(self, output_dir=None):
         """
-        保存生成的标签数据到JSON文件
+        保存生成的标签数据到JSON文件（jsonl: data.jsonl + meta.json；json: data.json）
         
         参数:
             output_dir: 输出目录（如为None则自动根据周期生成）
@@ -732,13 +1161,33 @@ class AutoLabelGenerator:
             
             generation_params["趋势类型"] = trend_description
             
-            json_file = trend_dir / 'data.json'
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'generation_params': generation_params,
-                    'type': self.period,
-                    'data': data_dict
-                }, f, ensure_ascii=False, indent=2)
+            if self.output_format == 'jsonl':
+                # meta.json: 生成参数和周期；data.jsonl: 每行一个样本
+                with open(trend_dir / 'meta.json', 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'generation_params': generation_params,
+                        'type': self.period,
+                    }, f, ensure_ascii=False, indent=2)
+                
+                json_file = trend_dir / 'data.jsonl'
+                with open(json_file, 'w', encoding='utf-8') as f:
+                    for key, sample in data_dict.items():
+                        stock_code = key[0] if isinstance(key, tuple) else key
+                        f.write(json.dumps({'stock_code': stock_code, **sample}, ensure_ascii=False) + '\n')
+                stale_file = trend_dir / 'data.json'
+            else:
+                json_file = trend_dir / 'data.json'
+                with open(json_file, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'generation_params': generation_params,
+                        'type': self.period,
+                        'data': data_dict
+                    }, f, ensure_ascii=False, indent=2)
+                stale_file = trend_dir / 'data.jsonl'
+            
+            # 删除另一种格式的旧文件（已备份），避免读取时混用
+            if stale_file.exists():
+                stale_file.unlink()
             
             print(f"✅ {trend_name}: {len(data_dict)} 个样本 → {json_file}")
     
@@ -768,18 +1217,105 @@ class AutoLabelGenerator:
             else:
                 print("\n✅ 样本分布较为均衡")
     
-    def run(self):
-        """运行批量生成"""
+    def _all_classes_full(self):
+        # 蓄水池模式需要扫描全部股票，不提前结束
+        if self.sampling == 'reservoir':
+            return False
+        return all(len(samples) >= self.max_samples_per_class for samples in self.data_by_trend.values())
+    
+    def _print_progress(self, idx, total, stock_code):
+        # 每100只股票打印一次进度
+        if idx % 100 == 0 or idx == 1:
+            samples = self.reservoirs if self.sampling == 'reservoir' else self.data_by_trend
+            print(f"\n[{idx}/{total}] 处理 {stock_code}...")
+            print(f"  当前进度: 上涨{len(samples['up_trend'])} "
+                  f"下跌{len(samples['down_trend'])} "
+                  f"横盘{len(samples['sideways'])}")
+    
+    def _scan(self, stock_list, variants, workers):
+        """
+        遍历股票列表，每只股票只读取一次K线，分别并入各个生成器（variants）
+        
+        workers > 1 时子进程各自持有数据库会话/本地K线库读取器并计算候选样本，
+        父进程按股票列表顺序依次合并（imap 保序），样本上限规则与单进程完全一致
+        """
+        configs = [(v.future_days, v.up_threshold, v.down_threshold) for v in variants]
+        
+        pool = None
+        if workers > 1:
+            # spawn: 子进程不继承父进程的数据库连接
+            ctx = multiprocessing.get_context('spawn')
+            chunksize = max(1, min(16, len(stock_list) // (workers * 8)))
+            pool = ctx.Pool(workers, initializer=_init_label_worker, initargs=(self.worker_config(), configs))
+            results = pool.imap(_label_stock_worker, stock_list, chunksize=chunksize)
+        else:
+            results = (_label_stock_configs(self, stock_code, configs) for stock_code in stock_list)
+        
+        try:
+            for idx, (stock_code, labeled_list, error) in enumerate(results, 1):
+                # 检查是否已经收集够了样本
+                if all(v._all_classes_full() for v in variants):
+                    print(f"\n✅ 所有类别已收集足够样本，提前结束")
+                    break
+                
+                variants[0]._print_progress(idx, len(stock_list), stock_code)
+                
+                if error is not None:
+                    print(f"  ❌ 处理失败: {error}")
+                    continue
+                
+                # 已满的生成器不再合并（与单独运行时提前结束的行为一致）
+                for variant, labeled in zip(variants, labeled_list):
+                    if not variant._all_classes_full():
+                        variant.merge_stock_labels(stock_code, labeled)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    
+    def run(self, workers=1):
+        """
+        运行批量生成
+        
+        参数:
+            workers: 并行进程数（>1 时按股票分片到进程池，父进程按股票列表顺序合并，结果与单进程一致）
+        """
+        self._run_variants([self], workers)
+    
+    def run_sweep(self, horizons, thresholds, workers=1):
+        """
+        多周期、多阈值扫描：每只股票只读取一次K线，为每个 (观察周期, 阈值) 组合生成独立的数据集
+        
+        输出目录: ai_training_data/{period}_kline_training_{N}d_{阈值}pct/
+        
+        参数:
+            horizons: 观察周期列表，如 [3, 5, 10, 15]
+            thresholds: 涨跌阈值（绝对值）列表，如 [0.03, 0.05, 0.08]
+            workers: 并行进程数
+        """
+        variants = [self.with_config(future_days, threshold, -threshold)
+                    for future_days in horizons for threshold in thresholds]
+        self._run_variants(variants, workers)
+    
+    def _run_variants(self, variants, workers):
+        """运行一个或多个生成器配置（共享股票列表和K线读取）"""
         print("=" * 70)
         print("自动标签生成器 - AI训练数据批量生成")
         print("=" * 70)
         print(f"\n⚙️ 参数配置:")
         print(f"  K线周期: {self.period}")
         print(f"  时间范围: {self.start_date} ~ {self.end_date}")
-        print(f"  未来天数: {self.future_days} 天")
-        print(f"  上涨阈值: {self.up_threshold*100:+.1f}%")
-        print(f"  下跌阈值: {self.down_threshold*100:+.1f}%")
+        if len(variants) == 1:
+            print(f"  未来天数: {self.future_days} 天")
+            print(f"  上涨阈值: {self.up_threshold*100:+.1f}%")
+            print(f"  下跌阈值: {self.down_threshold*100:+.1f}%")
+        else:
+            print(f"  参数组合: {len(variants)} 个")
+            for variant in variants:
+                print(f"    - {variant.future_days} 天 ±{variant.up_threshold*100:.1f}% → {variant.output_dir}")
         print(f"  每类样本数: {self.max_samples_per_class}")
+        print(f"  采样方式: {self.sampling}")
+        print(f"  并行进程数: {workers}")
         
         # 获取所有股票列表
         print("\n正在获取股票列表...")
@@ -788,31 +1324,59 @@ class AutoLabelGenerator:
         
         # 遍历每只股票
         print("\n开始批量生成标签...")
-        for idx, stock_code in enumerate(stock_list, 1):
-            # 检查是否已经收集够了样本
-            if all(len(samples) >= self.max_samples_per_class for samples in self.data_by_trend.values()):
-                print(f"\n✅ 所有类别已收集足够样本，提前结束")
-                break
+        self._scan(stock_list, variants, workers)
+        
+        for variant in variants:
+            if variant.sampling == 'reservoir':
+                variant.finalize_reservoirs()
             
-            # 每100只股票打印一次进度
-            if idx % 100 == 0 or idx == 1:
-                print(f"\n[{idx}/{len(stock_list)}] 处理 {stock_code}...")
-                print(f"  当前进度: 上涨{len(self.data_by_trend['up_trend'])} "
-                      f"下跌{len(self.data_by_trend['down_trend'])} "
-                      f"横盘{len(self.data_by_trend['sideways'])}")
+            # 保存到JSON文件
+            variant.save_to_json(variant.output_dir)
             
-            # 生成该股票的标签
-            count = self.generate_for_stock(stock_code)
-        
-        # 保存到JSON文件
-        self.save_to_json()
-        
-        # 打印统计信息
-        self.print_stats()
+            # 打印统计信息
+            if len(variants) > 1:
+                print(f"\n📁 {variant.future_days} 天 ±{variant.up_threshold*100:.1f}%")
+            variant.print_stats()
         
         # 关闭数据库连接
-        self.db.close()
-        print("\n✅ 数据库连接已关闭")
+        if self.db is not None:
+            self.close()
+            print("\n✅ 数据库连接已关闭")
+
+
+# 子进程中的生成器（由 _init_label_worker 创建）
+_worker_generator = None
+
+
+_worker_configs = None
+
+
+def _init_label_worker(config, configs):
+    """进程池初始化：每个子进程创建自己的生成器（独立数据库会话或本地K线库读取器）"""
+    global _worker_generator, _worker_configs
+    
+    _worker_configs = configs
+    
+    config = dict(config)
+    bar_store = config.pop('bar_store')
+    if bar_store is not None:
+        store_cls, root = bar_store
+        bar_store = store_cls(root)
+    
+    _worker_generator = AutoLabelGenerator(bar_store=bar_store, verbose=False, **config)
+
+
+def _label_stock_configs(generator, stock_code, configs):
+    """计算一只股票在各组参数下的候选样本：返回 (股票代码, 候选样本列表, 错误信息)"""
+    try:
+        return stock_code, generator.label_stock_configs(stock_code, configs), None
+    except Exception as e:
+        return stock_code, None, str(e)[:50]
+
+
+def _label_stock_worker(stock_code):
+    """子进程任务"""
+    return _label_stock_configs(_worker_generator, stock_code, _worker_configs)
 
 
 def main():
@@ -826,13 +1390,13 @@ def main():
                         help='训练数据起始日期 (默认: 2020-01-01)')
     parser.add_argument('--end', type=str, default='2024-10-31',
                         help='训练数据结束日期 (默认: 2024-10-31)')
-    parser.add_argument('--future-days', type=int, default=5,
-                        help='未来观察天数 (默认: 5)')
+    parser.add_argument('--future-days', type=int, nargs='+', default=[5],
+                        help='未来观察天数，可指定多个进行扫描，如 3 5 10 15 (默认: 5)')
     
     # 🔥🔥🔥 核心参数：阈值（直接决定回测结果）🔥🔥🔥
-    parser.add_argument('--threshold', type=float, default=THRESHOLD_UP,  # ✅ 使用全局常量
+    parser.add_argument('--threshold', type=float, nargs='+', default=[THRESHOLD_UP],  # ✅ 使用全局常量
                         help='''
-涨跌阈值（绝对值） (默认: 0.03即3%%)
+涨跌阈值（绝对值），可指定多个进行扫描，如 0.03 0.05 0.08 (默认: 0.03即3%%)
 
 ⚠️  这个参数直接影响真实回测的金融指标！
 
@@ -841,14 +1405,14 @@ def main():
    - 决定回测时的实际收益率范围
 
 🎯 示例：
-   --threshold 0.03  → 涨跌幅>3%  （标准宽松，样本多）
-   --threshold 0.05  → 涨跌幅>5%  （中等标准）
-   --threshold 0.08  → 涨跌幅>8%  （标准严格）
-   --threshold 0.10  → 涨跌幅>10% （只选强势股）
+   --threshold 0.03  → 涨跌幅>3%%  （标准宽松，样本多）
+   --threshold 0.05  → 涨跌幅>5%%  （中等标准）
+   --threshold 0.08  → 涨跌幅>8%%  （标准严格）
+   --threshold 0.10  → 涨跌幅>10%% （只选强势股）
 
 📊 回测影响：
-   阈值低 → 样本多，但回测收益率较低 (3%-10%)
-   阈值高 → 样本少，但回测收益率较高 (10%+)
+   阈值低 → 样本多，但回测收益率较低 (3%%-10%%)
+   阈值高 → 样本少，但回测收益率较高 (10%%+)
    
 ⚡ 回测指标会受影响：
    - Sharpe Ratio (夏普比率)
@@ -861,6 +1425,16 @@ def main():
                         help='下跌样本数量 (默认: 2000)')
     parser.add_argument('--sideways', type=int, default=2000,
                         help='横盘样本数量 (默认: 2000)')
+    parser.add_argument('--bar-store', type=str, default=None,
+                        help='本地K线库目录（指定后从本地库读取K线，不连接数据库）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行进程数 (默认: 1，建议不超过CPU核数)')
+    parser.add_argument('--sampling', type=str, default='greedy', choices=SAMPLING_MODES,
+                        help='采样方式: greedy=按股票顺序收集满即停止, reservoir=全市场单遍均匀采样 (默认: greedy)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='蓄水池采样随机种子 (默认: 42)')
+    parser.add_argument('--format', type=str, default='jsonl', choices=OUTPUT_FORMATS,
+                        help='输出格式: jsonl=按(股票,日期)保存多样本, json=旧格式每股票一个样本 (默认: jsonl)')
     
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     # 📊 样本数量选择指南（基于统计学和实践经验）
@@ -910,18 +1484,34 @@ def main():
     # 取三个类别中的最大值作为每类样本数
     max_samples = max(args.up, args.down, args.sideways)
     
-    # 创建生成器并运行
+    # 本地K线库（可选）
+    bar_store = None
+    if args.bar_store:
+        from src.ai_training.bar_store import MemmapBarStore
+        bar_store = MemmapBarStore(args.bar_store)
+    
+    # 多个观察周期/阈值：单遍扫描，每个组合输出一个数据集
+    sweep = len(args.future_days) > 1 or len(args.threshold) > 1
+    
+    # 创建生成器并运行（扫描时按最长观察周期截断 end_date）
     generator = AutoLabelGenerator(
         period=args.period,
         start_date=args.start,
         end_date=args.end,
-        future_days=args.future_days,
-        up_threshold=args.threshold,
-        down_threshold=-args.threshold,
-        max_samples_per_class=max_samples
+        future_days=max(args.future_days),
+        up_threshold=args.threshold[0],
+        down_threshold=-args.threshold[0],
+        max_samples_per_class=max_samples,
+        bar_store=bar_store,
+        sampling=args.sampling,
+        random_seed=args.seed,
+        output_format=args.format
     )
     
-    generator.run()
+    if sweep:
+        generator.run_sweep(args.future_days, args.threshold, workers=args.workers)
+    else:
+        generator.run(workers=args.workers)
 
 
 if __name__ == '__main__':
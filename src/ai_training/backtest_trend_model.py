@@ -112,18 +112,27 @@ import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import argparse
+import importlib.util
 import warnings
 
-# ✅ 导入成熟的量化回测库
-try:
-    import quantstats as qs
-    HAS_QUANTSTATS = True
-    # 扩展QuantStats模式（显示更多指标）
-    qs.extend_pandas()
-except ImportError:
-    HAS_QUANTSTATS = False
+# ✅ 成熟的量化回测库（只检查是否安装，首次计算指标时才导入，见 _quantstats）
+HAS_QUANTSTATS = importlib.util.find_spec('quantstats') is not None
+if not HAS_QUANTSTATS:
     warnings.warn("QuantStats未安装，将使用简化版回测。建议安装: pip install quantstats")
 
+_qs = None
+
+
+def _quantstats():
+    """导入 QuantStats（首次调用时导入并扩展 pandas）"""
+    global _qs
+    if _qs is None:
+        import quantstats as qs
+        # 扩展QuantStats模式（显示更多指标）
+        qs.extend_pandas()
+        _qs = qs
+    return _qs
+
 # 导入模型加载模块
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
@@ -177,6 +186,8 @@ class FinancialBacktest:
         if not HAS_QUANTSTATS:
             return self._calculate_metrics_fallback(returns_series.values)
         
+        qs = _quantstats()
+        
         # ✅ 使用 QuantStats 一次性计算所有指标
         metrics = {}
         
@@ -385,7 +396,7 @@ class FinancialBacktest:
             print(f"\n📊 生成 HTML 报告...")
             
             # ✅ 一行代码生成完整报告
-            qs.reports.html(
+            _quantstats().reports.html(
                 returns_series,
                 output=str(report_path),
                 title='📈 趋势预测模型回测报告',
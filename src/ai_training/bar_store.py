@@ -0,0 +1,595 @@
+"""
+本地K线库（数据库K线表的离线镜像）
+职责: 将数据库中的K线表同步为本地 Arrow IPC 文件，训练/标签生成时替代数据库读取
+功能:
+    1. 每个周期一个数据集目录，按股票代码分区: {root}/{period}/stock_code={code}/part-*.arrow
+    2. 增量同步: 只追加比本地高水位（最后一根K线日期）更新的K线
+    3. 读取器: 内存映射读取，返回 KlineWindow，可作为 StockImageAnalyzer / AutoLabelGenerator 的数据源
+    4. 指数日线同步到 {root}/index_day/index_code={code}/
+    5. MemmapBarStore: 每个周期一个连续记录文件 + 偏移索引，窗口读取为零拷贝视图，多进程共享页缓存
+
+目录结构:
+    bar_store/
+      ├── day/
+      │   ├── _mmap/                       # build-mmap 生成: bars.dat + offsets.json + meta.json
+      │   ├── _manifest.json               # 各股票高水位 {"600000": "2024-10-31", ...}
+      │   ├── stock_code=600000/
+      │   │   ├── part-20200102-20241031.arrow
+      │   │   └── part-20241101-20241129.arrow   # 增量同步追加的新分片
+      │   └── ...
+      ├── 5min/ ...
+      └── index_day/ ...
+
+使用方法:
+    # 全量/增量同步日线和指数（需要数据库）
+    python src/ai_training/bar_store.py sync --root ./bar_store --period day --index
+
+    # 合并分片（可选，减少文件数）
+    python src/ai_training/bar_store.py compact --root ./bar_store --period day
+
+    # 生成内存映射文件（同步后执行，多进程训练共享）
+    python src/ai_training/bar_store.py build-mmap --root ./bar_store --period day index_day
+
+    # 训练时使用本地K线库（无需数据库）
+    from src.ai_training.bar_store import MemmapBarStore
+    analyzer = StockImageAnalyzer(enable_database=False, bar_store=MemmapBarStore('./bar_store'))
+"""
+from abc import ABC, abstractmethod
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ai_training.kline_window import KlineWindow, kline_dtype, format_kline_date
+from src.ai_training.kline_data_loader import DATE_FIELD_MAP, MARKET_INDEX_CODES, get_kline_model, kline_columns
+
+
+# 指数日线在本地库中的周期名
+INDEX_PERIOD = 'index_day'
+
+# 周期别名（买卖点使用小时线）
+PERIOD_ALIASES = {
+    'bs': '1hour',
+}
+
+# 同步时流式读取的批大小
+SYNC_YIELD_PER = 50000
+
+
+class BarReader(ABC):
+    """本地K线读取接口
+
+    子类实现 _load_bars()/list_stock_codes()，窗口查询通过二分查找 + 切片完成，不访问数据库。
+    StockImageAnalyzer / AutoLabelGenerator 只依赖本类的方法。
+    """
+
+    root: Path
+
+    @staticmethod
+    def date_field(period: str) -> str:
+        """周期对应的日期字段名"""
+        period = PERIOD_ALIASES.get(period, period)
+        return 'trade_date' if period == INDEX_PERIOD else DATE_FIELD_MAP[period]
+
+    @abstractmethod
+    def list_stock_codes(self, period: str) -> List[str]:
+        """本地库中该周期的全部股票代码"""
+
+    @abstractmethod
+    def _load_bars(self, period: str, code: str) -> KlineWindow:
+        """读取某只股票的全部K线（时间正序）"""
+
+    def read_bars(self, period: str, code: str, start=None, end=None) -> KlineWindow:
+        """
+        读取某只股票的K线
+
+        参数:
+            period: 周期
+            code: 股票代码（指数周期为指数代码）
+            start, end: 可选的日期范围（含两端）
+
+        返回:
+            KlineWindow: 时间正序的K线（不存在时为空窗口）
+        """
+        window = self._load_bars(PERIOD_ALIASES.get(period, period), code)
+
+        if start is not None or end is not None:
+            dates = window.dates
+            lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start).astype(dates.dtype), side='left'))
+            hi = len(window) if end is None else int(np.searchsorted(dates, np.datetime64(end).astype(dates.dtype), side='right'))
+            window = window[lo:hi]
+
+        return window
+
+    def read_index(self, index_code: str) -> KlineWindow:
+        """读取指数的全部日线"""
+        return self.read_bars(INDEX_PERIOD, index_code)
+
+    def history(self, period: str, code: str, date_value, count: int = 120) -> KlineWindow:
+        """截止到 date_value（含）的最近 count 根K线（可能不足 count 根）"""
+        window = self.read_bars(period, code)
+        dates = window.dates
+        pos = int(np.searchsorted(dates, np.datetime64(date_value).astype(dates.dtype), side='right'))
+        return window[max(0, pos - count):pos]
+
+    def future(self, period: str, code: str, date_value, count: int = 5) -> KlineWindow:
+        """date_value 之后的 count 根K线"""
+        window = self.read_bars(period, code)
+        dates = window.dates
+        pos = int(np.searchsorted(dates, np.datetime64(date_value).astype(dates.dtype), side='right'))
+        return window[pos:pos + count]
+
+    def fetch_windows(self, period: str, samples: List[Tuple[str, object]],
+                      history_count: int = 120, future_count: int = 5) -> Dict[Tuple[str, object], Tuple[KlineWindow, KlineWindow]]:
+        """
+        批量获取样本的历史/未来K线窗口（与 StockImageAnalyzer._fetch_windows_batched 返回格式一致）
+        """
+        windows = {}
+        for stock_code, date_value in samples:
+            windows[(stock_code, date_value)] = (
+                self.history(period, stock_code, date_value, history_count),
+                self.future(period, stock_code, date_value, future_count),
+            )
+        return windows
+
+
+class BarStore(BarReader):
+    """本地K线库（Arrow IPC 分片）
+
+    读取时按股票内存映射加载全部分片并缓存为 KlineWindow（时间正序）。
+    """
+
+    def __init__(self, root: str, cache_size: int = 512):
+        """
+        参数:
+            root: 本地K线库根目录
+            cache_size: 每个周期最多缓存的股票数（超出后按加载顺序淘汰）
+        """
+        if not HAS_PYARROW:
+            raise ImportError("本地K线库需要 pyarrow，请安装: pip install pyarrow")
+        self.root = Path(root)
+        self.cache_size = cache_size
+        self._cache: Dict[str, Dict[str, KlineWindow]] = {}
+        self._manifests: Dict[str, Dict[str, str]] = {}
+
+    # ------------------------------------------------------------------
+    # 路径与元数据
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _partition_key(period: str) -> str:
+        """分区字段名（股票/指数）"""
+        return 'index_code' if period == INDEX_PERIOD else 'stock_code'
+
+    def _period_dir(self, period: str) -> Path:
+        return self.root / period
+
+    def _partition_dir(self, period: str, code: str) -> Path:
+        return self._period_dir(period) / f"{self._partition_key(period)}={code}"
+
+    def _manifest_path(self, period: str) -> Path:
+        return self._period_dir(period) / '_manifest.json'
+
+    def get_manifest(self, period: str) -> Dict[str, str]:
+        """获取周期的高水位清单 {代码: 最后一根K线日期}"""
+        if period not in self._manifests:
+            path = self._manifest_path(period)
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._manifests[period] = json.load(f)
+            else:
+                self._manifests[period] = {}
+        return self._manifests[period]
+
+    def _save_manifest(self, period: str):
+        path = self._manifest_path(period)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.get_manifest(period), f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def high_water_mark(self, period: str, code: str) -> Optional[str]:
+        """某只股票/指数在本地库中的最后一根K线日期"""
+        return self.get_manifest(period).get(code)
+
+    def high_water_value(self, period: str, code: str):
+        """高水位转换为 date/datetime 对象（用于数据库查询条件），不存在时返回 None"""
+        hwm = self.high_water_mark(period, code)
+        return None if hwm is None else np.datetime64(hwm).astype(object)
+
+    def list_stock_codes(self, period: str) -> List[str]:
+        """本地库中该周期的全部股票代码"""
+        return sorted(self.get_manifest(period).keys())
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def _write_part(self, period: str, code: str, window: KlineWindow) -> Path:
+        """将新K线写入一个分片文件，返回分片路径"""
+        part_dir = self._partition_dir(period, code)
+        part_dir.mkdir(parents=True, exist_ok=True)
+
+        first = format_kline_date(window.dates[0]).replace('-', '').replace(':', '').replace(' ', 'T')
+        last = format_kline_date(window.dates[-1]).replace('-', '').replace(':', '').replace(' ', 'T')
+        path = part_dir / f"part-{first}-{last}.arrow"
+
+        table = pa.table({name: window[name] for name in window.dtype.names})
+        tmp_path = path.with_suffix('.tmp')
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        self.get_manifest(period)[code] = format_kline_date(window.dates[-1])
+        self._cache.get(period, {}).pop(code, None)
+        return path
+
+    def append(self, period: str, code: str, window: KlineWindow) -> int:
+        """
+        追加K线（只保留比高水位新的部分）
+
+        返回:
+            实际追加的K线数量
+        """
+        hwm = self.high_water_mark(period, code)
+        if hwm is not None and len(window) > 0:
+            window = window[window.dates > np.datetime64(hwm).astype(window.dates.dtype)]
+        if len(window) == 0:
+            return 0
+        self._write_part(period, code, window)
+        return len(window)
+
+    def sync(self, period: str, db, stock_codes: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        从数据库增量同步一个周期的K线
+
+        规则:
+            - 本地已有的股票: 按高水位分组，每组一条流式查询
+              (stock_code IN (...) AND 日期 > 该组高水位)，只读取各自高水位之后的K线
+            - 本地没有的新股票: 一条流式查询读取全部历史
+            每只有新数据的股票追加一个分片；清单在同步结束时保存，
+            中途中断时重新同步写入的重复K线在读取时按日期去重
+
+        参数:
+            period: 周期 (day/week/1hour/30min/15min/5min)
+            db: 数据库会话
+            stock_codes: 只同步这些股票（默认全部）
+
+        返回:
+            dict: {'stocks': 有新数据的股票数, 'bars': 新增K线数}
+        """
+        from sqlalchemy import select
+
+        KlineModel = get_kline_model(period)
+        if KlineModel is None:
+            raise ValueError(f"不支持的周期: {period}")
+        date_field = DATE_FIELD_MAP[period]
+        date_column = getattr(KlineModel, date_field)
+
+        if stock_codes is None:
+            stock_codes = [row[0] for row in db.execute(select(KlineModel.stock_code).distinct()).all()]
+        stock_codes = set(stock_codes)
+
+        manifest = self.get_manifest(period)
+        known_codes = {code for code in stock_codes if code in manifest}
+        new_codes = stock_codes - known_codes
+
+        base_stmt = select(KlineModel.stock_code, *kline_columns(KlineModel, date_field))
+        statements = []
+        codes_by_hwm: Dict[str, List[str]] = {}
+        for code in sorted(known_codes):
+            codes_by_hwm.setdefault(manifest[code], []).append(code)
+        for hwm, codes in sorted(codes_by_hwm.items()):
+            hwm_value = np.datetime64(hwm).astype(object)
+            statements.append((
+                base_stmt.where(KlineModel.stock_code.in_(codes), date_column > hwm_value),
+                set(codes),
+            ))
+        if new_codes:
+            statements.append((base_stmt.where(KlineModel.stock_code.in_(sorted(new_codes))), new_codes))
+
+        stats = {'stocks': 0, 'bars': 0}
+        for stmt, codes in statements:
+            stmt = stmt.order_by(KlineModel.stock_code, date_column)
+            result = db.execute(stmt.execution_options(yield_per=SYNC_YIELD_PER))
+
+            for code, rows in groupby(result, key=lambda row: row[0]):
+                if code not in codes:
+                    continue
+                window = KlineWindow.from_rows((row[1:] for row in rows), date_field)
+                added = self.append(period, code, window)
+                if added:
+                    stats['stocks'] += 1
+                    stats['bars'] += added
+
+        self._save_manifest(period)
+        return stats
+
+    def sync_index(self, db, index_codes: Iterable[str] = MARKET_INDEX_CODES) -> Dict[str, int]:
+        """从数据库增量同步指数日线"""
+        from sqlalchemy import select
+        from database.models.index_kline_day import IndexKlineDay
+
+        stats = {'stocks': 0, 'bars': 0}
+        for index_code in index_codes:
+            stmt = select(*kline_columns(IndexKlineDay, 'trade_date')).where(
+                IndexKlineDay.index_code == index_code
+            )
+            hwm = self.high_water_value(INDEX_PERIOD, index_code)
+            if hwm is not None:
+                stmt = stmt.where(IndexKlineDay.trade_date > hwm)
+            rows = db.execute(stmt.order_by(IndexKlineDay.trade_date)).all()
+
+            added = self.append(INDEX_PERIOD, index_code, KlineWindow.from_rows(rows, 'trade_date'))
+            if added:
+                stats['stocks'] += 1
+                stats['bars'] += added
+
+        self._save_manifest(INDEX_PERIOD)
+        return stats
+
+    def compact(self, period: str) -> int:
+        """
+        合并每只股票的所有分片为一个文件（先写入合并后的分片，再删除旧分片，中断时不丢数据）
+
+        返回:
+            被合并的股票数
+        """
+        compacted = 0
+        for code in self.list_stock_codes(period):
+            parts = sorted(self._partition_dir(period, code).glob('part-*.arrow'))
+            if len(parts) <= 1:
+                continue
+            window = self.read_bars(period, code)
+            merged = self._write_part(period, code, window)
+            for part in parts:
+                if part != merged:
+                    part.unlink()
+            self._cache.get(period, {}).pop(code, None)
+            compacted += 1
+        return compacted
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def _load_bars(self, period: str, code: str) -> KlineWindow:
+        """
+        读取某只股票的全部K线（内存映射读取所有分片，按股票缓存）
+
+        同步中断（分片已写入、清单未保存）后重新同步、或合并中断时，分片之间会有重复日期，
+        这里按日期排序去重，保留文件名排序靠后的分片中的K线
+        """
+        period_cache = self._cache.setdefault(period, {})
+        window = period_cache.get(code)
+
+        if window is None:
+            date_field = self.date_field(period)
+            tables = []
+            for part in sorted(self._partition_dir(period, code).glob('part-*.arrow')):
+                with pa.memory_map(str(part), 'r') as source:
+                    tables.append(pa.ipc.open_file(source).read_all())
+
+            if tables:
+                table = pa.concat_tables(tables)
+                window = np.empty(table.num_rows, dtype=kline_dtype(date_field)).view(KlineWindow)
+                for name in window.dtype.names:
+                    window[name] = table.column(name).to_numpy()
+                window = self._dedupe_dates(window)
+            else:
+                window = KlineWindow.empty(date_field)
+
+            if len(period_cache) >= self.cache_size:
+                period_cache.pop(next(iter(period_cache)))
+            period_cache[code] = window
+
+        return window
+
+
+    @staticmethod
+    def _dedupe_dates(window: KlineWindow) -> KlineWindow:
+        """按日期排序并去掉重复日期（保留最后出现的一根），日期严格递增时原样返回"""
+        dates = window.dates
+        if len(window) < 2 or bool(np.all(dates[1:] > dates[:-1])):
+            return window
+        window = window[np.argsort(dates, kind='stable')]
+        dates = window.dates
+        keep = np.append(dates[1:] != dates[:-1], True)
+        return window[keep]
+
+
+class MemmapBarStore(BarReader):
+    """本地K线库的内存映射读取端
+
+    build() 将一个周期的全部K线按 (股票, 日期) 顺序写成一个连续的记录文件，
+    读取时 np.memmap 打开整个文件，按偏移索引直接返回 KlineWindow 视图:
+    没有复制、没有反序列化，同一节点上的多个训练进程共享页缓存。
+
+    目录结构:
+        {root}/{period}/_mmap/bars.dat      # kline_dtype 记录，按 (股票, 日期) 排序
+        {root}/{period}/_mmap/offsets.json  # {"600000": [start, stop], ...}
+        {root}/{period}/_mmap/meta.json     # 日期字段、行数、构建时的高水位
+
+    尚未 build 的周期自动回退到 Arrow 分片读取（需要 pyarrow）。
+    """
+
+    def __init__(self, root: str):
+        """
+        参数:
+            root: 本地K线库根目录（与 BarStore 相同）
+        """
+        self.root = Path(root)
+        self._arrays: Dict[str, Optional[KlineWindow]] = {}
+        self._offsets: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._fallback: Optional[BarStore] = None
+
+    def _mmap_dir(self, period: str) -> Path:
+        return self.root / period / '_mmap'
+
+    def build(self, period: str, source: Optional['BarStore'] = None) -> int:
+        """
+        由 Arrow 分片生成内存映射文件（整体重写，同步新数据后需重新 build）
+
+        参数:
+            period: 周期
+            source: 源 BarStore（默认使用同一根目录）
+
+        返回:
+            int: 写入的K线总数
+        """
+        period = PERIOD_ALIASES.get(period, period)
+        source = source or BarStore(str(self.root))
+        mmap_dir = self._mmap_dir(period)
+        mmap_dir.mkdir(parents=True, exist_ok=True)
+
+        offsets = {}
+        rows = 0
+        tmp_path = mmap_dir / 'bars.dat.tmp'
+        with open(tmp_path, 'wb') as f:
+            for code in source.list_stock_codes(period):
+                window = source.read_bars(period, code)
+                if len(window) == 0:
+                    continue
+                f.write(np.ascontiguousarray(window).tobytes())
+                offsets[code] = [rows, rows + len(window)]
+                rows += len(window)
+                # 逐只写出后释放缓存，避免整周期数据同时驻留内存
+                source._cache.get(period, {}).pop(code, None)
+        os.replace(tmp_path, mmap_dir / 'bars.dat')
+
+        for name, payload in (
+            ('offsets.json', offsets),
+            ('meta.json', {
+                'date_field': self.date_field(period),
+                'rows': rows,
+                'manifest': source.get_manifest(period),
+            }),
+        ):
+            tmp_path = mmap_dir / f'{name}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, mmap_dir / name)
+
+        # 已打开的旧映射作废
+        self._arrays.pop(period, None)
+        self._offsets.pop(period, None)
+        return rows
+
+    def _open(self, period: str) -> Optional[KlineWindow]:
+        """打开（并缓存）周期的内存映射数组，未 build 时返回 None"""
+        if period in self._arrays:
+            return self._arrays[period]
+
+        mmap_dir = self._mmap_dir(period)
+        array = None
+        if (mmap_dir / 'meta.json').exists():
+            with open(mmap_dir / 'meta.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(mmap_dir / 'offsets.json', 'r', encoding='utf-8') as f:
+                self._offsets[period] = {code: tuple(span) for code, span in json.load(f).items()}
+
+            dtype = kline_dtype(meta['date_field'])
+            if meta['rows'] > 0:
+                array = np.memmap(mmap_dir / 'bars.dat', dtype=dtype, mode='r', shape=(meta['rows'],)).view(KlineWindow)
+            else:
+                array = np.empty(0, dtype=dtype).view(KlineWindow)
+
+            manifest_path = self.root / period / '_manifest.json'
+            if manifest_path.exists():
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    if json.load(f) != meta.get('manifest'):
+                        print(f"⚠️  {period} 内存映射文件早于最近一次同步，请重新运行 build-mmap")
+
+        self._arrays[period] = array
+        return array
+
+    def _get_fallback(self) -> 'BarStore':
+        if self._fallback is None:
+            self._fallback = BarStore(str(self.root))
+        return self._fallback
+
+    def list_stock_codes(self, period: str) -> List[str]:
+        period = PERIOD_ALIASES.get(period, period)
+        if self._open(period) is None:
+            return self._get_fallback().list_stock_codes(period)
+        return sorted(self._offsets[period])
+
+    def _load_bars(self, period: str, code: str) -> KlineWindow:
+        """偏移索引查找 + 切片视图"""
+        array = self._open(period)
+        if array is None:
+            return self._get_fallback()._load_bars(period, code)
+
+        span = self._offsets[period].get(code)
+        if span is None:
+            return KlineWindow.empty(self.date_field(period))
+        return array[span[0]:span[1]]
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='本地K线库（数据库K线表的离线镜像）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser('sync', help='从数据库增量同步')
+    sync_parser.add_argument('--root', type=str, default='./bar_store', help='本地K线库目录 (默认: ./bar_store)')
+    sync_parser.add_argument('--period', type=str, nargs='*', default=['day'],
+                             choices=['day', 'week', '1hour', '30min', '15min', '5min'],
+                             help='要同步的K线周期 (默认: day)')
+    sync_parser.add_argument('--index', action='store_true', help='同时同步5个板块指数日线')
+
+    compact_parser = subparsers.add_parser('compact', help='合并增量分片')
+    compact_parser.add_argument('--root', type=str, default='./bar_store', help='本地K线库目录 (默认: ./bar_store)')
+    compact_parser.add_argument('--period', type=str, nargs='*', default=['day'], help='要合并的周期 (默认: day)')
+
+    mmap_parser = subparsers.add_parser('build-mmap', help='生成内存映射读取文件')
+    mmap_parser.add_argument('--root', type=str, default='./bar_store', help='本地K线库目录 (默认: ./bar_store)')
+    mmap_parser.add_argument('--period', type=str, nargs='*', default=['day', INDEX_PERIOD],
+                             help=f'要生成的周期 (默认: day {INDEX_PERIOD})')
+
+    args = parser.parse_args()
+    store = BarStore(args.root)
+
+    if args.command == 'sync':
+        from src.ai_training.db_session import session_scope
+
+        with session_scope() as db:
+            for period in args.period:
+                print(f"\n正在同步 {period} ...")
+                stats = store.sync(period, db)
+                print(f"✅ {period}: {stats['stocks']} 只股票, 新增 {stats['bars']} 根K线")
+
+            if args.index:
+                print("\n正在同步指数日线 ...")
+                stats = store.sync_index(db)
+                print(f"✅ 指数: {stats['stocks']} 个, 新增 {stats['bars']} 根K线")
+
+    elif args.command == 'compact':
+        for period in args.period:
+            count = store.compact(period)
+            print(f"✅ {period}: 合并 {count} 只股票的分片")
+
+    elif args.command == 'build-mmap':
+        mmap_store = MemmapBarStore(args.root)
+        for period in args.period:
+            rows = mmap_store.build(period, store)
+            print(f"✅ {period}: 写入 {rows} 根K线")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+批量特征计算（向量化）
+职责: 对 [N, 120, 5] 的K线张量一次性计算技术指标，为逐样本的 extract_features_sequence_from_kline_data
+      提供向量化实现的基础
+功能:
+    1. stack_bars / stack_index_bars: 将 KlineWindow 列表整理为 [N, 120, 5] / [N, 5, 120, 5] 张量
+    2. 向量化指标原语（沿时间轴，对整批样本同时计算）:
+       均线（累积和）/标准差（两遍计算）、EMA/MACD（NaN 处理与 pandas 一致）、成交量比、涨跌幅、相对指数收益、滚动最高/最低（步长窗口）
+    3. 批量特征注册表: 为 FEATURE_NAMES 中的每个特征注册一个批量实现
+       extract_features_batch() 按 FEATURE_NAMES 顺序拼接输出 [N, 60, 特征数]，与逐样本函数的列顺序一致
+    4. compare_with_reference(): 与逐样本函数逐列对比，验证批量实现
+
+当前状态:
+    注册表为空（特征定义在 feature_extractor.py 中，批量实现需逐个对照移植并用 compare_with_reference 验证），
+    extract_features_batch() 在全部特征注册前会抛出 ValueError；数据管道和推理服务仍逐样本提取特征。
+    指标原语不依赖 feature_extractor，可单独使用
+
+使用方法:
+    from src.ai_training.batch_features import register_batch_feature, rolling_mean
+
+    @register_batch_feature('MA5_ratio')
+    def _ma5_ratio(bars, index_bars):
+        close = bars[..., CLOSE]
+        return close / rolling_mean(close, 5) - 1      # [N, 120]
+
+    if batch_coverage()[1] == []:                      # FEATURE_NAMES 全部有批量实现
+        features = extract_features_batch(stack_bars(windows), stack_index_bars(index_dicts))
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ai_training.kline_data_loader import MARKET_INDEX_CODES
+
+
+# 每个样本的历史K线数 / 输出的特征序列长度
+HISTORY_LENGTH = 120
+SEQUENCE_LENGTH = 60
+
+# [.., 5] 最后一维的列下标（与 KlineWindow.ohlcv() 一致）
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+
+# ============================================================================
+# 张量整理
+# ============================================================================
+
+def stack_bars(windows: Sequence, length: int = HISTORY_LENGTH) -> np.ndarray:
+    """
+    将K线窗口列表整理为 [N, length, 5] 的 float64 张量（取每个窗口最后 length 根，不足时左侧填 NaN）
+
+    参数:
+        windows: KlineWindow 列表
+    """
+    bars = np.full((len(windows), length, 5), np.nan)
+    for i, window in enumerate(windows):
+        if window is None or len(window) == 0:
+            continue
+        ohlcv = window[-length:].ohlcv()
+        bars[i, length - len(ohlcv):] = ohlcv
+    return bars
+
+
+def stack_index_bars(index_dicts: Sequence[Optional[Dict]], index_codes: Sequence[str] = MARKET_INDEX_CODES,
+                     length: int = HISTORY_LENGTH) -> np.ndarray:
+    """
+    将每个样本的指数K线字典整理为 [N, 指数数, length, 5] 的张量（缺失的指数为 NaN）
+
+    参数:
+        index_dicts: 每个样本的 market_index_klines（{指数代码: KlineWindow} 或 None）
+        index_codes: 指数顺序
+    """
+    index_bars = np.full((len(index_dicts), len(index_codes), length, 5), np.nan)
+    for k, code in enumerate(index_codes):
+        windows = [(d or {}).get(code) for d in index_dicts]
+        index_bars[:, k] = stack_bars(windows, length)
+    return index_bars
+
+
+# ============================================================================
+# 向量化指标原语（均沿最后一维计算，前面的维度为批次）
+# ============================================================================
+
+def _window_valid(x: np.ndarray, window: int) -> np.ndarray:
+    """每个完整窗口（末端位置 window-1 起）是否没有 NaN，形状 [..., T-window+1]"""
+    nan_count = np.cumsum(np.isnan(x), axis=-1)
+    in_window = nan_count[..., window - 1:].copy()
+    in_window[..., 1:] -= nan_count[..., :-window]
+    return in_window == 0
+
+
+def rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    滚动求和（累积和相减），与 pandas rolling(window).sum() 一致
+
+    窗口内有 NaN（stack_bars 左侧填充、停牌缺失）时该位置为 NaN，不影响之后的完整窗口；
+    累积和先把 NaN 置 0，否则一个 NaN 会让之后的累积和全部变成 NaN
+    """
+    out = np.full(x.shape, np.nan)
+    if window > x.shape[-1]:
+        return out
+    csum = np.cumsum(np.nan_to_num(x, nan=0.0), axis=-1)
+    sums = csum[..., window - 1:].copy()
+    sums[..., 1:] -= csum[..., :-window]
+    out[..., window - 1:] = np.where(_window_valid(x, window), sums, np.nan)
+    return out
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """简单移动平均"""
+    return rolling_sum(x, window) / window
+
+
+def rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    滚动标准差（总体标准差，ddof=0，与 pandas rolling(window).std(ddof=0) 一致）
+
+    两遍计算: 先求窗口均值，再求偏差平方的均值。E[x²]-E[x]² 在成交量量级（1e8）上相减抵消，
+    相对误差可达 1e-4
+    """
+    out = np.full(x.shape, np.nan)
+    if window > x.shape[-1]:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1)
+    mean = windows.mean(axis=-1, keepdims=True)
+    out[..., window - 1:] = np.sqrt(((windows - mean) ** 2).mean(axis=-1))
+    return out
+
+
+def rolling_max(x: np.ndarray, window: int) -> np.ndarray:
+    """滚动最高值（步长窗口视图，不复制数据）"""
+    out = np.full(x.shape, np.nan)
+    if window <= x.shape[-1]:
+        out[..., window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1).max(axis=-1)
+    return out
+
+
+def rolling_min(x: np.ndarray, window: int) -> np.ndarray:
+    """滚动最低值"""
+    out = np.full(x.shape, np.nan)
+    if window <= x.shape[-1]:
+        out[..., window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1).min(axis=-1)
+    return out
+
+
+def ema(x: np.ndarray, span: int) -> np.ndarray:
+    """
+    指数移动平均（alpha = 2/(span+1)，与 pandas ewm(span, adjust=False) 一致）
+
+    以每个序列第一个非 NaN 值为初值，之前的位置为 NaN；中间的 NaN 位置沿用上一个值，
+    并按 pandas（ignore_na=False）的方式继续衰减旧值的权重。
+    递推只沿时间轴循环 T 次，每次对整批样本同时计算
+    """
+    alpha = 2.0 / (span + 1)
+    out = np.empty(x.shape)
+    weighted = x[..., 0].astype(np.float64)
+    old_weight = np.ones(weighted.shape)
+    out[..., 0] = weighted
+    for t in range(1, x.shape[-1]):
+        current = x[..., t]
+        observed = ~np.isnan(current)
+        started = ~np.isnan(weighted)
+        old_weight = np.where(started, old_weight * (1 - alpha), old_weight)
+        update = started & observed
+        weighted = np.where(update, (old_weight * weighted + alpha * current) / (old_weight + alpha), weighted)
+        old_weight = np.where(update, 1.0, old_weight)
+        weighted = np.where(~started & observed, current, weighted)
+        out[..., t] = weighted
+    return out
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD: 返回 (DIF, DEA, MACD柱 = 2*(DIF-DEA))"""
+    dif = ema(close, fast) - ema(close, slow)
+    dea = ema(dif, signal)
+    return dif, dea, 2 * (dif - dea)
+
+
+def pct_change(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """涨跌幅（x[t] / x[t-periods] - 1），前 periods 个位置为 NaN"""
+    out = np.full(x.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[..., periods:] = x[..., periods:] / x[..., :-periods] - 1
+    return out
+
+
+def volume_ratio(volume: np.ndarray, window: int = 5) -> np.ndarray:
+    """量比：当根成交量 / 之前 window 根的平均成交量"""
+    prev_mean = np.full(volume.shape, np.nan)
+    prev_mean[..., 1:] = rolling_mean(volume, window)[..., :-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return volume / prev_mean
+
+
+def relative_return(close: np.ndarray, index_close: np.ndarray, periods: int = 5) -> np.ndarray:
+    """
+    相对指数收益：个股 periods 根涨跌幅 - 指数 periods 根涨跌幅
+
+    参数:
+        close: [N, T]
+        index_close: [N, T] 或 [N, K, T]（返回 [N, K, T]）
+    """
+    stock = pct_change(close, periods)
+    if index_close.ndim == close.ndim + 1:
+        stock = stock[:, None, :]
+    return stock - pct_change(index_close, periods)
+
+
+# ============================================================================
+# 批量特征注册表
+# ============================================================================
+
+# 特征名 → 批量实现（为空: 尚未移植任何特征，见模块说明） fn(bars[N,120,5], index_bars[N,K,120,5] 或 None) -> [N,120]
+BATCH_FEATURES: Dict[str, Callable[[np.ndarray, Optional[np.ndarray]], np.ndarray]] = {}
+
+
+def register_batch_feature(name: str):
+    """注册特征的批量实现（装饰器），name 必须与 FEATURE_NAMES 中的名称一致"""
+    def decorator(fn):
+        BATCH_FEATURES[name] = fn
+        return fn
+    return decorator
+
+
+def batch_coverage(feature_names: Sequence[str] = None) -> Tuple[List[str], List[str]]:
+    """
+    返回 (已有批量实现的特征, 缺少批量实现的特征)，均按 FEATURE_NAMES 顺序
+    """
+    if feature_names is None:
+        from src.ai_training.feature_extractor import FEATURE_NAMES
+        feature_names = FEATURE_NAMES
+    feature_names = list(feature_names)
+    covered = [name for name in feature_names if name in BATCH_FEATURES]
+    missing = [name for name in feature_names if name not in BATCH_FEATURES]
+    return covered, missing
+
+
+def extract_features_batch(bars: np.ndarray, index_bars: Optional[np.ndarray] = None,
+                           feature_names: Sequence[str] = None,
+                           sequence_length: int = SEQUENCE_LENGTH) -> np.ndarray:
+    """
+    批量提取特征
+
+    参数:
+        bars: [N, 120, 5] 个股K线（open, high, low, close, volume），时间正序
+        index_bars: [N, 指数数, 120, 5] 指数K线（顺序同 MARKET_INDEX_CODES），可为 None
+        feature_names: 要计算的特征（默认 FEATURE_NAMES，输出列顺序与之一致）
+        sequence_length: 输出序列长度（取最后 sequence_length 根）
+
+    返回:
+        [N, sequence_length, 特征数] float32
+
+    异常:
+        ValueError: 有特征缺少批量实现（用 batch_coverage() 查看）
+    """
+    if feature_names is None:
+        from src.ai_training.feature_extractor import FEATURE_NAMES
+        feature_names = FEATURE_NAMES
+    feature_names = list(feature_names)
+    _, missing = batch_coverage(feature_names)
+    if missing:
+        raise ValueError(f"{len(missing)} 个特征缺少批量实现: {missing[:5]}")
+
+    bars = np.asarray(bars, dtype=np.float64)
+    out = np.empty((len(bars), sequence_length, len(feature_names)), dtype=np.float32)
+    for j, name in enumerate(feature_names):
+        values = BATCH_FEATURES[name](bars, index_bars)
+        out[:, :, j] = values[:, -sequence_length:]
+    return out
+
+
+def compare_with_reference(items: Sequence[Dict], feature_names: Sequence[str] = None) -> Dict[str, float]:
+    """
+    与逐样本函数 extract_features_sequence_from_kline_data 对比已注册的批量实现
+
+    参数:
+        items: get_training_data_from_json 返回的样本（含 kline_data / period / market_index_klines）
+
+    返回:
+        {特征名: 最大绝对误差}（仅已注册的特征，NaN 位置需两边一致）
+    """
+    from src.ai_training.feature_extractor import FEATURE_NAMES, extract_features_sequence_from_kline_data
+
+    covered, _ = batch_coverage(feature_names)
+    all_names = list(FEATURE_NAMES)
+
+    reference = np.stack([
+        extract_features_sequence_from_kline_data(
+            item['kline_data'], item['period'], item.get('market_index_klines'), item.get('stock_code')
+        )
+        for item in items
+    ])
+    batch = extract_features_batch(
+        stack_bars([item['kline_data'] for item in items]),
+        stack_index_bars([item.get('market_index_klines') for item in items]),
+        covered,
+        reference.shape[1],
+    )
+
+    errors = {}
+    for j, name in enumerate(covered):
+        ref = reference[:, :, all_names.index(name)].astype(np.float64)
+        got = batch[:, :, j].astype(np.float64)
+        if not np.array_equal(np.isnan(ref), np.isnan(got)):
+            errors[name] = float('inf')
+        else:
+            diff = np.abs(ref - got)
+            errors[name] = float(np.nanmax(diff)) if diff.size and not np.all(np.isnan(diff)) else 0.0
+    return errors
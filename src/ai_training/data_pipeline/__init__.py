@@ -5,21 +5,29 @@
 """
 
 from .pipeline import AutoDataPipeline
+from .feature_cache import FeatureCache
+from .dataset_export import export_splits, load_split, load_splits
 from .processors import (
     DataValidator,
     DataCleaner,
     FeatureEngineer,
     DataStandardizer,
-    DataSplitter
+    DataSplitter,
+    CompiledPreprocessor
 )
 
 __all__ = [
     'AutoDataPipeline',
+    'FeatureCache',
+    'export_splits',
+    'load_split',
+    'load_splits',
     'DataValidator',
     'DataCleaner',
     'FeatureEngineer',
     'DataStandardizer',
-    'DataSplitter'
+    'DataSplitter',
+    'CompiledPreprocessor'
 ]
 
 __version__ = '1.0.0'
@@ -0,0 +1,193 @@
+"""
+预处理数据集导出 / 加载（Arrow Feather / Parquet）
+
+管道运行一次后把 train/val/calibrate/test 写成列式文件，多个 AutoGluon 训练任务和回测直接读取，
+无需重新运行管道。管道元数据、特征名、分割范围写入每个文件的 schema 元数据。
+
+目录结构:
+    prepared_dataset/
+      ├── dataset.json          # 格式、各分割行数、文件名
+      ├── train.feather         # 3060 个 float32 特征列 + trend(int32) + actual_return(float32)
+      ├── val.feather
+      ├── calibrate.feather
+      └── test.feather
+
+Feather（Arrow IPC，未压缩）按内存映射读取：每列只有一个分块时 DataFrame 的特征列直接引用映射内存，
+多个进程读取同一文件时共享操作系统页缓存。Parquet 压缩率更高，但读取时需要解码。
+
+使用方法:
+    pipeline.run()
+    pipeline.export_splits('./prepared_dataset')
+
+    from src.ai_training.data_pipeline import load_splits, load_split
+    train_df, val_df, calibrate_df, test_df, metadata = load_splits('./prepared_dataset')
+    test_df, test_returns, metadata = load_split('./prepared_dataset', 'test')   # 回测需要实际收益率
+"""
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+SPLIT_NAMES = ('train', 'val', 'calibrate', 'test')
+FILE_FORMATS = {'feather': '.feather', 'parquet': '.parquet'}
+
+LABEL_COLUMN = 'trend'
+RETURN_COLUMN = 'actual_return'
+
+# schema 元数据的键
+SCHEMA_METADATA_KEY = b'ai_training_pipeline'
+
+# 每个记录批次的行数（写入时按批转置为列，临时内存与批大小有关；行数不超过该值时每列只有一个分块）
+BATCH_ROWS = 16384
+
+MANIFEST_FILE = 'dataset.json'
+
+
+def _require_pyarrow():
+    if not HAS_PYARROW:
+        raise ImportError("数据集导出需要 pyarrow，请安装: pip install pyarrow")
+
+
+def _record_batches(X: np.ndarray, y: np.ndarray, returns: Optional[np.ndarray], schema):
+    """
+    按 BATCH_ROWS 行生成记录批次（每批转置一次，列数组直接引用转置后的内存）
+
+    空分割（样本很少时 val/calibrate 可能为空）不生成批次，文件中只有 schema
+    """
+    X_flat = X.reshape(X.shape[0], int(np.prod(X.shape[1:])))
+    for start in range(0, len(X_flat), BATCH_ROWS):
+        stop = start + BATCH_ROWS
+        columns = np.ascontiguousarray(X_flat[start:stop].T, dtype=np.float32)
+        arrays = [pa.array(column) for column in columns]
+        arrays.append(pa.array(np.asarray(y[start:stop], dtype=np.int32)))
+        batch_returns = (np.full(len(columns[0]), np.nan, dtype=np.float32) if returns is None
+                         else np.asarray(returns[start:stop], dtype=np.float32))
+        # 缺失的收益率写为 null
+        arrays.append(pa.array(batch_returns, mask=np.isnan(batch_returns)))
+        yield pa.record_batch(arrays, schema=schema)
+
+
+def export_splits(pipeline, output_dir: str, file_format: str = 'feather') -> Path:
+    """
+    导出管道的四个分割
+
+    参数:
+        pipeline: 已运行到 split_data 的 AutoDataPipeline
+        output_dir: 输出目录
+        file_format: 'feather'（可内存映射，默认）或 'parquet'
+
+    返回:
+        输出目录
+    """
+    _require_pyarrow()
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"不支持的格式: {file_format}（可选: {list(FILE_FORMATS)}）")
+    if pipeline.X_train is None:
+        raise RuntimeError("Data not split. Run pipeline first.")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    feature_names = pipeline.get_feature_names()
+
+    splits = {
+        'train': (pipeline.X_train, pipeline.y_train, pipeline.returns_train),
+        'val': (pipeline.X_val, pipeline.y_val, pipeline.returns_val),
+        'calibrate': (pipeline.X_calibrate, pipeline.y_calibrate, pipeline.returns_calibrate),
+        'test': (pipeline.X_test, pipeline.y_test, pipeline.returns_test),
+    }
+
+    fields = [pa.field(name, pa.float32()) for name in feature_names]
+    fields.append(pa.field(LABEL_COLUMN, pa.int32()))
+    fields.append(pa.field(RETURN_COLUMN, pa.float32()))
+
+    manifest = {'format': file_format, 'period': pipeline.period, 'splits': {}}
+    for name, (X, y, returns) in splits.items():
+        split_metadata = {
+            'split': name,
+            'period': pipeline.period,
+            'feature_names': feature_names,
+            'shape': list(X.shape),
+            'split_ranges': {k: list(v) for k, v in (pipeline.split_ranges or {}).items()},
+            'metadata': pipeline.get_metadata(),
+        }
+        schema = pa.schema(fields).with_metadata({
+            SCHEMA_METADATA_KEY: json.dumps(split_metadata, ensure_ascii=False, default=str).encode('utf-8')
+        })
+
+        path = output_dir / f"{name}{FILE_FORMATS[file_format]}"
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        if file_format == 'feather':
+            with pa.OSFile(str(tmp_path), 'wb') as sink, ipc.new_file(sink, schema) as writer:
+                for batch in _record_batches(X, y, returns, schema):
+                    writer.write_batch(batch)
+        else:
+            with pq.ParquetWriter(str(tmp_path), schema) as writer:
+                for batch in _record_batches(X, y, returns, schema):
+                    writer.write_batch(batch)
+        tmp_path.replace(path)
+
+        manifest['splits'][name] = {'file': path.name, 'rows': len(X)}
+
+    with open(output_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    return output_dir
+
+
+def read_split_table(output_dir: str, name: str, memory_map: bool = True) -> 'pa.Table':
+    """读取一个分割的 Arrow 表（Feather 内存映射时不复制数据）"""
+    _require_pyarrow()
+    output_dir = Path(output_dir)
+    with open(output_dir / MANIFEST_FILE, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    path = output_dir / manifest['splits'][name]['file']
+    if manifest['format'] == 'feather':
+        source = pa.memory_map(str(path)) if memory_map else pa.OSFile(str(path))
+        return ipc.open_file(source).read_all()
+    return pq.read_table(str(path), memory_map=memory_map)
+
+
+def load_split(output_dir: str, name: str, memory_map: bool = True) -> Tuple[pd.DataFrame, np.ndarray, Dict]:
+    """
+    加载一个分割
+
+    返回:
+        (df, actual_returns, metadata)
+        df: 特征列 + trend（与 run_with_dataframe 的列相同），actual_returns: float32（缺失为 NaN）
+    """
+    table = read_split_table(output_dir, name, memory_map)
+    split_metadata = json.loads(table.schema.metadata[SCHEMA_METADATA_KEY].decode('utf-8'))
+
+    returns = table.column(RETURN_COLUMN).to_numpy(zero_copy_only=False).astype(np.float32)
+    table = table.drop_columns([RETURN_COLUMN])
+    # split_blocks: 每列单独成块，单分块的列直接引用（映射的）Arrow 内存
+    df = table.to_pandas(split_blocks=True)
+    return df, returns, split_metadata
+
+
+def load_splits(output_dir: str, memory_map: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, Dict]:
+    """
+    加载全部分割，返回值与 AutoDataPipeline.run_with_dataframe() 相同
+
+    返回:
+        (train_df, val_df, calibrate_df, test_df, metadata)
+    """
+    frames = []
+    metadata = None
+    for name in SPLIT_NAMES:
+        df, _, split_metadata = load_split(output_dir, name, memory_map)
+        frames.append(df)
+        metadata = split_metadata['metadata']
+    return (*frames, metadata)
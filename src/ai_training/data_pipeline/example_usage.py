@@ -132,7 +132,7 @@ def example_monitoring():
 
 def example_preprocessing_for_prediction(X_new, pipeline):
     """
-    在预测时，使用相同的标准化器处理新数据
+    在预测时，使用相同的填充器和标准化器处理新数据
     
     Args:
         X_new: 新的特征数据
@@ -140,22 +140,17 @@ def example_preprocessing_for_prediction(X_new, pipeline):
     """
     import numpy as np
 
-    # 获取处理工具
-    imputer = pipeline.get_imputer()
-    scaler = pipeline.get_scaler()
+    # 填充器 + 标准化器编译为一次原地 float32 变换（NaN/Inf填充、减均值、乘标准差倒数）
+    preprocessor = pipeline.get_compiled_preprocessor()
 
-    # 应用相同的处理步骤
-    X_new_flat = X_new.reshape(len(X_new), -1)
+    # 预分配缓冲区（批量打分时可重复使用）
+    buffer = np.empty((len(X_new), preprocessor.n_features), dtype=np.float32)
+    buffer[:] = X_new.reshape(len(X_new), -1)
 
-    # 1. 填充NaN
-    X_new_flat = imputer.transform(X_new_flat)
-
-    # 2. 标准化（使用训练时的mean/std）
-    X_new_flat = scaler.transform(X_new_flat)
-
-    # 3. 重塑
-    X_new_processed = X_new_flat.reshape(len(X_new), -1)
+    # 原地处理，不产生 float64 中间副本
+    X_new_processed = preprocessor.transform_into(buffer)
 
+    # 等价于逐步调用: scaler.transform(imputer.transform(X_new_flat))
     return X_new_processed
 
 
@@ -196,6 +191,7 @@ def example_error_handling():
 def example_batch_processing():
     """处理多个不同周期的数据集"""
     from src.ai_training.data_pipeline import AutoDataPipeline
+    from src.ai_training.kline_data_loader import StockImageAnalyzer
 
     periods = [
         './ai_training_data/day_kline_training',
@@ -205,18 +201,20 @@ def example_batch_processing():
 
     results = {}
 
-    for data_dir in periods:
-        try:
-            pipeline = AutoDataPipeline(data_dir)
-            X_train, y_train, X_val, y_val, X_calibrate, y_calibrate, X_test, y_test, metadata = pipeline.run()
-            results[pipeline.period] = {
-                'X_train': X_train,
-                'y_train': y_train,
-                'metadata': metadata
-            }
-            print(f"✅ {pipeline.period}: {len(X_train)} 训练样本")
-        except Exception as e:
-            print(f"❌ {data_dir}: {e}")
+    # 多个管道共享一个K线读取器（一个数据库会话），结束时关闭
+    with StockImageAnalyzer() as analyzer:
+        for data_dir in periods:
+            try:
+                with AutoDataPipeline(data_dir, analyzer=analyzer) as pipeline:
+                    X_train, y_train, X_val, y_val, X_calibrate, y_calibrate, X_test, y_test, metadata = pipeline.run()
+                results[pipeline.period] = {
+                    'X_train': X_train,
+                    'y_train': y_train,
+                    'metadata': metadata
+                }
+                print(f"✅ {pipeline.period}: {len(X_train)} 训练样本")
+            except Exception as e:
+                print(f"❌ {data_dir}: {e}")
 
     return results
 
@@ -232,7 +230,10 @@ def example_custom_config():
     config = {
         'scaling_method': 'standard',  # 标准化方法
         'impute_strategy': 'mean',     # NaN填充策略
-        'validation_level': 'strict'   # 验证等级
+        'validation_level': 'strict',  # 验证等级
+        'feature_cache_dir': './feature_cache',  # 特征缓存目录（再次运行时跳过数据库读取和特征提取）
+        'chunk_rows': 4096,            # 分块清理/标准化（峰值内存与数据集大小无关）
+        'memmap_dir': './pipeline_tmp'  # 特征矩阵写入内存映射文件（数据集可大于内存）
     }
 
     pipeline = AutoDataPipeline(
@@ -242,7 +243,9 @@ def example_custom_config():
         random_seed=42,
         min_samples_per_class=20,
         imbalance_threshold=2.0,
-        config=config
+        config=config,
+        n_jobs=4,                      # 特征提取并行进程数（-1=全部CPU核）
+        preserve_dtype=True            # 全程保持 float32（清理/标准化原地完成，内存减半）
     )
 
     X_train, y_train, X_val, y_val, X_calibrate, y_calibrate, X_test, y_test, metadata = pipeline.run()
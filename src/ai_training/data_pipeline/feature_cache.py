@@ -0,0 +1,139 @@
+"""
+特征张量磁盘缓存
+
+每个样本的特征矩阵（60×51 float32）和实际收益率保存为一个 .npz 文件，
+缓存键 = (股票代码, 交易日期, 周期, 指数集合, 特征版本)。
+特征版本由 FEATURE_NAMES 和 feature_extractor 模块（__version__ + 源码）的哈希决定，
+修改特征代码后自动失效，无需手动清理。
+
+目录结构:
+    feature_cache/
+      └── day-3f2a9c1e0b7d4a65/          # {周期}-{键哈希}
+          ├── _key.json                  # 键的组成（便于排查）
+          └── 600000/
+              ├── 20230116.npz           # features + actual_return
+              └── 20230117.npz
+
+使用方法:
+    pipeline = AutoDataPipeline(data_dir, config={'feature_cache_dir': './feature_cache'})
+"""
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+from src.ai_training import feature_extractor
+from src.ai_training.feature_extractor import FEATURE_NAMES
+
+
+def feature_version() -> str:
+    """特征版本哈希：FEATURE_NAMES + 特征模块版本号 + 特征模块源码"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps(list(FEATURE_NAMES), ensure_ascii=False).encode('utf-8'))
+    digest.update(str(getattr(feature_extractor, '__version__', '')).encode('utf-8'))
+    with open(feature_extractor.__file__, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """特征张量磁盘缓存（按周期、指数集合、特征版本分目录）"""
+
+    # get() 的返回值：样本已确认无法生成特征（数据不足等），无需再次查询
+    SKIPPED = 'skipped'
+
+    def __init__(self, root: str, period: str, index_codes: Optional[Iterable[str]] = None):
+        """
+        参数:
+            root: 缓存根目录
+            period: K线周期
+            index_codes: 特征使用的指数代码（None 表示不使用指数）
+        """
+        self.period = period
+        self.index_codes = sorted(index_codes) if index_codes else []
+        self.version = feature_version()
+
+        key = {
+            'period': period,
+            'index_codes': self.index_codes,
+            'feature_version': self.version,
+        }
+        key_hash = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.root = Path(root) / f"{period}-{key_hash}"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        key_path = self.root / '_key.json'
+        if not key_path.exists():
+            with open(key_path, 'w', encoding='utf-8') as f:
+                json.dump(key, f, ensure_ascii=False, indent=2)
+
+    def _entry_path(self, stock_code: str, trade_date: str) -> Path:
+        # '2025-11-28 14:30:00' → '20251128T143000'
+        name = str(trade_date).replace('-', '').replace(':', '').replace(' ', 'T')
+        return self.root / stock_code / f"{name}.npz"
+
+    def get(self, stock_code: str, trade_date: str):
+        """
+        读取缓存
+
+        返回:
+            (features, actual_return): 命中
+            FeatureCache.SKIPPED: 命中，但该样本无法生成特征
+            None: 未缓存
+        """
+        path = self._entry_path(stock_code, trade_date)
+        if not path.exists():
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                features = entry['features']
+                actual_return = float(entry['actual_return'])
+        except Exception:
+            # 损坏的缓存文件（如写入中断）视为未缓存
+            return None
+
+        if features.size == 0:
+            return self.SKIPPED
+        return features, (None if np.isnan(actual_return) else actual_return)
+
+    def put(self, stock_code: str, trade_date: str, features: Optional[np.ndarray], actual_return=None):
+        """
+        写入缓存（features 为 None 表示该样本无法生成特征）
+        """
+        path = self._entry_path(stock_code, trade_date)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if features is None:
+            features = np.empty(0, dtype=np.float32)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     features=np.asarray(features, dtype=np.float32),
+                     actual_return=np.float64(np.nan if actual_return is None else actual_return))
+        os.replace(tmp_path, path)
+
+    def lookup(self, samples) -> Tuple[dict, list]:
+        """
+        批量查询
+
+        参数:
+            samples: [(stock_code, trade_date), ...]
+
+        返回:
+            (hits, misses): hits = {序号: get() 的返回值}，misses = 未缓存的序号列表
+        """
+        hits, misses = {}, []
+        for i, (stock_code, trade_date) in enumerate(samples):
+            entry = self.get(stock_code, trade_date)
+            if entry is None:
+                misses.append(i)
+            else:
+                hits[i] = entry
+        return hits, misses
@@ -7,23 +7,28 @@ AutoDataPipeline - 一站式数据处理框架
 
 import numpy as np
 import pandas as pd
-import joblib
 import json
 from pathlib import Path
 from datetime import datetime
-from typing import Tuple, Dict, Optional, Any, List
+from typing import TYPE_CHECKING, Tuple, Dict, Optional, Any, List
 from collections import defaultdict
 import sys
 import os
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from scipy.spatial.distance import jensenshannon
+# sklearn / scipy / joblib 在对应阶段首次执行时才导入（命令行启动、只使用部分阶段时不加载）
+if TYPE_CHECKING:
+    from sklearn.impute import SimpleImputer
+    from sklearn.preprocessing import StandardScaler
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from src.ai_training.kline_data_loader import StockImageAnalyzer
+from src.ai_training.kline_data_loader import (
+    StockImageAnalyzer, MARKET_INDEX_CODES, SKIP_INSUFFICIENT_BARS, find_training_data_file, read_training_samples
+)
 from src.ai_training.feature_extractor import FEATURE_NAMES, NUM_FEATURES, extract_features_sequence_from_kline_data
+from src.ai_training.data_pipeline.feature_cache import FeatureCache
+from src.ai_training.data_pipeline.processors import CompiledPreprocessor, DataSplitter, FeatureEngineer
+from src.ai_training.data_pipeline.dataset_export import export_splits
 
 try:
     from loguru import logger
@@ -42,6 +47,19 @@ except ImportError:
     HAS_LOGURU = False
 
 
+def _extract_features_chunk(tasks: List[Tuple]) -> List[Optional[np.ndarray]]:
+    """提取一组样本的特征（进程池任务），失败的样本返回 None"""
+    results = []
+    for kline_data, period, market_index_klines, stock_code in tasks:
+        try:
+            results.append(extract_features_sequence_from_kline_data(
+                kline_data, period, market_index_klines, stock_code
+            ))
+        except Exception:
+            results.append(None)
+    return results
+
+
 class PipelineStage:
     """管道阶段执行状态"""
     def __init__(self, name: str):
@@ -88,6 +106,10 @@ class AutoDataPipeline:
     FEATURES_PER_STEP = 51
     TOTAL_FEATURES = SEQUENCE_LENGTH * FEATURES_PER_STEP
 
+    FEATURE_CHUNK_SIZE = 64
+
+    SPLIT_NAMES = ('train', 'val', 'calibrate', 'test')
+
     SMALL_DATA_THRESHOLD = 500
     MIN_TOTAL_SAMPLES = 60
     MIN_SAMPLES_PER_CLASS = 20
@@ -105,7 +127,10 @@ class AutoDataPipeline:
         random_seed: int = 42,
         min_samples_per_class: int = 20,
         imbalance_threshold: float = 2.0,
-        config: dict = None
+        config: dict = None,
+        n_jobs: int = 1,
+        preserve_dtype: bool = False,
+        analyzer=None
     ):
         """
         初始化管道
@@ -118,6 +143,16 @@ class AutoDataPipeline:
             min_samples_per_class: 每类最少样本数
             imbalance_threshold: 类别不平衡警告阈值
             config: 自定义配置字典
+                - feature_cache_dir: 特征缓存目录
+                - bar_store_dir: 本地K线库目录（指定后不连接数据库）
+                - chunk_rows: 分块处理的行数（指定后 load_data 按块读取K线和提取特征，
+                  clean_data/standardize_data 按块统计并原地变换，峰值内存只与块大小有关）
+                - memmap_dir: 特征矩阵的 float32 内存映射文件目录（配合 chunk_rows，数据集可大于内存）
+                - db_concurrency: 读取K线时同时进行的数据库查询数（默认1=串行，见 get_training_data_from_samples）
+            n_jobs: 特征提取的并行进程数（1=单进程，-1=全部CPU核）
+            preserve_dtype: 保持 float32（填充和标准化原地完成，不转为 float64，后续各阶段内存减半）
+            analyzer: 共享的K线读取器（StockImageAnalyzer，多个管道复用同一个数据库会话，由调用方关闭）；
+                默认在首次需要读取K线时创建，close() 时关闭
         """
         self.data_dir = Path(data_dir)
         self.period = self._detect_period(period)
@@ -125,6 +160,10 @@ class AutoDataPipeline:
         self.min_samples_per_class = min_samples_per_class
         self.imbalance_threshold = imbalance_threshold
         self.config = config or {}
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else max(1, n_jobs)
+        self.chunk_rows = self.config.get('chunk_rows')
+        self.preserve_dtype = preserve_dtype
+        self.memmap_path = None
 
         # 数据容器
         self.X = None
@@ -134,6 +173,7 @@ class AutoDataPipeline:
         self.X_train = self.X_val = self.X_calibrate = self.X_test = None
         self.y_train = self.y_val = self.y_calibrate = self.y_test = None
         self.returns_train = self.returns_val = self.returns_calibrate = self.returns_test = None
+        self.split_ranges = None
 
         # 处理器
         self.imputer = None
@@ -153,6 +193,27 @@ class AutoDataPipeline:
         # 阶段跟踪
         self.stages = {}
 
+        # 特征提取进程池（n_jobs > 1 时在 load_data 中按需创建）
+        self._feature_pool = None
+
+        # K线读取器（多次 load_data 复用同一个数据库会话）
+        self._analyzer = analyzer
+        self._owns_analyzer = False
+
+    def close(self):
+        """释放资源：特征提取进程池、管道自己创建的K线读取器（数据库会话归还连接池）"""
+        self._close_feature_pool()
+        if self._owns_analyzer and self._analyzer is not None:
+            self._analyzer.close()
+            self._analyzer = None
+            self._owns_analyzer = False
+
+    def __enter__(self) -> 'AutoDataPipeline':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def _detect_period(self, period: str) -> str:
         """自动检测K线周期"""
         if period != 'auto':
@@ -200,83 +261,276 @@ class AutoDataPipeline:
         try:
             self._log("📂 加载训练数据...")
 
-            analyzer = StockImageAnalyzer(enable_database=True)
-            features_list = []
-            labels_list = []
-            returns_list = []
+            # 配置了本地K线库时不连接数据库
+            bar_store = None
+            if self.config.get('bar_store_dir'):
+                from src.ai_training.bar_store import MemmapBarStore
+                bar_store = MemmapBarStore(self.config['bar_store_dir'])
+
+            # 特征缓存命中的样本不读取K线，全部命中时不连接数据库
+            cache_dir = self.config.get('feature_cache_dir')
 
             trend_dirs = {'down_trend': 0, 'sideways': 1, 'up_trend': 2}
 
+            # 先读取各类别的样本列表（只有股票代码和日期），按样本总数分配特征矩阵
+            trend_samples = []
             for trend_name, label in trend_dirs.items():
                 trend_path = self.data_dir / trend_name
-                json_file = trend_path / 'data.json'
+                # 优先读取 data.jsonl（按股票+日期的多样本格式），其次旧格式 data.json
+                json_file = find_training_data_file(trend_path)
+
+                if json_file is None:
+                    self._log(f"{trend_path} 下没有 data.jsonl / data.json，跳过", 'warning')
+                    continue
 
-                if not json_file.exists():
-                    self._log(f"{json_file} 不存在，跳过", 'warning')
+                try:
+                    period, samples = read_training_samples(json_file)
+                except Exception as e:
+                    self._log(f"加载 {trend_name} 失败: {e}", 'error')
+                    continue
+                if not period or not samples:
+                    self._log(f"{trend_name} 无有效数据", 'warning')
                     continue
+                trend_samples.append((trend_name, label, period, samples))
 
+            total = sum(len(samples) for _, _, _, samples in trend_samples)
+            if total == 0:
+                raise ValueError("没有加载到有效数据")
+
+            # 打乱数据：预先为每个样本抽取一个随机行号，特征提取后直接写入该行（不在内存中累积特征列表），
+            # 跳过的样本留下空行，全部写完后按行号顺序压缩
+            rng = np.random.RandomState(self.random_seed)
+            slots = rng.permutation(total)
+            self.X = self._allocate_features(total)
+            labels = np.zeros(total, dtype=np.int32)
+            returns = np.full(total, np.nan, dtype=np.float32)
+            valid = np.zeros(total, dtype=bool)
+
+            offset = 0
+            for trend_name, label, period, samples in trend_samples:
                 self._log(f"加载 {trend_name}...")
+                trend_slots = slots[offset:offset + len(samples)]
+                offset += len(samples)
 
+                # 配置 chunk_rows 时按块读取K线和提取特征，峰值内存只与块大小有关
+                rows = self.chunk_rows or len(samples)
+                count = hits = 0
                 try:
-                    results = analyzer.get_training_data_from_json(str(json_file))
-                    if not results:
-                        self._log(f"{trend_name} 无有效数据", 'warning')
-                        continue
-
-                    count = 0
-                    for item in results:
-                        try:
-                            features = extract_features_sequence_from_kline_data(
-                                item['kline_data'],
-                                item['period'],
-                                item.get('market_index_klines'),
-                                item.get('stock_code')
-                            )
-
-                            if features is not None:
-                                features_list.append(features)
-                                labels_list.append(label)
-                                returns_list.append(item.get('actual_return', None))
-                                count += 1
-                        except Exception:
-                            continue
+                    for start in range(0, len(samples), rows):
+                        chunk = samples[start:start + rows]
+                        chunk_slots = trend_slots[start:start + rows]
+                        entries, missed = self._load_chunk(period, chunk, cache_dir, bar_store, trend_name)
+                        hits += len(chunk) - missed
+
+                        for i, slot in enumerate(chunk_slots):
+                            entry = entries[i]
+                            if entry is FeatureCache.SKIPPED:
+                                continue
+                            features, actual_return = entry
+                            self.X[slot] = features
+                            labels[slot] = label
+                            returns[slot] = np.nan if actual_return is None else actual_return
+                            valid[slot] = True
+                            count += 1
+                        del entries
+                except Exception as e:
+                    self._log(f"加载 {trend_name} 失败: {e}", 'error')
 
+                if count == 0:
+                    self._log(f"{trend_name} 无有效数据", 'warning')
+                elif cache_dir:
+                    self._log(f"{trend_name}: {count} 条成功（特征缓存命中 {hits} 条）", 'success')
+                else:
                     self._log(f"{trend_name}: {count} 条成功", 'success')
 
-                except Exception as e:
-                    self._log(f"加载 {trend_name} 失败: {e}", 'error')
-                    continue
+            self._close_feature_pool()
 
-            if not features_list:
+            if not valid.any():
                 raise ValueError("没有加载到有效数据")
 
-            self.X = np.array(features_list, dtype=np.float32)
-            self.y = np.array(labels_list, dtype=np.int32)
-            self.actual_returns = np.array(returns_list, dtype=np.float32)
-
-            # 打乱数据
-            rng = np.random.RandomState(self.random_seed)
-            shuffle_idx = rng.permutation(len(self.X))
-            self.X = self.X[shuffle_idx]
-            self.y = self.y[shuffle_idx]
-            self.actual_returns = self.actual_returns[shuffle_idx]
+            self._compact_features(valid)
+            self.y = labels[valid]
+            self.actual_returns = returns[valid]
 
             stage.success({
                 'total_samples': len(self.X),
                 'shape': str(self.X.shape),
                 'down_trend': int(np.sum(self.y == 0)),
                 'sideways': int(np.sum(self.y == 1)),
-                'up_trend': int(np.sum(self.y == 2))
+                'up_trend': int(np.sum(self.y == 2)),
+                **self._array_info('load')
             })
 
             self._log(f"✅ 加载完成: {len(self.X)} 条样本", 'success')
 
         except Exception as e:
+            self._close_feature_pool()
             stage.fail(str(e))
             raise
 
         return self
 
+    def _load_chunk(self, period: str, samples: List, cache_dir: Optional[str], bar_store,
+                    trend_name: str) -> Tuple[Dict, int]:
+        """
+        读取一块样本的特征（特征缓存命中的直接使用，其余读取K线并提取特征）
+
+        返回:
+            (entries, 未命中缓存的样本数): entries = {块内序号: (特征, 收益率) 或 FeatureCache.SKIPPED}
+        """
+        keys = [(stock_code, info.get('date') if isinstance(info, dict) else info)
+                for stock_code, info in samples]
+
+        cache = None
+        if cache_dir:
+            cache = FeatureCache(cache_dir, period, MARKET_INDEX_CODES)
+            entries, misses = cache.lookup(keys)
+        else:
+            entries, misses = {}, list(range(len(samples)))
+
+        if misses:
+            skip_reasons = {}
+            results = self._get_analyzer(bar_store).get_training_data_from_samples(
+                period, [samples[i] for i in misses],
+                concurrency=self.config.get('db_concurrency', 1),
+                skip_reasons=skip_reasons
+            )
+            by_key = {(item['stock_code'], item['trade_date']): item for item in results or []}
+
+            found = [i for i in misses if keys[i] in by_key]
+            extracted = self._extract_features([by_key[keys[i]] for i in found])
+            features_by_index = dict(zip(found, extracted))
+            failed = sum(1 for features in extracted if features is None)
+            if failed:
+                self._log(f"{trend_name}: {failed} 条特征提取失败", 'warning')
+
+            for i in misses:
+                item = by_key.get(keys[i])
+                features = features_by_index.get(i)
+
+                actual_return = item.get('actual_return', None) if item is not None else None
+                # 只缓存确定的结果：完整特征（含全部指数），或K线不足的跳过；
+                # 查询出错、指数读取不全、特征提取失败不缓存，下次重新读取
+                if cache is not None:
+                    if item is not None and features is not None and self._has_all_indexes(item):
+                        cache.put(keys[i][0], keys[i][1], features, actual_return)
+                    elif item is None and skip_reasons.get(keys[i]) == SKIP_INSUFFICIENT_BARS:
+                        cache.put(keys[i][0], keys[i][1], None, None)
+                entries[i] = FeatureCache.SKIPPED if features is None else (features, actual_return)
+
+        return entries, len(misses)
+
+    def _compact_features(self, valid: np.ndarray):
+        """
+        去掉特征矩阵中跳过样本留下的空行（按块把有效行前移，再截断）
+
+        有效行的目标位置不大于原位置，按行号递增处理时不会覆盖尚未移动的行
+        """
+        n_valid = int(valid.sum())
+        if n_valid < len(valid):
+            targets = np.cumsum(valid) - 1
+            block = self.chunk_rows or CompiledPreprocessor.BLOCK_ROWS
+            for start in range(0, len(valid), block):
+                src = np.flatnonzero(valid[start:start + block]) + start
+                dst = targets[src]
+                moved = src != dst
+                if moved.any():
+                    self.X[dst[moved]] = self.X[src[moved]]
+
+        shape = (n_valid,) + self.X.shape[1:]
+        if isinstance(self.X, np.memmap):
+            # 内存映射文件截断到有效行数后重新打开
+            self.X.flush()
+            self.X = None
+            os.truncate(self.memmap_path, n_valid * self.SEQUENCE_LENGTH * NUM_FEATURES * 4)
+            self.X = np.memmap(self.memmap_path, dtype=np.float32, mode='r+', shape=shape)
+        elif n_valid < len(valid):
+            self.X.resize(shape, refcheck=False)
+
+    @staticmethod
+    def _has_all_indexes(item: Dict) -> bool:
+        """样本是否带有全部板块指数（特征缓存的键包含全部指数代码）"""
+        market_index_klines = item.get('market_index_klines')
+        return market_index_klines is not None and all(code in market_index_klines for code in MARKET_INDEX_CODES)
+
+    def _get_analyzer(self, bar_store=None):
+        """K线读取器（首次需要时创建，之后复用）"""
+        if self._analyzer is None:
+            self._analyzer = StockImageAnalyzer(enable_database=bar_store is None, bar_store=bar_store)
+            self._owns_analyzer = True
+        return self._analyzer
+
+    def _allocate_features(self, n_samples: int) -> np.ndarray:
+        """分配 [N, 60, 51] float32 特征矩阵（配置 memmap_dir 时为磁盘内存映射文件）"""
+        shape = (n_samples, self.SEQUENCE_LENGTH, NUM_FEATURES)
+        memmap_dir = self.config.get('memmap_dir')
+        if not memmap_dir:
+            return np.empty(shape, dtype=np.float32)
+
+        import tempfile
+        Path(memmap_dir).mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=f'features_{self.period}_', suffix='.dat', dir=memmap_dir)
+        os.close(fd)
+        self.memmap_path = path
+        self._log(f"特征矩阵使用内存映射文件: {path}")
+        return np.memmap(path, dtype=np.float32, mode='w+', shape=shape)
+
+    def _array_info(self, stage_name: str) -> Dict[str, Any]:
+        """特征矩阵的 dtype 和字节数（写入日志，并合并到阶段信息）"""
+        info = {'dtype': str(self.X.dtype), 'nbytes': int(self.X.nbytes)}
+        self._log(f"{stage_name}: X {info['dtype']}, {info['nbytes'] / 1024 ** 2:.1f} MB")
+        return info
+
+    def _value_stats(self, flat: np.ndarray) -> Tuple[float, float]:
+        """按块以 float64 累计全部元素的 (均值, 标准差)，不产生整块 float64 副本"""
+        rows = self.chunk_rows or CompiledPreprocessor.BLOCK_ROWS
+        total = total_sq = 0.0
+        for start in range(0, len(flat), rows):
+            block = flat[start:start + rows].astype(np.float64)
+            total += float(block.sum())
+            total_sq += float(np.square(block).sum())
+        mean = total / flat.size
+        return mean, float(np.sqrt(max(total_sq / flat.size - mean * mean, 0.0)))
+
+    def _row_blocks(self, flat: np.ndarray):
+        """按 chunk_rows 行切块（视图）；未配置分块时整体作为一块"""
+        rows = self.chunk_rows or max(len(flat), 1)
+        for start in range(0, len(flat), rows):
+            yield flat[start:start + rows]
+
+    def _extract_features(self, items: List[Dict]) -> List[Optional[np.ndarray]]:
+        """
+        批量提取特征（逐样本提取，n_jobs > 1 时分块提交到进程池）
+
+        子进程只接收列式K线窗口（KlineWindow）和指数窗口，结果按输入顺序返回，
+        提取失败的样本为 None
+        """
+        tasks = [
+            (item['kline_data'], item['period'], item.get('market_index_klines'), item.get('stock_code'))
+            for item in items
+        ]
+
+        if self.n_jobs <= 1 or len(tasks) < self.FEATURE_CHUNK_SIZE:
+            return _extract_features_chunk(tasks)
+
+        if self._feature_pool is None:
+            import multiprocessing
+            # spawn: 子进程不继承父进程的数据库连接和日志线程
+            self._feature_pool = multiprocessing.get_context('spawn').Pool(self.n_jobs)
+
+        chunks = [tasks[start:start + self.FEATURE_CHUNK_SIZE]
+                  for start in range(0, len(tasks), self.FEATURE_CHUNK_SIZE)]
+        results = []
+        for chunk_result in self._feature_pool.imap(_extract_features_chunk, chunks):
+            results.extend(chunk_result)
+        return results
+
+    def _close_feature_pool(self):
+        if self._feature_pool is not None:
+            self._feature_pool.close()
+            self._feature_pool.join()
+            self._feature_pool = None
+
     def validate_data(self) -> 'AutoDataPipeline':
         """验证数据"""
         stage = self._create_stage('validate')
@@ -296,8 +550,8 @@ class AutoDataPipeline:
             unique_classes = np.unique(self.y)
             assert np.array_equal(unique_classes, [0, 1, 2]), f"类别值错误: {unique_classes}"
 
-            # NaN检查
-            nan_count = np.isnan(self.X).sum()
+            # NaN检查（分块统计，避免整块布尔掩码）
+            nan_count = sum(int(np.isnan(block).sum()) for block in self._row_blocks(self.X))
             if nan_count > 0:
                 self._log(f"发现 {nan_count} 个NaN值", 'warning')
 
@@ -331,18 +585,40 @@ class AutoDataPipeline:
         stage.start()
 
         try:
+            from sklearn.impute import SimpleImputer
+
             self._log("🧹 数据清理...")
 
+            if self.chunk_rows:
+                nan_count, inf_count = self._clean_data_chunked()
+                stage.success({
+                    'nan_count': int(nan_count),
+                    'inf_count': int(inf_count),
+                    'shape': str(self.X.shape),
+                    **self._array_info('clean')
+                })
+                self._log("✅ 清理完成（分块）", 'success')
+                return self
+
             # 检查Inf
             inf_count = np.isinf(self.X).sum()
             if inf_count > 0:
                 self._log(f"发现 {inf_count} 个Inf值，转为NaN", 'warning')
-                self.X = self.X.copy()
+                if not self.preserve_dtype:
+                    self.X = self.X.copy()
                 self.X[np.isinf(self.X)] = np.nan
 
             # 检查NaN
             nan_count = np.isnan(self.X).sum()
-            if nan_count > 0:
+            if self.preserve_dtype and self.X.dtype == np.float32:
+                # 保持 float32：拟合后原地填充（fit_transform 会返回 float64 副本）
+                if nan_count > 0:
+                    self._log(f"使用SimpleImputer原地填充 {nan_count} 个NaN值", 'info')
+                X_flat = self.X.reshape(len(self.X), -1)
+                self.imputer = SimpleImputer(strategy='mean').fit(X_flat)
+                CompiledPreprocessor(self.imputer, None, X_flat.shape[1]).transform_into(X_flat)
+
+            elif nan_count > 0:
                 self._log(f"使用SimpleImputer填充 {nan_count} 个NaN值", 'info')
                 X_flat = self.X.reshape(len(self.X), -1)
                 self.imputer = SimpleImputer(strategy='mean')
@@ -359,7 +635,8 @@ class AutoDataPipeline:
             stage.success({
                 'nan_count': int(nan_count),
                 'inf_count': int(inf_count),
-                'shape': str(self.X.shape)
+                'shape': str(self.X.shape),
+                **self._array_info('clean')
             })
 
             self._log("✅ 清理完成", 'success')
@@ -370,6 +647,45 @@ class AutoDataPipeline:
 
         return self
 
+    def _clean_data_chunked(self) -> Tuple[int, int]:
+        """
+        分块清理：第一遍按块累计每列有效值的和与个数得到列均值（Inf 视为缺失），
+        第二遍原地把 NaN/Inf 替换为列均值。结果与整体 SimpleImputer(strategy='mean') 一致
+
+        返回:
+            (nan_count, inf_count)，nan_count 含按NaN处理的Inf（与整体清理的统计一致）
+        """
+        from sklearn.impute import SimpleImputer
+
+        if self.X.dtype != np.float32:
+            self.X = self.X.astype(np.float32)
+        flat = self.X.reshape(len(self.X), -1)
+
+        sums = np.zeros(flat.shape[1])
+        counts = np.zeros(flat.shape[1], dtype=np.int64)
+        nan_count = inf_count = 0
+        for block in self._row_blocks(flat):
+            finite = np.isfinite(block)
+            inf_count += int(np.isinf(block).sum())
+            nan_count += int(finite.size - finite.sum())
+            sums += np.where(finite, block, 0).sum(axis=0, dtype=np.float64)
+            counts += finite.sum(axis=0)
+
+        if inf_count > 0:
+            self._log(f"发现 {inf_count} 个Inf值，按NaN处理", 'warning')
+        if nan_count > 0:
+            self._log(f"使用列均值分块填充 {nan_count} 个NaN值", 'info')
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+
+        # 以列均值拟合 SimpleImputer（单行数据的列均值即其本身），保证 get_imputer()/save_state 接口一致
+        self.imputer = SimpleImputer(strategy='mean')
+        self.imputer.fit(means[None, :])
+
+        CompiledPreprocessor(self.imputer, None, flat.shape[1]).transform_into(flat)
+        return nan_count, inf_count
+
     def engineer_features(self) -> 'AutoDataPipeline':
         """特征工程（生成语义化特征名）"""
         stage = self._create_stage('engineer')
@@ -409,11 +725,41 @@ class AutoDataPipeline:
         stage.start()
 
         try:
+            from sklearn.preprocessing import StandardScaler
+
             self._log("📊 标准化数据...")
 
+            if self.chunk_rows:
+                mean, std = self._standardize_data_chunked()
+                stage.success({
+                    'mean': mean,
+                    'std': std,
+                    'shape': str(self.X.shape),
+                    **self._array_info('standardize')
+                })
+                self._log("✅ 标准化完成（分块）", 'success')
+                return self
+
             # 扁平化
             X_flat = self.X.reshape(len(self.X), -1)
 
+            if self.preserve_dtype and self.X.dtype == np.float32:
+                # 保持 float32：拟合后原地变换
+                if not np.isfinite(X_flat).all():
+                    raise ValueError("标准化前包含NaN/Inf（请先运行 clean_data）")
+                self.scaler = StandardScaler().fit(X_flat)
+                CompiledPreprocessor(None, self.scaler, X_flat.shape[1]).transform_into(X_flat)
+
+                mean, std = self._value_stats(X_flat)
+                stage.success({
+                    'mean': mean,
+                    'std': std,
+                    'shape': str(self.X.shape),
+                    **self._array_info('standardize')
+                })
+                self._log("✅ 标准化完成", 'success')
+                return self
+
             # 标准化
             self.scaler = StandardScaler()
             X_flat = self.scaler.fit_transform(X_flat)
@@ -428,7 +774,8 @@ class AutoDataPipeline:
             stage.success({
                 'mean': float(self.X.mean()),
                 'std': float(self.X.std()),
-                'shape': str(self.X.shape)
+                'shape': str(self.X.shape),
+                **self._array_info('standardize')
             })
 
             self._log("✅ 标准化完成", 'success')
@@ -439,6 +786,29 @@ class AutoDataPipeline:
 
         return self
 
+    def _standardize_data_chunked(self) -> Tuple[float, float]:
+        """
+        分块标准化：StandardScaler.partial_fit 按块累计列均值/方差，再按块原地变换
+
+        返回:
+            标准化后全部元素的 (均值, 标准差)
+        """
+        from sklearn.preprocessing import StandardScaler
+
+        if self.X.dtype != np.float32:
+            self.X = self.X.astype(np.float32)
+        flat = self.X.reshape(len(self.X), -1)
+
+        self.scaler = StandardScaler()
+        for block in self._row_blocks(flat):
+            if not np.isfinite(block).all():
+                raise ValueError("标准化前包含NaN/Inf（请先运行 clean_data）")
+            self.scaler.partial_fit(block)
+
+        CompiledPreprocessor(None, self.scaler, flat.shape[1]).transform_into(flat)
+
+        return self._value_stats(flat)
+
     def split_data(self) -> 'AutoDataPipeline':
         """分割数据"""
         stage = self._create_stage('split')
@@ -451,51 +821,17 @@ class AutoDataPipeline:
 
             if n_samples < self.SMALL_DATA_THRESHOLD:
                 self._log(f"小数据模式 (N={n_samples}): 3-Way Split", 'info')
-                train_ratio, val_ratio, test_ratio = 0.70, 0.15, 0.15
-
-                train_size = int(n_samples * train_ratio)
-                val_size = int(n_samples * val_ratio)
-
-                self.X_train = self.X[:train_size]
-                self.X_val = self.X[train_size:train_size + val_size]
-                self.X_test = self.X[train_size + val_size:]
-
-                self.y_train = self.y[:train_size]
-                self.y_val = self.y[train_size:train_size + val_size]
-                self.y_test = self.y[train_size + val_size:]
-
-                self.X_calibrate = self.X_val.copy()
-                self.y_calibrate = self.y_val.copy()
-
-                if self.actual_returns is not None:
-                    self.returns_train = self.actual_returns[:train_size]
-                    self.returns_val = self.actual_returns[train_size:train_size + val_size]
-                    self.returns_test = self.actual_returns[train_size + val_size:]
-                    self.returns_calibrate = self.returns_val.copy()
-
             else:
                 self._log(f"大数据模式 (N={n_samples}): 4-Way Split", 'info')
-                train_ratio, val_ratio, calibrate_ratio, test_ratio = 0.50, 0.20, 0.20, 0.10
 
-                train_size = int(n_samples * train_ratio)
-                val_size = int(n_samples * val_ratio)
-                calibrate_size = int(n_samples * calibrate_ratio)
+            # 各部分只记录下标范围，数据均为 self.X 上的切片视图（小数据时 calibrate 与 val 共享同一段）
+            self.split_ranges = DataSplitter.split_ranges(n_samples, self.SMALL_DATA_THRESHOLD)
 
-                self.X_train = self.X[:train_size]
-                self.X_val = self.X[train_size:train_size + val_size]
-                self.X_calibrate = self.X[train_size + val_size:train_size + val_size + calibrate_size]
-                self.X_test = self.X[train_size + val_size + calibrate_size:]
-
-                self.y_train = self.y[:train_size]
-                self.y_val = self.y[train_size:train_size + val_size]
-                self.y_calibrate = self.y[train_size + val_size:train_size + val_size + calibrate_size]
-                self.y_test = self.y[train_size + val_size + calibrate_size:]
-
-                if self.actual_returns is not None:
-                    self.returns_train = self.actual_returns[:train_size]
-                    self.returns_val = self.actual_returns[train_size:train_size + val_size]
-                    self.returns_calibrate = self.actual_returns[train_size + val_size:train_size + val_size + calibrate_size]
-                    self.returns_test = self.actual_returns[train_size + val_size + calibrate_size:]
+            self.X_train, self.X_val, self.X_calibrate, self.X_test = self._split_views(self.X)
+            self.y_train, self.y_val, self.y_calibrate, self.y_test = self._split_views(self.y)
+            if self.actual_returns is not None:
+                (self.returns_train, self.returns_val,
+                 self.returns_calibrate, self.returns_test) = self._split_views(self.actual_returns)
 
             stage.success({
                 'train_size': len(self.X_train),
@@ -512,12 +848,30 @@ class AutoDataPipeline:
 
         return self
 
+    def _split_views(self, array: np.ndarray) -> Tuple:
+        """按 split_ranges 切出 (train, val, calibrate, test) 视图"""
+        return tuple(array[slice(*self.split_ranges[name])] for name in self.SPLIT_NAMES)
+
+    def get_split_dataframe(self, name: str) -> pd.DataFrame:
+        """
+        某个分割的 DataFrame（特征列直接包装 self.X 的对应行，不复制）
+
+        Args:
+            name: 'train' / 'val' / 'calibrate' / 'test'
+        """
+        if self.split_ranges is None:
+            raise RuntimeError("Data not split. Run split_data() first.")
+        rows = slice(*self.split_ranges[name])
+        return FeatureEngineer.to_dataframe(self.X[rows], self.feature_names, self.y[rows])
+
     def validate_consistency(self) -> 'AutoDataPipeline':
         """验证分布一致性"""
         stage = self._create_stage('consistency')
         stage.start()
 
         try:
+            from scipy.spatial.distance import jensenshannon
+
             self._log("📏 分布一致性验证...")
 
             train_dist = np.bincount(self.y_train, minlength=3) / len(self.y_train)
@@ -597,26 +951,10 @@ class AutoDataPipeline:
         Returns:
             (train_df, val_df, calibrate_df, test_df, metadata)
         """
-        X_train, y_train, X_val, y_val, X_calibrate, y_calibrate, X_test, y_test, metadata = self.run()
-
-        # 扁平化
-        X_train_flat = X_train.reshape(len(X_train), -1)
-        X_val_flat = X_val.reshape(len(X_val), -1)
-        X_calibrate_flat = X_calibrate.reshape(len(X_calibrate), -1)
-        X_test_flat = X_test.reshape(len(X_test), -1)
-
-        # 创建DataFrame
-        train_df = pd.DataFrame(X_train_flat, columns=self.feature_names)
-        train_df['trend'] = y_train
-
-        val_df = pd.DataFrame(X_val_flat, columns=self.feature_names)
-        val_df['trend'] = y_val
-
-        calibrate_df = pd.DataFrame(X_calibrate_flat, columns=self.feature_names)
-        calibrate_df['trend'] = y_calibrate
+        metadata = self.run()[-1]
 
-        test_df = pd.DataFrame(X_test_flat, columns=self.feature_names)
-        test_df['trend'] = y_test
+        # 四个DataFrame的特征列都是 self.X 上的视图（不复制），峰值内存接近数据集本身
+        train_df, val_df, calibrate_df, test_df = (self.get_split_dataframe(name) for name in self.SPLIT_NAMES)
 
         return train_df, val_df, calibrate_df, test_df, metadata
 
@@ -652,6 +990,37 @@ class AutoDataPipeline:
             for name, stage in self.stages.items()
         }
 
+    def export_splits(self, output_dir: str, file_format: str = 'feather') -> Path:
+        """
+        导出四个分割为 Feather/Parquet（含管道元数据），供其他训练任务和回测直接加载
+
+        Args:
+            output_dir: 输出目录
+            file_format: 'feather'（可内存映射，默认）或 'parquet'
+
+        读取见 dataset_export.load_splits / load_split
+        """
+        stage = self._create_stage('export')
+        stage.start()
+
+        try:
+            self._log(f"💾 导出数据集 ({file_format})...")
+            if 'data_split' not in self.metadata:
+                self._build_metadata()
+            path = export_splits(self, output_dir, file_format)
+
+            stage.success({
+                'output_dir': str(path),
+                'format': file_format
+            })
+            self._log(f"✅ 数据集已导出到 {path}", 'success')
+
+        except Exception as e:
+            stage.fail(str(e))
+            raise
+
+        return path
+
     def get_metadata(self) -> Dict:
         """获取元数据"""
         return self.metadata
@@ -667,18 +1036,22 @@ class AutoDataPipeline:
             'info': stage.info
         }
 
-    def get_scaler(self) -> StandardScaler:
+    def get_scaler(self) -> 'StandardScaler':
         """获取标准化器（用于预测时复现）"""
         if self.scaler is None:
             raise RuntimeError("Scaler not initialized. Run pipeline first.")
         return self.scaler
 
-    def get_imputer(self) -> SimpleImputer:
+    def get_imputer(self) -> 'SimpleImputer':
         """获取填充器（用于预测时复现）"""
         if self.imputer is None:
             raise RuntimeError("Imputer not initialized. Run pipeline first.")
         return self.imputer
 
+    def get_compiled_preprocessor(self) -> CompiledPreprocessor:
+        """获取融合的填充+标准化变换（预测时原地处理 float32 特征）"""
+        return CompiledPreprocessor.from_pipeline(self)
+
     def get_feature_names(self) -> List[str]:
         """获取特征名列表"""
         if not hasattr(self, 'feature_names'):
@@ -737,11 +1110,15 @@ class AutoDataPipeline:
             'metadata': self.metadata,
             'config': self.config
         }
+        import joblib
+
         joblib.dump(state, path)
         self._log(f"状态已保存到 {path}", 'success')
 
     def load_state(self, path: str):
         """加载处理状态"""
+        import joblib
+
         state = joblib.load(path)
         self.scaler = state['scaler']
         self.imputer = state['imputer']
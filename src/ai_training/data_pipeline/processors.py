@@ -7,9 +7,12 @@
 
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from typing import Tuple, Optional, Dict, Any
+from typing import TYPE_CHECKING, Tuple, Optional, Dict, Any
+
+# sklearn 在拟合时才导入（加载管道状态、推理时不需要）
+if TYPE_CHECKING:
+    from sklearn.impute import SimpleImputer
+    from sklearn.preprocessing import StandardScaler
 
 
 class DataValidator:
@@ -51,8 +54,21 @@ class DataCleaner:
     """数据清理器"""
 
     @staticmethod
-    def handle_nan(X: np.ndarray, strategy: str = 'mean') -> Tuple[np.ndarray, SimpleImputer]:
-        """处理NaN值"""
+    def handle_nan(X: np.ndarray, strategy: str = 'mean',
+                   preserve_dtype: bool = False) -> Tuple[np.ndarray, 'SimpleImputer']:
+        """
+        处理NaN值
+
+        preserve_dtype=True 且 X 为 float32 时原地填充并返回 X 本身（不转为 float64）
+        """
+        from sklearn.impute import SimpleImputer
+
+        if preserve_dtype and X.dtype == np.float32:
+            X_flat = X.reshape(len(X), -1)
+            imputer = SimpleImputer(strategy=strategy).fit(X_flat)
+            CompiledPreprocessor(imputer, None, X_flat.shape[1]).transform_into(X_flat)
+            return X, imputer
+
         if np.isnan(X).sum() == 0:
             # 即使没有NaN，也创建imputer
             imputer = SimpleImputer(strategy=strategy)
@@ -66,11 +82,12 @@ class DataCleaner:
         return X_flat.reshape(X.shape), imputer
 
     @staticmethod
-    def handle_inf(X: np.ndarray) -> np.ndarray:
-        """处理Inf值（转为NaN）"""
+    def handle_inf(X: np.ndarray, preserve_dtype: bool = False) -> np.ndarray:
+        """处理Inf值（转为NaN），preserve_dtype=True 时原地修改"""
         if np.isinf(X).sum() == 0:
             return X
-        X = X.copy()
+        if not preserve_dtype:
+            X = X.copy()
         X[np.isinf(X)] = np.nan
         return X
 
@@ -109,14 +126,42 @@ class FeatureEngineer:
         """重塑特征回3D"""
         return X.reshape(target_shape)
 
+    @staticmethod
+    def to_dataframe(X: np.ndarray, feature_names: list, y: Optional[np.ndarray] = None,
+                     label: str = 'trend') -> pd.DataFrame:
+        """
+        把特征矩阵包装为 DataFrame（不复制特征数据）
+
+        X 为 C 连续的 [N, 60, 51] 或 [N, 3060]（如 X[a:b] 切片视图）时，扁平化仍是视图，
+        DataFrame 的特征列是同一块内存上的单个数据块；标签列作为第二个数据块追加
+        """
+        X_flat = X.reshape(len(X), -1)
+        df = pd.DataFrame(X_flat, columns=feature_names, copy=False)
+        if y is not None:
+            df[label] = y
+        return df
+
 
 class DataStandardizer:
     """数据标准化器"""
 
     @staticmethod
-    def standardize(X: np.ndarray) -> Tuple[np.ndarray, StandardScaler]:
-        """标准化数据"""
+    def standardize(X: np.ndarray, preserve_dtype: bool = False) -> Tuple[np.ndarray, 'StandardScaler']:
+        """
+        标准化数据
+
+        preserve_dtype=True 且 X 为 float32 时原地变换并返回 X 本身（不转为 float64）
+        """
+        from sklearn.preprocessing import StandardScaler
+
         X_flat = X.reshape(len(X), -1)
+        if preserve_dtype and X.dtype == np.float32:
+            if not np.isfinite(X_flat).all():
+                raise ValueError("标准化前包含NaN/Inf")
+            scaler = StandardScaler().fit(X_flat)
+            CompiledPreprocessor(None, scaler, X_flat.shape[1]).transform_into(X_flat)
+            return X, scaler
+
         scaler = StandardScaler()
         X_flat = scaler.fit_transform(X_flat)
 
@@ -127,16 +172,148 @@ class DataStandardizer:
         return X_flat.reshape(X.shape), scaler
 
     @staticmethod
-    def inverse_standardize(X: np.ndarray, scaler: StandardScaler) -> np.ndarray:
+    def inverse_standardize(X: np.ndarray, scaler: 'StandardScaler') -> np.ndarray:
         """反标准化"""
         X_flat = X.reshape(len(X), -1)
         X_flat = scaler.inverse_transform(X_flat)
         return X_flat.reshape(X.shape)
 
 
+class CompiledPreprocessor:
+    """
+    融合的填充+标准化（预测阶段使用）
+
+    由训练时的 SimpleImputer 和 StandardScaler 编译为三个 float32 向量（填充值、均值、标准差倒数），
+    对 float32 矩阵按行块原地完成: NaN/Inf → 填充值、减均值、乘标准差倒数。
+    结果与 scaler.transform(imputer.transform(X)) 一致（Inf 按训练时的 clean_data 视为缺失值），
+    不产生 float64 中间副本。
+    """
+
+    # 每次处理的行数（块内完成全部步骤，掩码等临时数组大小固定）
+    BLOCK_ROWS = 1024
+
+    def __init__(self, imputer: Optional['SimpleImputer'], scaler: Optional['StandardScaler'],
+                 n_features: Optional[int] = None):
+        """
+        参数:
+            imputer: 训练时拟合的 SimpleImputer（None 表示缺失值填 0）
+            scaler: 训练时拟合的 StandardScaler（None 表示不标准化）
+            n_features: 特征数（默认从 imputer/scaler 推断）
+        """
+        fill = None if imputer is None else np.asarray(imputer.statistics_, dtype=np.float64)
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+
+        if n_features is None:
+            for source in (fill, mean, scale, getattr(scaler, 'n_features_in_', None)):
+                if source is not None:
+                    n_features = int(np.size(source)) if np.ndim(source) else int(source)
+                    break
+        if n_features is None:
+            raise ValueError("无法推断特征数，请指定 n_features")
+
+        if fill is not None and np.isnan(fill).any():
+            # 训练时全为缺失值的列会被 SimpleImputer 删除，列数与 scaler 不再对应
+            if not getattr(imputer, 'keep_empty_features', False):
+                raise ValueError("填充器存在全缺失列（会被删除），无法编译为逐列变换")
+            fill = np.nan_to_num(fill)
+
+        self.n_features = n_features
+        self.fill = np.zeros(n_features, dtype=np.float32) if fill is None else fill.astype(np.float32)
+        self.mean = np.zeros(n_features, dtype=np.float32) if mean is None else np.asarray(mean, dtype=np.float32)
+        self.inv_scale = (np.ones(n_features, dtype=np.float32) if scale is None
+                          else (1.0 / np.asarray(scale, dtype=np.float64)).astype(np.float32))
+
+        for name in ('fill', 'mean', 'inv_scale'):
+            if len(getattr(self, name)) != n_features:
+                raise ValueError(f"{name} 长度 {len(getattr(self, name))} 与特征数 {n_features} 不一致")
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> 'CompiledPreprocessor':
+        """从已运行（或已 load_state）的 AutoDataPipeline 编译"""
+        return cls(pipeline.get_imputer(), pipeline.get_scaler())
+
+    def transform_into(self, out: np.ndarray) -> np.ndarray:
+        """
+        原地变换
+
+        参数:
+            out: float32 数组，形状 [N, 特征数] 或 [N, ...]（按行扁平化后为特征数），必须 C 连续
+
+        返回:
+            out（同一对象）
+        """
+        if out.dtype != np.float32:
+            raise TypeError(f"transform_into 需要 float32 数组，实际为 {out.dtype}")
+        flat = out.reshape(len(out), -1)
+        if not np.shares_memory(flat, out):
+            raise ValueError("out 必须是 C 连续数组（reshape 不能产生副本）")
+        if flat.shape[1] != self.n_features:
+            raise ValueError(f"特征数不匹配: {flat.shape[1]} != {self.n_features}")
+
+        mask = np.empty((min(self.BLOCK_ROWS, len(flat)), self.n_features), dtype=bool)
+        for start in range(0, len(flat), self.BLOCK_ROWS):
+            block = flat[start:start + self.BLOCK_ROWS]
+            block_mask = mask[:len(block)]
+            np.isfinite(block, out=block_mask)
+            np.logical_not(block_mask, out=block_mask)
+            np.copyto(block, self.fill, where=block_mask)
+            block -= self.mean
+            block *= self.inv_scale
+        return out
+
+    def transform(self, X: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        变换（X 不修改）
+
+        参数:
+            X: 原始特征 [N, 特征数] 或 [N, 60, 51]
+            out: 预分配的 float32 输出（可为更大缓冲区的前 N 行），None 时新建
+
+        返回:
+            与 X 形状相同的 float32 数组
+        """
+        if out is None:
+            out = np.empty(X.shape, dtype=np.float32)
+        np.copyto(out.reshape(X.shape), X, casting='same_kind')
+        return self.transform_into(out)
+
+
 class DataSplitter:
     """数据分割器"""
 
+    @staticmethod
+    def split_ranges(n_samples: int, small_data_threshold: int = 500) -> Dict[str, Tuple[int, int]]:
+        """
+        时间序列分割的下标范围
+
+        返回:
+            {'train': (start, stop), 'val': ..., 'calibrate': ..., 'test': ...}
+            小数据（3-way）时 calibrate 与 val 为同一范围
+        """
+        if n_samples < small_data_threshold:
+            # 小数据：3-way split
+            train_size = int(n_samples * 0.70)
+            val_size = int(n_samples * 0.15)
+            val = (train_size, train_size + val_size)
+            return {
+                'train': (0, train_size),
+                'val': val,
+                'calibrate': val,
+                'test': (train_size + val_size, n_samples),
+            }
+
+        # 大数据：4-way split
+        train_size = int(n_samples * 0.50)
+        val_size = int(n_samples * 0.20)
+        calibrate_size = int(n_samples * 0.20)
+        return {
+            'train': (0, train_size),
+            'val': (train_size, train_size + val_size),
+            'calibrate': (train_size + val_size, train_size + val_size + calibrate_size),
+            'test': (train_size + val_size + calibrate_size, n_samples),
+        }
+
     @staticmethod
     def time_series_split(
         X: np.ndarray,
@@ -144,57 +321,26 @@ class DataSplitter:
         returns: Optional[np.ndarray] = None,
         n_samples: int = None
     ) -> Tuple:
-        """时间序列分割"""
+        """
+        时间序列分割
+
+        各部分均为 X/y/returns 上的切片视图（不复制），小数据时 calibrate 与 val 共享同一段数据
+        """
         if n_samples is None:
             n_samples = len(X)
 
-        if n_samples < 500:
-            # 小数据：3-way split
-            train_size = int(n_samples * 0.70)
-            val_size = int(n_samples * 0.15)
-
-            X_train = X[:train_size]
-            X_val = X[train_size:train_size + val_size]
-            X_test = X[train_size + val_size:]
-
-            y_train = y[:train_size]
-            y_val = y[train_size:train_size + val_size]
-            y_test = y[train_size + val_size:]
-
-            X_calibrate = X_val.copy()
-            y_calibrate = y_val.copy()
+        ranges = DataSplitter.split_ranges(n_samples)
+        names = ('train', 'val', 'calibrate', 'test')
 
-            if returns is not None:
-                returns_train = returns[:train_size]
-                returns_val = returns[train_size:train_size + val_size]
-                returns_test = returns[train_size + val_size:]
-                returns_calibrate = returns_val.copy()
-            else:
-                returns_train = returns_val = returns_test = returns_calibrate = None
+        X_train, X_val, X_calibrate, X_test = (X[slice(*ranges[name])] for name in names)
+        y_train, y_val, y_calibrate, y_test = (y[slice(*ranges[name])] for name in names)
 
+        if returns is not None:
+            returns_train, returns_val, returns_calibrate, returns_test = (
+                returns[slice(*ranges[name])] for name in names
+            )
         else:
-            # 大数据：4-way split
-            train_size = int(n_samples * 0.50)
-            val_size = int(n_samples * 0.20)
-            calibrate_size = int(n_samples * 0.20)
-
-            X_train = X[:train_size]
-            X_val = X[train_size:train_size + val_size]
-            X_calibrate = X[train_size + val_size:train_size + val_size + calibrate_size]
-            X_test = X[train_size + val_size + calibrate_size:]
-
-            y_train = y[:train_size]
-            y_val = y[train_size:train_size + val_size]
-            y_calibrate = y[train_size + val_size:train_size + val_size + calibrate_size]
-            y_test = y[train_size + val_size + calibrate_size:]
-
-            if returns is not None:
-                returns_train = returns[:train_size]
-                returns_val = returns[train_size:train_size + val_size]
-                returns_calibrate = returns[train_size + val_size:train_size + val_size + calibrate_size]
-                returns_test = returns[train_size + val_size + calibrate_size:]
-            else:
-                returns_train = returns_val = returns_calibrate = returns_test = None
+            returns_train = returns_val = returns_calibrate = returns_test = None
 
         return (
             X_train, X_val, X_calibrate, X_test,
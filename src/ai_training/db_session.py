@@ -0,0 +1,173 @@
+"""
+数据库会话管理
+职责: 每个进程共享一个带连接池的 Engine，读取器、标签生成器、数据管道的会话都从这里创建，并显式关闭
+功能:
+    1. get_engine(): 复用 database.config 中配置的 Engine（connect_args、隔离级别、echo、连接池设置保持不变），
+       每个进程只有这一个连接池
+    2. create_session(): 从共享连接池创建会话（调用方负责 close，关闭后连接归还连接池，下次复用）
+    3. session_scope(): with 语句管理会话生命周期（异常时回滚，结束时关闭）
+    4. stream_rows(): 流式执行 Core select（服务端游标分批取回元组行，不经过 ORM identity map）
+    5. fork 安全: 子进程中丢弃从父进程继承的连接（不关闭父进程正在使用的连接），首次使用时重建连接池；
+       spawn 方式的子进程本身就会重新创建
+
+连接池参数（在 database.config 创建 Engine 时传入，环境变量可覆盖，SQLite 不使用这些参数）:
+    DB_POOL_SIZE      常驻连接数（默认 5）
+    DB_MAX_OVERFLOW   超出常驻连接数后最多再建立的连接数（默认 10）
+    DB_POOL_RECYCLE   连接最长使用秒数，超过后重建，避免被服务端超时断开（默认 1800）
+    DB_POOL_TIMEOUT   等待空闲连接的秒数（默认 30）
+
+    # database/config.py
+    from src.ai_training.db_session import pool_options
+    engine = create_engine(DATABASE_URL, connect_args=..., **pool_options())
+
+使用方法:
+    from src.ai_training.db_session import session_scope
+
+    with session_scope() as db:
+        rows = db.execute(select(...)).all()
+
+    # 读取器/标签生成器同样支持 with 语句，结束时关闭自己创建的会话
+    with StockImageAnalyzer() as analyzer:
+        data = analyzer.get_training_data_from_json(json_file)
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterator
+import importlib.util
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+# 只检查是否安装，sqlalchemy 和 database.config 在首次创建 Engine 时才导入（命令行启动不加载数据库模块）
+DATABASE_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('sqlalchemy', 'database'))
+
+
+DEFAULT_POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_recycle': 1800,
+    'pool_timeout': 30,
+}
+
+# 流式读取时每批取回的行数
+STREAM_YIELD_PER = 5000
+
+_lock = threading.Lock()
+_engine = None
+_session_factory = None
+_engine_pid = None
+
+
+def pool_options() -> Dict[str, int]:
+    """连接池参数（环境变量覆盖默认值），供 database.config 传给 create_engine"""
+    options = {
+        name: int(os.environ.get(f"DB_{name.upper()}", default))
+        for name, default in DEFAULT_POOL_OPTIONS.items()
+    }
+    # 取出连接前检查是否仍然可用（服务端断开的连接自动重建）
+    options['pool_pre_ping'] = True
+    return options
+
+
+def _configured_engine():
+    """database.config 中定义的 Engine（engine 变量，或 SessionLocal 绑定的 Engine）"""
+    try:
+        import database.config as database_config
+    except ImportError as e:
+        raise RuntimeError(f"数据库未配置，请检查数据库配置: {e}") from e
+
+    engine = getattr(database_config, 'engine', None)
+    if engine is None:
+        engine = database_config.SessionLocal.kw.get('bind')
+    if engine is None:
+        raise RuntimeError("database.config 中没有找到数据库连接（engine / SessionLocal）")
+    return engine
+
+
+def get_engine():
+    """当前进程共享的 Engine（database.config 中配置的 Engine；fork 出的子进程中丢弃继承的连接后重新使用）"""
+    global _engine, _session_factory, _engine_pid
+
+    if not DATABASE_AVAILABLE:
+        raise RuntimeError("数据库未配置，请检查数据库配置")
+
+    with _lock:
+        if _engine is not None and _engine_pid != os.getpid():
+            _discard_inherited_engine()
+
+        if _engine is None:
+            from sqlalchemy.orm import sessionmaker
+
+            _engine = _configured_engine()
+            _session_factory = sessionmaker(bind=_engine)
+            _engine_pid = os.getpid()
+
+    return _engine
+
+
+def create_session():
+    """从共享连接池创建会话（调用方负责 close）"""
+    get_engine()
+    return _session_factory()
+
+
+@contextmanager
+def session_scope() -> Iterator:
+    """
+    会话上下文: 异常时回滚，结束时关闭（连接归还连接池）
+
+    用法:
+        with session_scope() as db:
+            db.execute(...)
+    """
+    db = create_session()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def stream_rows(db, stmt, yield_per: int = STREAM_YIELD_PER):
+    """
+    流式执行 Core select，返回按行迭代的结果
+
+    使用服务端游标每次取回 yield_per 行，行是元组，不创建 ORM 对象、不进入 identity map，
+    读取大区间（如5分钟线全部历史）时内存只与批大小有关。
+    迭代结束前不要在同一会话上执行其他查询（部分驱动的服务端游标独占连接）
+    """
+    return db.execute(stmt.execution_options(yield_per=yield_per))
+
+
+def dispose_engine():
+    """关闭连接池中的全部连接（进程退出前或切换数据库时调用；Engine 本身仍可继续使用，下次使用时重新建立连接）"""
+    global _engine, _session_factory, _engine_pid
+
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = _session_factory = _engine_pid = None
+
+
+def _discard_inherited_engine():
+    """丢弃从父进程继承的连接池，不关闭底层连接（连接仍属于父进程）"""
+    global _engine, _session_factory, _engine_pid
+
+    if _engine is not None:
+        _engine.dispose(close=False)
+    _engine = _session_factory = _engine_pid = None
+
+
+def _after_fork_in_child():
+    global _lock
+
+    # fork 时其他线程可能持有锁，子进程中重新创建
+    _lock = threading.Lock()
+    _discard_inherited_engine()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -20,9 +20,9 @@ GPU配置模块 - 自动检测并配置GPU加速
 
 作者：AI Training Team
 日期：2024-12-02
-"""
 
-import tensorflow as tf
+TensorFlow 在各函数首次调用时导入（导入本模块不加载 TensorFlow）
+"""
 
 
 def setup_gpu(verbose=True):
@@ -37,6 +37,8 @@ def setup_gpu(verbose=True):
         device_name: 设备名称 (str)
         gpu_count: GPU数量 (int)
     """
+    import tensorflow as tf
+    
     if verbose:
         print("\n" + "="*70)
         print("🖥️  GPU检测与配置")
@@ -104,6 +106,8 @@ def get_gpu_memory_info():
     返回:
         list: 每个GPU的显存信息字典列表
     """
+    import tensorflow as tf
+    
     gpus = tf.config.list_physical_devices('GPU')
     memory_info = []
     
@@ -136,6 +140,8 @@ def set_gpu_memory_limit(memory_limit_mb):
     示例:
         set_gpu_memory_limit(4096)  # 限制为4GB
     """
+    import tensorflow as tf
+    
     gpus = tf.config.list_physical_devices('GPU')
     
     if gpus:
@@ -163,6 +169,8 @@ def disable_gpu():
         - GPU显存不足
         - 测试CPU性能
     """
+    import tensorflow as tf
+    
     try:
         tf.config.set_visible_devices([], 'GPU')
         print("✅ GPU已禁用，将使用CPU训练")
@@ -174,6 +182,8 @@ if __name__ == '__main__':
     """
     测试GPU配置
     """
+    import tensorflow as tf
+    
     print("=" * 70)
     print("GPU配置测试")
     print("=" * 70)
@@ -0,0 +1,206 @@
+"""
+命令行冷启动导入耗时检查
+职责: 在新的 Python 进程中用 -X importtime 导入各命令行模块，统计导入耗时，超过预算时返回非零退出码（可用于 CI）
+功能:
+    1. 每个模块单独启动一个进程测量（不受已导入模块的影响），重复多次取最小值（排除磁盘缓存未命中）
+    2. 解析 -X importtime 输出，得到模块的累计导入耗时和最耗时的直接依赖
+    3. 对比预算（实测基线 × 余量，可用 --budget-ms 覆盖），超出预算或模块自身报错时退出码为 1；
+       尚无实测基线的模块（UNMEASURED_MODULES）只报告耗时
+    4. 缺少依赖导致的导入失败（ModuleNotFoundError / ImportError，如未安装数据库模块、特征提取器未提供）
+       属于环境问题，单独列出，不计入超出预算（--strict 时同样返回 1）
+
+重型依赖（TensorFlow、QuantStats、sklearn/scipy、AutoGluon、数据库模块）应在首次使用时导入，
+新增模块级导入导致超出预算时，这里会列出是哪个依赖。
+
+使用方法:
+    # 检查全部命令行模块
+    python src/ai_training/import_budget.py
+
+    # 缺少依赖无法导入的模块也视为失败（完整环境的 CI 中使用）
+    python src/ai_training/import_budget.py --strict
+
+    # 只检查标签生成器，预算 200ms，显示最耗时的 15 个依赖
+    python src/ai_training/import_budget.py --module src.ai_training.auto_label_generator --budget-ms 200 --top 15
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# 各命令行模块单独导入的实测基线（毫秒，多次测量取最小值）
+# 大部分是第三方依赖本身: numpy 约 65~100ms、pyarrow 约 40ms、sqlalchemy 约 200ms、pandas 约 350ms，
+# 同一台机器上多次测量也会相差 30%~40%，预算在基线上留出余量
+BASELINE_MS = {
+    'src.ai_training.auto_label_generator': 118,
+    'src.ai_training.bar_store': 135,
+    'src.ai_training.kline_data_loader': 100,
+    'src.ai_training.live_indicators': 102,
+    'src.ai_training.gpu_config': 1,
+    'src.ai_training.backtest_trend_model': 470,
+    'src.ai_training.query_advisor': 327,
+}
+
+# 尚无实测基线的命令行模块: 当前环境缺少数据库模块、特征提取器未提供，无法导入测量。
+# 默认同样检查，能导入时只报告耗时、不判定预算；在完整环境中测量后移入 BASELINE_MS
+UNMEASURED_MODULES = (
+    'src.ai_training.data_pipeline',
+    'src.ai_training.inference_server',
+)
+
+# 预算 = 基线 × 余量（不低于 MIN_BUDGET_MS）
+BUDGET_HEADROOM = 2.0
+MIN_BUDGET_MS = 50
+
+DEFAULT_BUDGETS_MS = {
+    module: max(MIN_BUDGET_MS, round(baseline_ms * BUDGET_HEADROOM))
+    for module, baseline_ms in BASELINE_MS.items()
+}
+
+# 视为环境问题（缺少依赖）的导入错误
+ENVIRONMENT_ERRORS = ('ModuleNotFoundError', 'ImportError')
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, float, float]]:
+    """
+    解析 -X importtime 输出
+
+    返回:
+        [(模块名, 嵌套深度, 自身耗时ms, 累计耗时ms), ...]（顺序与输出一致：依赖在前，导入它的模块在后）
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表头
+        name_field = fields[2].rstrip()
+        name = name_field.lstrip()
+        depth = (len(name_field) - len(name) - 1) // 2
+        entries.append((name, depth, int(fields[0]) / 1000, int(fields[1]) / 1000))
+    return entries
+
+
+def measure_import(module: str, python: str = sys.executable) -> Dict:
+    """
+    在新进程中导入模块并统计耗时
+
+    返回:
+        {'module', 'total_ms', 'children': [(依赖名, 累计ms), ...], 'error', 'environment'}
+        children 为模块的直接依赖，按累计耗时降序；environment 表示错误是缺少依赖导致的导入失败
+    """
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    report = {'module': module, 'total_ms': None, 'children': [], 'error': None, 'environment': False}
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        report['error'] = lines[-1] if lines else f"退出码 {result.returncode}"
+        report['environment'] = report['error'].split(':', 1)[0] in ENVIRONMENT_ERRORS
+        return report
+
+    children = []
+    for name, depth, _, cumulative_ms in parse_importtime(result.stderr):
+        if depth == 0 and name == module:
+            report['total_ms'] = cumulative_ms
+            report['children'] = sorted(children, key=lambda item: item[1], reverse=True)
+            break
+        if depth == 0:
+            # 目标模块之前的其他顶层导入（如包的父模块）
+            children = []
+        elif depth == 1:
+            children.append((name, cumulative_ms))
+
+    if report['total_ms'] is None:
+        report['error'] = "importtime 输出中没有找到该模块"
+    return report
+
+
+def check_budget(module: str, budget_ms: Optional[float], repeat: int = 3) -> Dict:
+    """
+    多次测量取耗时最小的一次，与预算对比（budget_ms 为 None 时只测量，能导入即为 'ok'）
+
+    返回的 status: 'ok' 预算内 / 'over' 超出预算 / 'environment' 缺少依赖无法导入 / 'error' 模块自身报错
+    """
+    best = None
+    for _ in range(max(1, repeat)):
+        report = measure_import(module)
+        if report['error'] is not None:
+            best = report
+            break
+        if best is None or report['total_ms'] < best['total_ms']:
+            best = report
+
+    best['budget_ms'] = budget_ms
+    if best['error'] is not None:
+        best['status'] = 'environment' if best['environment'] else 'error'
+    else:
+        best['status'] = 'ok' if budget_ms is None or best['total_ms'] <= budget_ms else 'over'
+    return best
+
+
+def print_report(report: Dict, top: int = 8):
+    """打印一个模块的检查结果"""
+    if report['status'] == 'environment':
+        print(f"⚠️ {report['module']}: 缺少依赖，无法导入 ({report['error']})")
+        return
+    if report['status'] == 'error':
+        print(f"❌ {report['module']}: 导入失败 ({report['error']})")
+        return
+
+    if report['budget_ms'] is None:
+        print(f"ℹ️ {report['module']}: {report['total_ms']:.0f} ms (尚无实测基线，不判定预算)")
+    else:
+        flag = '✅' if report['status'] == 'ok' else '❌'
+        print(f"{flag} {report['module']}: {report['total_ms']:.0f} ms (预算 {report['budget_ms']:.0f} ms)")
+    for name, cumulative_ms in report['children'][:top]:
+        print(f"     {cumulative_ms:>8.1f} ms  {name}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口，返回退出码"""
+    parser = argparse.ArgumentParser(description='命令行冷启动导入耗时检查（-X importtime）')
+    parser.add_argument('--module', type=str, nargs='*', default=None,
+                        help='要检查的模块（默认: DEFAULT_BUDGETS_MS 和 UNMEASURED_MODULES 中的全部命令行模块）')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='导入耗时预算（毫秒），覆盖默认预算')
+    parser.add_argument('--repeat', type=int, default=3, help='每个模块测量次数，取最小值 (默认: 3)')
+    parser.add_argument('--top', type=int, default=5, help='显示最耗时的直接依赖数 (默认: 5)')
+    parser.add_argument('--strict', action='store_true',
+                        help='缺少依赖导致的导入失败也返回非零退出码')
+
+    args = parser.parse_args(argv)
+
+    modules = args.module or list(DEFAULT_BUDGETS_MS) + list(UNMEASURED_MODULES)
+    failed = []
+    unavailable = []
+    for module in modules:
+        budget_ms = args.budget_ms if args.budget_ms is not None else DEFAULT_BUDGETS_MS.get(module)
+        if budget_ms is None and module not in UNMEASURED_MODULES:
+            print(f"⚠️ {module}: 没有默认预算，请用 --budget-ms 指定")
+            failed.append(module)
+            continue
+        report = check_budget(module, budget_ms, args.repeat)
+        print_report(report, args.top)
+        if report['status'] == 'environment':
+            unavailable.append(module)
+        elif report['status'] != 'ok':
+            failed.append(module)
+
+    print()
+    if unavailable:
+        print(f"⚠️ {len(unavailable)} 个模块因缺少依赖未检查: {', '.join(unavailable)}")
+    if failed:
+        print(f"❌ {len(failed)} 个模块超出导入预算或导入失败: {', '.join(failed)}")
+        return 1
+    checked = len(modules) - len(unavailable)
+    print(f"✅ 已检查的 {checked} 个模块在导入预算内")
+    return 1 if unavailable and args.strict else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
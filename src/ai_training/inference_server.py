@@ -0,0 +1,366 @@
+"""
+在线推理服务
+职责: 常驻进程一次性加载管道状态（imputer/scaler/特征名）和模型，通过本地HTTP接口批量返回趋势概率，
+      选股任务无需每次扫描都重启Python、重新加载 joblib 状态和模型
+功能:
+    1. InferenceService: 读取K线 → 提取特征 → 融合填充+标准化（CompiledPreprocessor，预分配缓冲区原地计算）→ 模型概率
+    2. MicroBatcher: 把并发到达的请求合并为一个批次（最多 max_batch 条或等待 max_wait_ms），
+       所有推理在同一个后台线程中执行（数据库会话和模型不跨线程共享）
+    3. HTTP接口（标准库 ThreadingHTTPServer）:
+       GET  /health   → {"status": "ok", ...}
+       POST /predict  → 请求 {"samples": [["600000", "2025-11-28"], ...]}
+                        返回 {"results": [{"stock_code", "date", "probabilities": {"down_trend", "sideways", "up_trend"}}
+                                          或 {"stock_code", "date", "error"}]}（与请求顺序一致）
+                        error 区分K线不足/日期格式错误/K线读取失败；读取器整体失败（如数据库未连接）时返回 500
+    4. request_predictions(): 调用服务的客户端函数
+
+使用方法:
+    # 启动服务（--model 为目录时按 AutoGluon TabularPredictor 加载，为文件时按 joblib 加载含 predict_proba 的模型）
+    python src/ai_training/inference_server.py --state ./models/production_v1/data_pipeline.pkl --model ./models/production_v1
+
+    # 使用本地K线库（不连接数据库）
+    python src/ai_training/inference_server.py --state ... --model ... --bar-store ./bar_store
+
+    # 选股任务中调用
+    from src.ai_training.inference_server import request_predictions
+    results = request_predictions('http://127.0.0.1:8765', [('600000', '2025-11-28'), ('000001', '2025-11-28')])
+"""
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ai_training.kline_data_loader import (
+    SKIP_ERROR, SKIP_INSUFFICIENT_BARS, SKIP_INVALID_DATE, StockImageAnalyzer
+)
+from src.ai_training.feature_extractor import extract_features_sequence_from_kline_data
+from src.ai_training.data_pipeline.processors import CompiledPreprocessor
+
+# AutoGluon 只检查是否安装，加载目录格式的模型时才导入（--help 等不加载）
+HAS_AUTOGLUON = importlib.util.find_spec('autogluon') is not None
+
+
+# 类别顺序与 AutoDataPipeline 的标签一致: 0=down_trend, 1=sideways, 2=up_trend
+TREND_CLASSES = ['down_trend', 'sideways', 'up_trend']
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_WAIT_MS = 10
+
+# 读取器跳过样本的原因 → 返回给客户端的错误信息
+SKIP_ERRORS = {
+    SKIP_INSUFFICIENT_BARS: 'K线数据不足或不存在',
+    SKIP_INVALID_DATE: '日期格式错误',
+    SKIP_ERROR: 'K线读取失败',
+}
+
+
+class InferenceService:
+    """推理服务核心（状态和模型只加载一次，非线程安全，由 MicroBatcher 串行调用）"""
+
+    def __init__(self, state_path: str, model_path: str, period: Optional[str] = None,
+                 bar_store=None, max_batch: int = DEFAULT_MAX_BATCH):
+        """
+        参数:
+            state_path: AutoDataPipeline.save_state() 保存的状态文件
+            model_path: 模型目录（AutoGluon）或 joblib 模型文件（需有 predict_proba）
+            period: K线周期（默认取状态中的 metadata['period']）
+            bar_store: 本地K线库（默认按状态中的 config['bar_store_dir'] 创建，未配置时连接数据库）
+            max_batch: 单批最大样本数（预分配缓冲区的行数）
+        """
+        import joblib
+
+        state = joblib.load(state_path)
+        self.feature_names = state['feature_names']
+        self.period = period or state['metadata'].get('period', 'day')
+        self.max_batch = max_batch
+
+        if self.feature_names is None:
+            raise ValueError(f"状态文件缺少特征名（请在 engineer_features 之后保存）: {state_path}")
+
+        self.preprocessor = CompiledPreprocessor(state['imputer'], state['scaler'], len(self.feature_names))
+        self._buffer = np.empty((max_batch, len(self.feature_names)), dtype=np.float32)
+
+        self.model = self._load_model(model_path)
+        # 目录格式为 AutoGluon TabularPredictor（输入为带特征名的 DataFrame）
+        self._is_autogluon = os.path.isdir(model_path)
+
+        config = state.get('config') or {}
+        if bar_store is None and config.get('bar_store_dir'):
+            from src.ai_training.bar_store import MemmapBarStore
+            bar_store = MemmapBarStore(config['bar_store_dir'])
+        self.analyzer = StockImageAnalyzer(enable_database=bar_store is None, bar_store=bar_store)
+
+    def _preprocess(self, features: Sequence[np.ndarray]) -> np.ndarray:
+        """特征写入预分配缓冲区，原地完成填充+标准化"""
+        out = self._buffer[:len(features)]
+        for i, matrix in enumerate(features):
+            out[i] = np.asarray(matrix, dtype=np.float32).reshape(-1)
+        return self.preprocessor.transform_into(out)
+
+    @staticmethod
+    def _load_model(model_path: str):
+        if os.path.isdir(model_path):
+            if not HAS_AUTOGLUON:
+                raise ImportError("模型为目录格式，需要安装 AutoGluon: pip install autogluon")
+            from autogluon.tabular import TabularPredictor
+            return TabularPredictor.load(model_path)
+
+        import joblib
+        return joblib.load(model_path)
+
+    def _predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """模型概率，列顺序为 TREND_CLASSES"""
+        if self._is_autogluon:
+            import pandas as pd
+            proba = self.model.predict_proba(pd.DataFrame(X, columns=self.feature_names, copy=False))
+            return proba.reindex(columns=range(len(TREND_CLASSES)), fill_value=0.0).to_numpy()
+
+        proba = np.asarray(self.model.predict_proba(X))
+        classes = list(getattr(self.model, 'classes_', range(proba.shape[1])))
+        result = np.zeros((len(X), len(TREND_CLASSES)))
+        for j, label in enumerate(classes):
+            result[:, int(label)] = proba[:, j]
+        return result
+
+    def _extract_features(self, items: List[Dict]) -> List[Optional[np.ndarray]]:
+        """逐样本提取特征，失败的样本为 None"""
+        features = []
+        for item in items:
+            try:
+                features.append(extract_features_sequence_from_kline_data(
+                    item['kline_data'], item['period'], item.get('market_index_klines'), item.get('stock_code')
+                ))
+            except Exception:
+                features.append(None)
+        return features
+
+    def predict(self, samples: Sequence[Tuple[str, str]]) -> List[Dict]:
+        """
+        批量预测
+
+        参数:
+            samples: [(stock_code, date), ...]（日期格式同训练数据: 日线 '2025-11-28'，分钟线 '2025-11-28 14:30:00'）
+
+        返回:
+            与 samples 顺序一致的结果列表
+        """
+        results = []
+        for start in range(0, len(samples), self.max_batch):
+            results.extend(self._predict_batch(list(samples[start:start + self.max_batch])))
+        return results
+
+    def _predict_batch(self, samples: List[Tuple[str, str]]) -> List[Dict]:
+        # 读取器逐条打印进度，服务中关闭（redirect_stdout 作用于整个进程，会吞掉其他线程的输出）
+        skip_reasons = {}
+        items = self.analyzer.get_training_data_from_samples(
+            self.period, samples, verbose=False, skip_reasons=skip_reasons
+        )
+        if items is None:
+            # 没有有效样本时读取器也返回 None：每个样本都有跳过原因时按样本返回错误，否则是读取器整体失败
+            if not all((code, str(date)) in skip_reasons for code, date in samples):
+                raise RuntimeError("K线读取失败（数据库未连接或读取器出错）")
+            items = []
+        by_key = {(item['stock_code'], item['trade_date']): item for item in items}
+
+        found = [i for i, (code, date) in enumerate(samples) if (code, str(date)) in by_key]
+        features = self._extract_features([by_key[(samples[i][0], str(samples[i][1]))] for i in found])
+
+        valid = [(i, matrix) for i, matrix in zip(found, features) if matrix is not None]
+        proba = None
+        if valid:
+            proba = self._predict_proba(self._preprocess([matrix for _, matrix in valid]))
+
+        results = [{'stock_code': code, 'date': str(date),
+                    'error': SKIP_ERRORS.get(skip_reasons.get((code, str(date))), 'K线读取失败')}
+                   for code, date in samples]
+        for i in found:
+            results[i]['error'] = '特征提取失败'
+        for row, (i, _) in enumerate(valid):
+            code, date = samples[i]
+            results[i] = {
+                'stock_code': code,
+                'date': str(date),
+                'probabilities': {label: float(p) for label, p in zip(TREND_CLASSES, proba[row])},
+            }
+        return results
+
+
+class MicroBatcher:
+    """请求合并器：后台线程收集请求，凑满 max_batch 条或等待 max_wait_ms 后一次性推理"""
+
+    def __init__(self, service: InferenceService, max_batch: int = DEFAULT_MAX_BATCH,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.service = service
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: 'queue.Queue[Tuple[List, Future]]' = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, samples: List[Tuple[str, str]]) -> Future:
+        """提交一组样本，返回 Future（结果为与 samples 顺序一致的列表）"""
+        future = Future()
+        self._queue.put((samples, future))
+        return future
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            count = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(request)
+                count += len(request[0])
+
+            samples = [sample for request_samples, _ in pending for sample in request_samples]
+            try:
+                results = self.service.predict(samples)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_samples, future in pending:
+                future.set_result(results[offset:offset + len(request_samples)])
+                offset += len(request_samples)
+
+
+def _parse_samples(payload) -> List[Tuple[str, str]]:
+    """请求体中的样本: [["600000", "2025-11-28"], ...] 或 [{"stock_code": ..., "date": ...}, ...]"""
+    samples = []
+    for sample in payload.get('samples', []):
+        if isinstance(sample, dict):
+            samples.append((str(sample['stock_code']), str(sample['date'])))
+        else:
+            stock_code, date = sample
+            samples.append((str(stock_code), str(date)))
+    return samples
+
+
+def make_handler(batcher: MicroBatcher, period: str):
+    """创建绑定到 batcher 的请求处理类"""
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: Dict):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'period': period, 'classes': TREND_CLASSES})
+            else:
+                self._send_json(404, {'error': f'未知路径: {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': f'未知路径: {self.path}'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                samples = _parse_samples(json.loads(self.rfile.read(length) or b'{}'))
+            except Exception as e:
+                self._send_json(400, {'error': f'请求格式错误: {e}'})
+                return
+
+            try:
+                results = batcher.submit(samples).result() if samples else []
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'results': results})
+
+        def log_message(self, format, *args):
+            # 不逐条打印访问日志
+            pass
+
+    return InferenceHandler
+
+
+def serve(service: InferenceService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS) -> ThreadingHTTPServer:
+    """创建HTTP服务（调用方执行 serve_forever()）"""
+    batcher = MicroBatcher(service, max_batch, max_wait_ms)
+    return ThreadingHTTPServer((host, port), make_handler(batcher, service.period))
+
+
+def request_predictions(url: str, samples: Sequence[Tuple[str, str]], timeout: float = 300) -> List[Dict]:
+    """
+    调用推理服务
+
+    参数:
+        url: 服务地址（如 'http://127.0.0.1:8765'）
+        samples: [(stock_code, date), ...]
+
+    返回:
+        与 samples 顺序一致的结果列表（见模块说明）
+    """
+    from urllib.request import Request, urlopen
+
+    body = json.dumps({'samples': [list(sample) for sample in samples]}).encode('utf-8')
+    request = Request(url.rstrip('/') + '/predict', data=body, headers={'Content-Type': 'application/json'})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在线推理服务（常驻加载管道状态和模型）')
+    parser.add_argument('--state', type=str, required=True, help='AutoDataPipeline.save_state() 保存的状态文件')
+    parser.add_argument('--model', type=str, required=True, help='模型目录（AutoGluon）或 joblib 模型文件')
+    parser.add_argument('--period', type=str, default=None, help='K线周期（默认取状态文件中的周期）')
+    parser.add_argument('--bar-store', type=str, default=None,
+                        help='本地K线库目录（指定后从本地库读取，不连接数据库）')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'监听地址（默认 {DEFAULT_HOST}）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口（默认 {DEFAULT_PORT}）')
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help=f'单批最大样本数（默认 {DEFAULT_MAX_BATCH}）')
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help=f'合并请求的最长等待毫秒数（默认 {DEFAULT_MAX_WAIT_MS}）')
+    args = parser.parse_args()
+
+    bar_store = None
+    if args.bar_store:
+        from src.ai_training.bar_store import MemmapBarStore
+        bar_store = MemmapBarStore(args.bar_store)
+
+    print("📦 加载管道状态和模型...")
+    service = InferenceService(args.state, args.model, args.period, bar_store, args.max_batch)
+    server = serve(service, args.host, args.port, args.max_batch, args.max_wait_ms)
+
+    print(f"✅ 推理服务已启动: http://{args.host}:{args.port}  (周期: {service.period})")
+    print("   POST /predict  {\"samples\": [[\"600000\", \"2025-11-28\"], ...]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ 服务已停止")
+    finally:
+        server.server_close()
+        service.analyzer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,20 +4,233 @@
 功能:
     1. 从数据库读取指定股票和日期的K线数据
     2. 支持多周期K线数据读取（日线、周线、5分钟、15分钟、30分钟、1小时）
-    3. 从JSON文件批量读取训练数据
+    3. 从JSON/JSONL文件批量读取训练数据（支持按股票分组的批量窗口读取）
 """
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from collections import defaultdict
+from itertools import groupby
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+import math
 import os
 import sys
+import threading
 
-# 导入数据库配置
-try:
-    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-    from database.config import SessionLocal
-    DATABASE_AVAILABLE = True
-except ImportError:
+import numpy as np
+
+# 数据库会话从共享连接池创建（sqlalchemy 和数据库模块在首次创建会话时才导入）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.ai_training.db_session import DATABASE_AVAILABLE, create_session, stream_rows
+
+if not DATABASE_AVAILABLE:
     print("⚠️ 数据库未配置,将无法使用数据库数据")
-    DATABASE_AVAILABLE = False
+
+from src.ai_training.kline_window import KlineWindow
+
+
+# 各周期每根K线大约覆盖的自然日天数（含周末/节假日），批量模式据此估算区间查询的日期跨度
+PERIOD_CALENDAR_DAYS_PER_BAR = {
+    'day': 1.6,
+    'week': 7.5,
+    '1hour': 0.4,
+    'bs': 0.4,
+    '30min': 0.2,
+    '15min': 0.1,
+    '5min': 0.035,
+}
+
+# 批量模式下每条区间查询包含的股票数
+BATCH_STOCKS_PER_QUERY = 200
+
+# 并发预取时默认同时进行的查询数（每个线程一个独立会话，注意不要超过连接池大小）
+DEFAULT_QUERY_CONCURRENCY = 8
+
+# 样本跳过原因（get_training_data_from_samples 的 skip_reasons）
+# 只有 K线不足是确定的结果（可缓存），查询出错、日期格式错误下次可能成功
+SKIP_INSUFFICIENT_BARS = 'insufficient_bars'
+SKIP_INVALID_DATE = 'invalid_date'
+SKIP_ERROR = 'error'
+
+# 5个板块指数（用于F08_01的5个特征）
+MARKET_INDEX_CODES = [
+    'sh.000001',  # 上证指数
+    'sz.399001',  # 深证成指
+    'sz.399006',  # 创业板指
+    'sh.000688',  # 科创50
+    'bj.899050'   # 北证50
+]
+
+# 各周期K线表的日期字段名
+DATE_FIELD_MAP = {
+    'day': 'trade_date',
+    'week': 'trade_date',
+    '5min': 'trade_datetime',
+    '15min': 'trade_datetime',
+    '30min': 'trade_datetime',
+    '1hour': 'trade_datetime',
+    'bs': 'trade_datetime',  # 买卖点使用小时线的trade_datetime
+}
+
+
+def get_kline_model(period: str):
+    """
+    获取周期对应的K线ORM模型
+
+    返回:
+        K线模型类，不支持的周期返回 None
+    """
+    from database.models import stock_kline_day, stock_kline_week
+    from database.models import stock_kline_5min, stock_kline_15min
+    from database.models import stock_kline_30min, stock_kline_1hour
+
+    model_map = {
+        'day': stock_kline_day.StockKlineDay,
+        'week': stock_kline_week.StockKlineWeek,
+        '5min': stock_kline_5min.StockKline5Min,
+        '15min': stock_kline_15min.StockKline15Min,
+        '30min': stock_kline_30min.StockKline30Min,
+        '1hour': stock_kline_1hour.StockKline1Hour,
+        'bs': stock_kline_1hour.StockKline1Hour,  # 买卖点使用小时线表
+    }
+    return model_map.get(period)
+
+
+def parse_kline_date(value, date_field: str):
+    """
+    将日期字符串转换为查询条件使用的 date/datetime（非字符串原样返回）
+
+    规则:
+        - 日线/周线 (trade_date): 'YYYY-MM-DD' 或 'YYYY-MM-DD HH:MM:SS'，都取日期部分
+        - 分钟线/小时线 (trade_datetime): 'YYYY-MM-DD HH:MM:SS' 为该时刻；
+          只有日期的 'YYYY-MM-DD' 表示当天收盘，即当天 23:59:59（含当天最后一根K线）
+    """
+    from datetime import datetime
+
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    has_time = len(value) > 10
+    parsed = datetime.strptime(value, '%Y-%m-%d %H:%M:%S' if has_time else '%Y-%m-%d')
+    if date_field == 'trade_date':
+        return parsed.date()
+    return parsed if has_time else parsed.replace(hour=23, minute=59, second=59)
+
+
+def kline_columns(KlineModel, date_field: str) -> List:
+    """K线窗口对应的查询列: (日期, open, high, low, close, volume)"""
+    return [
+        getattr(KlineModel, date_field),
+        KlineModel.open,
+        KlineModel.high,
+        KlineModel.low,
+        KlineModel.close,
+        KlineModel.volume,
+    ]
+
+
+def find_training_data_file(trend_dir) -> Optional[str]:
+    """
+    查找类别目录下的训练数据文件（优先 data.jsonl，其次旧格式 data.json）
+
+    返回:
+        文件路径，均不存在时返回 None
+    """
+    for name in ('data.jsonl', 'data.json'):
+        path = os.path.join(str(trend_dir), name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_training_samples(file_path: str) -> Tuple[Optional[str], List[Tuple[str, Any]]]:
+    """
+    读取训练样本列表（兼容 JSON 与 JSON Lines 两种格式）
+
+    JSON格式（每只股票一个样本）:
+        {"type": "day", "data": {"600000": {"date": "2025-11-29", "return": 0.052}, "600002": "2025-11-27"}}
+
+    JSON Lines格式（按 (股票代码, 日期) 保存，同一股票可有多个样本）:
+        meta.json:  {"type": "day", "generation_params": {...}}   // 与 data.jsonl 同目录
+        data.jsonl: {"stock_code": "600000", "date": "2025-11-29", "return": 0.052}
+
+    返回:
+        (period, [(stock_code, date_info), ...])，date_info 为日期字符串或 {"date": ..., "return": ...}
+    """
+    import json
+
+    if file_path.endswith('.jsonl'):
+        with open(os.path.join(os.path.dirname(file_path), 'meta.json'), 'r', encoding='utf-8') as f:
+            period = json.load(f).get('type')
+
+        samples = []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                samples.append((row['stock_code'], {'date': row['date'], 'return': row.get('return')}))
+        return period, samples
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return config.get('type'), list(config.get('data', {}).items())
+
+
+class IndexSeriesStore:
+    """指数日线列式缓存
+    
+    每个指数的全部日线历史只查询一次数据库，按日期升序存入结构化数组；
+    "截止到某日的N根K线" 通过二分查找 + 切片得到（返回视图，不复制数据）。
+    
+    返回的 KlineWindow 支持与ORM对象相同的属性访问: klines[-1].close, klines[0].trade_date
+    """
+    
+    def __init__(self, db, bar_store=None):
+        """
+        参数:
+            db: 数据库会话
+            bar_store: 本地K线库（指定时从本地库读取，不访问数据库）
+        """
+        self.db = db
+        self.bar_store = bar_store
+        self._series: Dict[str, KlineWindow] = {}
+    
+    def get_series(self, index_code: str) -> KlineWindow:
+        """获取指数的全部日线历史（首次访问时从数据库/本地K线库加载）"""
+        series = self._series.get(index_code)
+        if series is None and self.bar_store is not None:
+            series = self.bar_store.read_index(index_code)
+            self._series[index_code] = series
+        if series is None:
+            from sqlalchemy import select
+            from database.models.index_kline_day import IndexKlineDay
+            
+            series = KlineWindow.from_rows(stream_rows(
+                self.db,
+                select(*kline_columns(IndexKlineDay, 'trade_date')).where(
+                    IndexKlineDay.index_code == index_code
+                ).order_by(IndexKlineDay.trade_date.asc())
+            ), 'trade_date')
+            self._series[index_code] = series
+        return series
+    
+    def get_window(self, index_code: str, trade_date, count: int = 120) -> Optional[KlineWindow]:
+        """
+        获取截止到 trade_date（含）的最近 count 根指数K线
+        
+        返回:
+            KlineWindow: 时间正序的K线视图，不足 count 根时返回 None
+        """
+        series = self.get_series(index_code)
+        pos = int(np.searchsorted(series.trade_date, np.datetime64(trade_date, 'D'), side='right'))
+        if pos < count:
+            return None
+        return series[pos - count:pos]
+    
+    def clear(self):
+        """清空缓存"""
+        self._series.clear()
 
 
 class StockImageAnalyzer:
@@ -27,29 +240,57 @@ class StockImageAnalyzer:
         - 从数据库读取K线数据
         - 支持多周期K线数据读取
         - 从JSON文件批量读取训练数据
+        - 可使用本地K线库（bar_store）替代数据库
     """
     
-    def __init__(self, enable_database=True):
+    def __init__(self, enable_database=True, use_index_cache=True, bar_store=None, db=None):
+        """
+        参数:
+            enable_database: 是否连接数据库
+            use_index_cache: 是否使用指数日线列式缓存（每个指数只查询一次数据库）
+            bar_store: 本地K线库（BarStore / MemmapBarStore），指定后所有K线均从本地库读取
+            db: 外部传入的数据库会话（由调用方关闭）；默认从共享连接池创建，close() 时关闭
+        """
         # 初始化数据库连接
-        self.db = None
-        if enable_database and DATABASE_AVAILABLE:
+        self.db = db
+        self._owns_db = False
+        self.index_store = None
+        self.bar_store = bar_store
+        if db is None and enable_database and DATABASE_AVAILABLE:
             try:
-                self.db = SessionLocal()
+                self.db = create_session()
+                self._owns_db = True
                 print("✅ 数据库连接成功")
             except Exception as e:
                 print(f"⚠️ 数据库连接失败: {e}")
                 self.db = None
+        
+        if bar_store is not None:
+            self.index_store = IndexSeriesStore(self.db, bar_store)
+        elif self.db is not None and use_index_cache:
+            self.index_store = IndexSeriesStore(self.db)
     
-    def __del__(self):
-        """析构函数 - 关闭数据库连接"""
-        if self.db:
+    def close(self):
+        """关闭自己创建的数据库会话（连接归还连接池），外部传入的会话由调用方关闭"""
+        if getattr(self, '_owns_db', False) and self.db is not None:
             try:
                 self.db.close()
-            except:
+            except Exception:
                 pass
+            self._owns_db = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        """析构函数 - 关闭数据库连接"""
+        self.close()
     
     def get_kline_data_from_db(self, stock_code: str, trade_date: str, 
-                               period: str = 'day', count: int = 120) -> Optional[List]:
+                               period: str = 'day', count: int = 120) -> Optional[KlineWindow]:
         """
         从数据库读取K线数据（含计算均线所需的历史数据）
         
@@ -61,51 +302,35 @@ class StockImageAnalyzer:
         
         参数:
             stock_code: 股票代码 (如 '000001')
-            trade_date: 最右侧第1根K线的日期 (如 '2025-11-28')
+            trade_date: 最右侧第1根K线的日期（date/datetime 或字符串，字符串按 parse_kline_date 解析）
+                - day/week: '2025-11-28'（也接受 '2025-11-28 15:00:00'，只取日期）
+                - 5min/15min/30min/1hour: '2025-11-28 14:30:00' 取该时刻及之前的K线；
+                  '2025-11-28' 取截止到当天最后一根的K线
             period: 周期 ('day', '5min', '15min', '30min', '1hour', 'week')
             count: 需要的K线数量 (默认120，包含历史数据)
         
         返回:
-            list: K线数据列表(长度>=count)，或 None
+            KlineWindow: K线窗口(长度>=count，时间正序)，或 None
         """
-        if not self.db:
+        if not self.db and self.bar_store is None:
             return None
         
         try:
-            from database.models import stock_kline_day, stock_kline_week
-            from database.models import stock_kline_5min, stock_kline_15min
-            from database.models import stock_kline_30min, stock_kline_1hour
-            from datetime import datetime
-            
-            # 选择对应的表
-            model_map = {
-                'day': stock_kline_day.StockKlineDay,
-                'week': stock_kline_week.StockKlineWeek,
-                '5min': stock_kline_5min.StockKline5Min,
-                '15min': stock_kline_15min.StockKline15Min,
-                '30min': stock_kline_30min.StockKline30Min,
-                '1hour': stock_kline_1hour.StockKline1Hour,
-                'bs': stock_kline_1hour.StockKline1Hour,  # 买卖点使用小时线表
-            }
-            
-            KlineModel = model_map.get(period)
-            if not KlineModel:
+            date_field = DATE_FIELD_MAP.get(period)
+            if not date_field:
                 return None
             
             # 转换日期格式
-            if isinstance(trade_date, str):
-                trade_date = datetime.strptime(trade_date, '%Y-%m-%d').date()
+            trade_date = parse_kline_date(trade_date, date_field)
             
             # 查询K线(从trade_date往前count根，包括第1根)
-            klines = self.db.query(KlineModel).filter(
-                KlineModel.code == stock_code,
-                KlineModel.date <= trade_date
-            ).order_by(KlineModel.date.desc()).limit(count).all()
+            if self.bar_store is not None:
+                klines = self.bar_store.history(period, stock_code, trade_date, count)
+            else:
+                klines = self._query_history_klines(get_kline_model(period), date_field, stock_code, trade_date, count)
             
             # 检查数量是否满足
             if len(klines) >= count:
-                # 按时间正序排列(从旧到新)
-                klines.reverse()
                 return klines
             else:
                 return None
@@ -124,40 +349,306 @@ class StockImageAnalyzer:
             count: 需要的K线数量 (默认120)
         
         返回:
-            list: 指数K线数据列表，或 None
+            KlineWindow: 指数K线窗口（时间正序，启用指数缓存时为视图），或 None
         """
-        if not self.db:
+        if not self.db and self.index_store is None:
             return None
         
         try:
-            from database.models.index_kline_day import IndexKlineDay
             from datetime import datetime
             
             # 转换日期格式
             if isinstance(trade_date, str):
                 trade_date = datetime.strptime(trade_date, '%Y-%m-%d').date()
             
-            # 查询指数K线
-            klines = self.db.query(IndexKlineDay).filter(
-                IndexKlineDay.index_code == index_code,
-                IndexKlineDay.trade_date <= trade_date
-            ).order_by(IndexKlineDay.trade_date.desc()).limit(count).all()
+            # 使用列式缓存：二分查找 + 切片
+            if self.index_store is not None:
+                return self.index_store.get_window(index_code, trade_date, count)
             
-            # 检查数量是否满足
-            if len(klines) >= count:
-                # 按时间正序排列(从旧到新)
-                klines.reverse()
-                return klines
-            else:
-                return None
+            return self._query_index_klines(index_code, trade_date, count)
         
         except Exception as e:
             print(f"    指数数据读取失败: {str(e)[:50]}")
             return None
     
-    def get_training_data_from_json(self, json_file_path: str, include_market_index: bool = True) -> Optional[List[Dict]]:
+    def _query_index_klines(self, index_code: str, trade_date, count: int = 120,
+                            db=None) -> Optional[KlineWindow]:
+        """
+        查询截止到 trade_date（含）的最近 count 根指数K线，不足 count 根时返回 None
+
+        参数:
+            db: 数据库会话（默认 self.db，并发预取时为线程自己的会话）
         """
-        从JSON文件读取训练数据列表，直接从数据库获取K线
+        from sqlalchemy import select
+        from database.models.index_kline_day import IndexKlineDay
+        
+        # 查询指数K线
+        rows = (db or self.db).execute(
+            select(*kline_columns(IndexKlineDay, 'trade_date')).where(
+                IndexKlineDay.index_code == index_code,
+                IndexKlineDay.trade_date <= trade_date
+            ).order_by(IndexKlineDay.trade_date.desc()).limit(count)
+        ).all()
+        
+        # 检查数量是否满足
+        if len(rows) >= count:
+            # 按时间正序排列(从旧到新)
+            rows.reverse()
+            return KlineWindow.from_rows(rows, 'trade_date')
+        return None
+    
+    def _query_history_klines(self, KlineModel, date_field: str, stock_code: str,
+                              date_value, count: int = 120, db=None) -> KlineWindow:
+        """
+        查询截止到 date_value（含）的最近 count 根K线
+
+        参数:
+            db: 数据库会话（默认 self.db，并发预取时为线程自己的会话）
+
+        返回:
+            KlineWindow: 时间正序的K线窗口（可能不足 count 根）
+        """
+        from sqlalchemy import select
+
+        date_column = getattr(KlineModel, date_field)
+        rows = (db or self.db).execute(
+            select(*kline_columns(KlineModel, date_field)).where(
+                KlineModel.stock_code == stock_code,
+                date_column <= date_value
+            ).order_by(date_column.desc()).limit(count)
+        ).all()
+        rows.reverse()
+        return KlineWindow.from_rows(rows, date_field)
+
+    def _query_future_klines(self, KlineModel, date_field: str, stock_code: str,
+                             date_value, count: int = 5, db=None) -> KlineWindow:
+        """
+        查询 date_value 之后的 count 根K线（时间正序）
+        """
+        from sqlalchemy import select
+
+        date_column = getattr(KlineModel, date_field)
+        rows = (db or self.db).execute(
+            select(*kline_columns(KlineModel, date_field)).where(
+                KlineModel.stock_code == stock_code,
+                date_column > date_value
+            ).order_by(date_column.asc()).limit(count)
+        ).all()
+        return KlineWindow.from_rows(rows, date_field)
+
+    def _fetch_windows_batched(self, KlineModel, date_field: str, period: str,
+                               samples: List[Tuple[str, Any]],
+                               history_count: int = 120, future_count: int = 5,
+                               chunk_size: int = BATCH_STOCKS_PER_QUERY) -> Dict[Tuple[str, Any], Tuple[KlineWindow, KlineWindow]]:
+        """
+        批量读取多个样本的历史/未来K线窗口
+
+        规则:
+            1. 按股票分组，根据该股票所有样本日期估算需要的自然日区间
+            2. 每 chunk_size 只股票合并为一条区间查询（OR 连接各股票区间）
+            3. 在内存中用二分查找切出120根历史K线和5根未来K线（切片为视图，不复制）
+            4. 区间估算不足时（长期停牌等），回退到逐条精确查询，结果与逐条模式一致
+
+        参数:
+            KlineModel: K线ORM模型
+            date_field: 日期字段名（trade_date / trade_datetime）
+            period: 周期
+            samples: [(stock_code, date_value), ...]，date_value 为 date/datetime
+            history_count: 历史K线数量（默认120）
+            future_count: 未来K线数量（默认5）
+            chunk_size: 每条查询包含的股票数
+
+        返回:
+            dict: {(stock_code, date_value): (history_klines, future_klines)}
+                  history_klines 为时间正序；不足 history_count 根时原样返回（由调用方判断跳过）
+        """
+        from sqlalchemy import and_, or_, select
+
+        days_per_bar = PERIOD_CALENDAR_DAYS_PER_BAR.get(period, PERIOD_CALENDAR_DAYS_PER_BAR['day'])
+        history_span = timedelta(days=math.ceil(history_count * days_per_bar) + 10)
+        future_span = timedelta(days=math.ceil(future_count * days_per_bar) + 10)
+
+        # 按股票分组
+        dates_by_stock = defaultdict(set)
+        for stock_code, date_value in samples:
+            dates_by_stock[stock_code].add(date_value)
+
+        date_column = getattr(KlineModel, date_field)
+        stock_codes = list(dates_by_stock.keys())
+        windows = {}
+
+        for chunk_start in range(0, len(stock_codes), chunk_size):
+            chunk = stock_codes[chunk_start:chunk_start + chunk_size]
+
+            # 每只股票一个区间：[最早样本日期 - 历史跨度, 最晚样本日期 + 未来跨度]
+            conditions = [
+                and_(
+                    KlineModel.stock_code == stock_code,
+                    date_column >= min(dates_by_stock[stock_code]) - history_span,
+                    date_column <= max(dates_by_stock[stock_code]) + future_span
+                )
+                for stock_code in chunk
+            ]
+
+            # 流式读取（按股票代码排序），每只股票的行直接写入K线窗口；
+            # 读取完整个分块后才执行补充查询（服务端游标未读完时不能在同一连接上执行其他查询）
+            rows = stream_rows(
+                self.db,
+                select(KlineModel.stock_code, *kline_columns(KlineModel, date_field)).where(
+                    or_(*conditions)
+                ).order_by(KlineModel.stock_code, date_column)
+            )
+            klines_by_stock = {
+                stock_code: KlineWindow.from_rows((row[1:] for row in stock_rows), date_field)
+                for stock_code, stock_rows in groupby(rows, key=lambda row: row[0])
+            }
+
+            for stock_code in chunk:
+                klines = klines_by_stock.pop(stock_code, None)
+                if klines is None:
+                    klines = KlineWindow.empty(date_field)
+                kline_dates = klines.dates
+
+                for date_value in dates_by_stock[stock_code]:
+                    pos = int(np.searchsorted(
+                        kline_dates, np.datetime64(date_value).astype(kline_dates.dtype), side='right'
+                    ))
+
+                    # 区间内已有足够的历史K线，切片结果与精确查询一致
+                    if pos >= history_count:
+                        history = klines[pos - history_count:pos]
+                    else:
+                        history = self._query_history_klines(
+                            KlineModel, date_field, stock_code, date_value, history_count
+                        )
+
+                    future = klines[pos:pos + future_count]
+                    if len(future) < future_count:
+                        future = self._query_future_klines(
+                            KlineModel, date_field, stock_code, date_value, future_count
+                        )
+
+                    windows[(stock_code, date_value)] = (history, future)
+
+        return windows
+    
+    def _run_concurrent(self, fn: Callable, keys: Iterable, concurrency: int) -> Dict:
+        """
+        在线程池中对每个 key 执行 fn(key, db)，同时进行的查询不超过 concurrency 个
+
+        每个线程使用自己的数据库会话（Session 不能跨线程共享），结束后全部关闭。
+        只提交到上限，完成一个再提交下一个（背压），不会一次性堆积全部任务。
+        执行失败的 key 不出现在结果中（由调用方按原逻辑逐条查询），结束时打印失败数和第一个错误
+
+        返回:
+            {key: fn 的返回值}
+        """
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+
+        def run(key):
+            db = getattr(local, 'db', None)
+            if db is None:
+                db = local.db = create_session()
+                with sessions_lock:
+                    sessions.append(db)
+            return fn(key, db)
+
+        results = {}
+        failed = 0
+        first_error = None
+        keys = iter(keys)
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                in_flight = {}
+                while True:
+                    for key in keys:
+                        in_flight[executor.submit(run, key)] = key
+                        if len(in_flight) >= concurrency:
+                            break
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = in_flight.pop(future)
+                        error = future.exception()
+                        if error is None:
+                            results[key] = future.result()
+                        else:
+                            failed += 1
+                            if first_error is None:
+                                first_error = error
+        finally:
+            for db in sessions:
+                try:
+                    db.close()
+                except Exception:
+                    pass
+
+        if failed:
+            print(f"  ⚠️ 并发查询失败 {failed} 个（改为逐条查询），首个错误: "
+                  f"{type(first_error).__name__}: {str(first_error)[:50]}")
+        return results
+
+    def _prefetch_windows(self, KlineModel, date_field: str, tasks: List[Tuple[Any, str, Any]],
+                          concurrency: int, history_count: int = 120,
+                          future_count: int = 5) -> Dict[Any, Tuple[KlineWindow, KlineWindow]]:
+        """
+        并发读取逐条模式下每个样本的历史/未来K线（查询与逐条模式完全相同）
+
+        参数:
+            tasks: [(窗口键, stock_code, date_value), ...]
+
+        返回:
+            {窗口键: (history_klines, future_klines)}
+        """
+        queries = {key: (stock_code, date_value) for key, stock_code, date_value in tasks}
+
+        def fetch(key, db):
+            stock_code, date_value = queries[key]
+            history = self._query_history_klines(KlineModel, date_field, stock_code, date_value, history_count, db=db)
+            if len(history) < history_count:
+                # 不足时不会用到未来K线
+                return history, None
+            future = self._query_future_klines(KlineModel, date_field, stock_code, date_value, future_count, db=db)
+            return history, future
+
+        return self._run_concurrent(fetch, list(queries), concurrency)
+
+    def _prefetch_index_windows(self, index_dates: Iterable[str], concurrency: int,
+                                count: int = 120) -> Dict[Tuple[str, str], Optional[KlineWindow]]:
+        """
+        并发读取各日期的5个板块指数K线（未启用指数缓存时使用，同一日期只查询一次）
+
+        返回:
+            {(index_date, index_code): KlineWindow 或 None}
+        """
+        from datetime import datetime
+
+        def fetch(key, db):
+            index_date, index_code = key
+            return self._query_index_klines(
+                index_code, datetime.strptime(index_date, '%Y-%m-%d').date(), count, db=db
+            )
+
+        keys = [(index_date, index_code) for index_date in sorted(set(index_dates))
+                for index_code in MARKET_INDEX_CODES]
+        return self._run_concurrent(fetch, keys, concurrency)
+
+    @staticmethod
+    def _index_date(period: str, trade_date: str) -> str:
+        """样本对应的指数日期：取日期部分（'2025-11-29 14:30:00' -> '2025-11-29'，日期字符串不变）"""
+        return trade_date.split(' ')[0]
+
+    def get_training_data_from_json(self, json_file_path: str, include_market_index: bool = True,
+                                    batch_mode: bool = True, concurrency: int = 1) -> Optional[List[Dict]]:
+        """
+        从JSON/JSONL文件读取训练数据列表，直接从数据库获取K线
+        
+        JSON Lines格式（推荐，同一股票可有多个样本，见 read_training_samples）:
+            meta.json:  {"type": "day", ...}
+            data.jsonl: {"stock_code": "600000", "date": "2025-11-29", "return": 0.052}
         
         JSON格式:
         {
@@ -174,15 +665,21 @@ class StockImageAnalyzer:
         }
         
         参数:
-            json_file_path: JSON文件路径
+            json_file_path: JSON/JSONL文件路径（.jsonl 后缀按 JSON Lines 读取）
             include_market_index: 是否包含5个板块指数数据（默认True）
+            batch_mode: 是否批量读取K线窗口（默认True）
+                - True: 按股票分组，合并为少量区间查询，在内存中切片（结果与逐条模式一致）
+                - False: 每个样本单独查询120根历史K线和5根未来K线
+            concurrency: 同时进行的数据库查询数（默认1=串行）
+                大于1时逐条模式的每个样本查询、以及未启用指数缓存时的指数查询在线程池中并发执行
+                （每个线程独立会话，最多 concurrency 个查询同时进行），结果与串行完全相同、顺序不变
         
         返回:
             list: [
                 {
                     'stock_code': '600000',
                     'trade_date': '2025-11-29',
-                    'kline_data': [...],  // 120根K线
+                    'kline_data': KlineWindow,  // 120根K线（列式，时间正序）
                     'period': 'day',
                     'market_index_klines': {  // 5个板块指数K线字典（如果启用）
                         'sh.000001': [...],  // 上证指数
@@ -200,64 +697,69 @@ class StockImageAnalyzer:
             - 数据库中没有该股票 → 跳过
             - K线数量不足120根 → 跳过
         """
-        if not self.db:
+        if not self.db and self.bar_store is None:
             print("❌ 数据库未连接，无法读取K线数据")
             return None
         
         try:
-            import json
-            from database.models import stock_kline_day, stock_kline_week
-            from database.models import stock_kline_5min, stock_kline_15min
-            from database.models import stock_kline_30min, stock_kline_1hour
-            from datetime import datetime
-            
-            # 读取JSON文件
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            period = config.get('type')
-            data_dict = config.get('data', {})
-            
-            if not period or not data_dict:
-                print(f"❌ JSON格式错误: {json_file_path}")
-                return None
-            
-            # 选择对应的表
-            model_map = {
-                'day': stock_kline_day.StockKlineDay,
-                'week': stock_kline_week.StockKlineWeek,
-                '5min': stock_kline_5min.StockKline5Min,
-                '15min': stock_kline_15min.StockKline15Min,
-                '30min': stock_kline_30min.StockKline30Min,
-                '1hour': stock_kline_1hour.StockKline1Hour,
-                'bs': stock_kline_1hour.StockKline1Hour,  # 买卖点使用小时线表
-            }
-            
-            KlineModel = model_map.get(period)
-            if not KlineModel:
+            # 读取JSON/JSONL文件
+            period, samples_list = read_training_samples(json_file_path)
+        except Exception as e:
+            print(f"❌ 读取JSON文件失败: {str(e)}")
+            return None
+        
+        if not period or not samples_list:
+            print(f"❌ JSON格式错误: {json_file_path}")
+            return None
+        
+        return self.get_training_data_from_samples(period, samples_list, include_market_index, batch_mode,
+                                                   concurrency)
+    
+    def get_training_data_from_samples(self, period: str, samples_list: List[Tuple[str, Any]],
+                                       include_market_index: bool = True,
+                                       batch_mode: bool = True,
+                                       concurrency: int = 1,
+                                       skip_reasons: Optional[Dict] = None,
+                                       verbose: bool = True) -> Optional[List[Dict]]:
+        """
+        按样本列表读取训练数据（get_training_data_from_json 的核心，参数与返回值相同）
+        
+        参数:
+            period: K线周期
+            samples_list: [(stock_code, date_info), ...]，格式见 read_training_samples
+            skip_reasons: 传入字典时记录被跳过样本的原因 {(stock_code, trade_date): 原因}，
+                原因为 SKIP_INSUFFICIENT_BARS / SKIP_INVALID_DATE / SKIP_ERROR
+            verbose: 是否打印进度和逐条跳过/失败信息（默认 True；服务中传 False，只保留整体失败时的错误信息）
+        """
+        if skip_reasons is None:
+            skip_reasons = {}
+
+        if not self.db and self.bar_store is None:
+            print("❌ 数据库未连接，无法读取K线数据")
+            return None
+        
+        try:
+            if period not in DATE_FIELD_MAP:
                 print(f"❌ 不支持的周期类型: {period}")
                 return None
             
+            # 选择对应的表（使用本地K线库时不需要数据库模型）
+            KlineModel = get_kline_model(period) if self.bar_store is None else None
+            
             # 确定日期字段名
-            date_field_map = {
-                'day': 'trade_date',
-                'week': 'trade_date',
-                '5min': 'trade_datetime',
-                '15min': 'trade_datetime',
-                '30min': 'trade_datetime',
-                '1hour': 'trade_datetime',
-                'bs': 'trade_datetime',  # 买卖点使用小时线的trade_datetime
-            }
-            date_field = date_field_map[period]
+            date_field = DATE_FIELD_MAP[period]
             
             results = []
-            total = len(data_dict)
+            total = len(samples_list)
             skipped = 0
             
-            print(f"\n📊 开始处理 {period} 周期数据...")
-            print(f"总计: {total} 条")
+            if verbose:
+                print(f"\n📊 开始处理 {period} 周期数据...")
+                print(f"总计: {total} 条")
             
-            for i, (stock_code, date_info) in enumerate(data_dict.items(), 1):
+            # 解析样本列表: [(序号, 股票代码, 日期字符串, 保存的收益率, 查询用日期, 批量窗口键)]
+            entries = []
+            for i, (stock_code, date_info) in enumerate(samples_list, 1):
                 # ✅ 兼容新旧两种格式
                 # 旧格式: "600000": "2025-11-29"
                 # 新格式: "600000": {"date": "2025-11-29", "return": 0.052}
@@ -268,47 +770,84 @@ class StockImageAnalyzer:
                     trade_date = date_info
                     saved_return = None  # 旧格式没有收益率
                 
-                # 转换日期格式
-                if period in ['day', 'week']:
-                    # Date类型，直接用字符串
-                    date_value = trade_date
-                else:
-                    # DateTime类型，转换为datetime对象
-                    try:
-                        date_value = datetime.strptime(trade_date, '%Y-%m-%d %H:%M:%S')
-                    except:
+                # 转换日期格式（与 get_kline_data_from_db 相同，见 parse_kline_date）
+                try:
+                    if not isinstance(trade_date, str):
+                        raise ValueError(trade_date)
+                    date_value = parse_kline_date(trade_date, date_field)
+                except ValueError:
+                    if verbose:
                         print(f"  [{i}/{total}] ❌ {stock_code}: 日期格式错误 {trade_date}")
-                        skipped += 1
-                        continue
+                    skip_reasons[(stock_code, trade_date)] = SKIP_INVALID_DATE
+                    skipped += 1
+                    continue
                 
+                window_key = (stock_code, date_value)
+                
+                entries.append((i, stock_code, trade_date, saved_return, date_value, window_key))
+            
+            # 批量模式：一次性读取所有样本的K线窗口
+            windows = {}
+            if (batch_mode or self.bar_store is not None) and entries:
+                samples = [entry[5] for entry in entries if entry[5] is not None]
+                try:
+                    if self.bar_store is not None:
+                        windows = self.bar_store.fetch_windows(period, samples)
+                    else:
+                        windows = self._fetch_windows_batched(KlineModel, date_field, period, samples)
+                    if verbose:
+                        print(f"  批量读取完成: {len(windows)} 个K线窗口")
+                except Exception as e:
+                    if verbose:
+                        print(f"  ⚠️ 批量读取失败，回退到逐条查询: {str(e)[:50]}")
+                    windows = {}
+            
+            # 并发预取：逐条查询改为线程池并发（每个线程独立会话），下面的循环直接使用预取结果，
+            # 预取失败的样本仍按原逻辑逐条查询，因此结果和顺序与串行完全一致
+            index_windows = {}
+            if concurrency > 1 and self.bar_store is None and self.db is not None and DATABASE_AVAILABLE:
+                tasks = [(entry[5], entry[1], entry[4]) for entry in entries
+                         if entry[5] is not None and entry[5] not in windows]
+                if tasks:
+                    windows.update(self._prefetch_windows(KlineModel, date_field, tasks, concurrency))
+                    if verbose:
+                        print(f"  并发读取完成: {len(tasks)} 个K线窗口（并发数 {concurrency}）")
+                
+                if include_market_index and self.index_store is None:
+                    index_windows = self._prefetch_index_windows(
+                        [self._index_date(period, entry[2]) for entry in entries if isinstance(entry[2], str)],
+                        concurrency
+                    )
+            
+            for i, stock_code, trade_date, saved_return, date_value, window_key in entries:
                 # 查询120根K线
                 try:
-                    klines = self.db.query(KlineModel).filter(
-                        KlineModel.stock_code == stock_code,
-                        getattr(KlineModel, date_field) <= date_value
-                    ).order_by(getattr(KlineModel, date_field).desc()).limit(120).all()
+                    if window_key is not None and window_key in windows:
+                        klines, future_klines = windows[window_key]
+                    else:
+                        klines = self._query_history_klines(KlineModel, date_field, stock_code, date_value, 120)
+                        future_klines = None
                     
-                    if not klines:
-                        print(f"  [{i}/{total}] ⚠️  {stock_code}: 数据库无数据，跳过")
+                    if len(klines) == 0:
+                        if verbose:
+                            print(f"  [{i}/{total}] ⚠️  {stock_code}: 数据库无数据，跳过")
+                        skip_reasons[(stock_code, trade_date)] = SKIP_INSUFFICIENT_BARS
                         skipped += 1
                         continue
                     
                     if len(klines) < 120:
-                        print(f"  [{i}/{total}] ⚠️  {stock_code}: K线不足120根({len(klines)}根)，跳过")
+                        if verbose:
+                            print(f"  [{i}/{total}] ⚠️  {stock_code}: K线不足120根({len(klines)}根)，跳过")
+                        skip_reasons[(stock_code, trade_date)] = SKIP_INSUFFICIENT_BARS
                         skipped += 1
                         continue
                     
-                    # 反转为时间正序
-                    klines.reverse()
-                    
                     # ✅ 计算未来5天的实际收益率（用于真实回测）
                     actual_return = None
                     try:
-                        # 查询未来5天的K线
-                        future_klines = self.db.query(KlineModel).filter(
-                            KlineModel.stock_code == stock_code,
-                            getattr(KlineModel, date_field) > date_value
-                        ).order_by(getattr(KlineModel, date_field).asc()).limit(5).all()
+                        # 查询未来5天的K线（批量模式下已在内存中切出）
+                        if future_klines is None:
+                            future_klines = self._query_future_klines(KlineModel, date_field, stock_code, date_value, 5)
                         
                         if len(future_klines) >= 5:
                             # 当前收盘价
@@ -316,7 +855,7 @@ class StockImageAnalyzer:
                             # 未来5天后的收盘价
                             future_close = future_klines[4].close
                             # 计算收益率
-                            actual_return = (future_close - current_close) / current_close
+                            actual_return = float((future_close - current_close) / current_close)
                     except Exception as e:
                         # 如果计算失败，保持None
                         pass
@@ -333,31 +872,21 @@ class StockImageAnalyzer:
                     # 获取对应的板块指数数据（如果启用）
                     if include_market_index:
                         try:
-                            # 对于日线/周线，使用trade_date；对于分钟线，提取日期部分
-                            if period in ['day', 'week']:
-                                index_date = trade_date
-                            else:
-                                # 从datetime字符串提取日期（如'2025-11-29 14:30:00' -> '2025-11-29'）
-                                index_date = trade_date.split(' ')[0]
+                            index_date = self._index_date(period, trade_date)
                             
                             # 加载所有5个板块指数的K线数据（用于F08_01的5个特征）
                             market_index_klines_dict = {}
                             
-                            index_codes = [
-                                'sh.000001',  # 上证指数
-                                'sz.399001',  # 深证成指
-                                'sz.399006',  # 创业板指
-                                'sh.000688',  # 科创50
-                                'bj.899050'   # 北证50
-                            ]
-                            
-                            for idx_code in index_codes:
-                                idx_klines = self.get_market_index_klines(
-                                    trade_date=index_date,
-                                    index_code=idx_code,
-                                    count=120
-                                )
-                                if idx_klines:
+                            for idx_code in MARKET_INDEX_CODES:
+                                if (index_date, idx_code) in index_windows:
+                                    idx_klines = index_windows[(index_date, idx_code)]
+                                else:
+                                    idx_klines = self.get_market_index_klines(
+                                        trade_date=index_date,
+                                        index_code=idx_code,
+                                        count=120
+                                    )
+                                if idx_klines is not None:
                                     market_index_klines_dict[idx_code] = idx_klines
                             
                             # 如果至少有一个指数加载成功，就保存字典
@@ -371,23 +900,26 @@ class StockImageAnalyzer:
                     
                     results.append(result_item)
                     
-                    if i % 100 == 0 or i == total:
+                    if verbose and (i % 100 == 0 or i == total):
                         print(f"  进度: {i}/{total} ({len(results)}条有效, {skipped}条跳过)")
                 
                 except Exception as e:
-                    print(f"  [{i}/{total}] ❌ {stock_code}: 查询失败 {str(e)[:50]}")
+                    if verbose:
+                        print(f"  [{i}/{total}] ❌ {stock_code}: 查询失败 {str(e)[:50]}")
+                    skip_reasons[(stock_code, trade_date)] = SKIP_ERROR
                     skipped += 1
                     continue
             
-            print(f"\n✅ 处理完成:")
-            print(f"  - 有效数据: {len(results)} 条")
-            print(f"  - 跳过: {skipped} 条")
-            print(f"  - 成功率: {len(results)/total*100:.1f}%")
+            if verbose:
+                print(f"\n✅ 处理完成:")
+                print(f"  - 有效数据: {len(results)} 条")
+                print(f"  - 跳过: {skipped} 条")
+                print(f"  - 成功率: {len(results)/total*100:.1f}%")
             
             return results if results else None
         
         except Exception as e:
-            print(f"❌ 读取JSON文件失败: {str(e)}")
+            print(f"❌ 读取训练数据失败: {str(e)}")
             import traceback
             traceback.print_exc()
             return None
@@ -395,11 +927,10 @@ class StockImageAnalyzer:
 
 # 测试主函数
 if __name__ == '__main__':
-    analyzer = StockImageAnalyzer(enable_database=True)
-    
     # 测试从JSON文件读取训练数据
     json_file = 'ai_training_data/day_kline_training/up_trend/data.json'
-    data = analyzer.get_training_data_from_json(json_file)
+    with StockImageAnalyzer(enable_database=True) as analyzer:
+        data = analyzer.get_training_data_from_json(json_file)
     
     if data:
         print(f"✅ 成功读取 {len(data)} 条训练数据")
@@ -0,0 +1,85 @@
+"""
+K线窗口列式表示
+职责: 用一块连续内存保存一段K线（日期 + OHLCV），替代逐根的ORM对象
+功能:
+    1. KlineWindow: 结构化NumPy数组（np.recarray子类），按时间正序存储
+    2. 直接由 select() 返回的原始元组构建，无需实例化ORM对象
+    3. 保持与ORM对象一致的属性访问: klines[-1].close, klines[0].trade_date
+    4. 整列访问便于向量化: klines.close, klines.ohlcv()
+"""
+from typing import Iterable, Sequence
+
+import numpy as np
+
+
+# 价格/成交量字段（顺序即 ohlcv() 的列顺序）
+OHLCV_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# 日期字段名与存储精度: 日线/周线为 trade_date(天)，分钟线/小时线为 trade_datetime(秒)
+DATE_FIELD_UNITS = {
+    'trade_date': 'D',
+    'trade_datetime': 's',
+}
+
+
+def kline_dtype(date_field: str = 'trade_date') -> np.dtype:
+    """
+    获取K线窗口的结构化dtype
+
+    参数:
+        date_field: 日期字段名（trade_date / trade_datetime），与数据库模型字段一致
+    """
+    unit = DATE_FIELD_UNITS.get(date_field, 's')
+    return np.dtype([(date_field, f'datetime64[{unit}]')] + [(name, 'f8') for name in OHLCV_FIELDS])
+
+
+class KlineWindow(np.recarray):
+    """K线窗口（时间正序）
+
+    每行一根K线，字段为 (日期, open, high, low, close, volume)。
+    切片返回视图，不复制数据；单根K线是 np.record，支持 .close 等属性访问。
+    """
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence], date_field: str = 'trade_date') -> 'KlineWindow':
+        """
+        由原始元组构建K线窗口
+
+        逐行写入结构化数组，不先生成整个行列表，可直接传入流式查询结果（见 db_session.stream_rows）
+
+        参数:
+            rows: [(日期, open, high, low, close, volume), ...]，如 select() 的返回结果
+            date_field: 日期字段名
+        """
+        return np.fromiter((tuple(row) for row in rows), dtype=kline_dtype(date_field)).view(cls)
+
+    @classmethod
+    def empty(cls, date_field: str = 'trade_date') -> 'KlineWindow':
+        """空窗口"""
+        return np.empty(0, dtype=kline_dtype(date_field)).view(cls)
+
+    @property
+    def date_field(self) -> str:
+        """日期字段名"""
+        return self.dtype.names[0]
+
+    @property
+    def dates(self) -> np.ndarray:
+        """日期列（datetime64）"""
+        return self[self.date_field]
+
+    def ohlcv(self) -> np.ndarray:
+        """返回 [N, 5] 的 float64 矩阵（open, high, low, close, volume）"""
+        return np.column_stack([self[name] for name in OHLCV_FIELDS])
+
+    def date_strings(self) -> list:
+        """日期字符串列表（日线 '2025-11-28'，分钟线 '2025-11-28 14:30:00'）"""
+        return [format_kline_date(value) for value in self.dates]
+
+
+def format_kline_date(value) -> str:
+    """将 datetime64 日期格式化为训练数据JSON中使用的字符串"""
+    value = np.datetime64(value)
+    if np.datetime_data(value.dtype)[0] == 'D':
+        return str(value)
+    return str(value.astype('datetime64[s]')).replace('T', ' ')
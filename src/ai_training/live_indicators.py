@@ -0,0 +1,366 @@
+"""
+实时K线增量指标引擎
+职责: 盘中新K线到达时 O(1) 更新每只股票的指标状态，替代每次重新读取120根K线并从头计算
+功能:
+    1. BarRingBuffer: 固定容量（默认120根）的K线环形缓冲区，窗口读取为零拷贝的 KlineWindow 视图
+    2. StockIndicatorEngine: 单只股票的运行状态（EMA、SMA滑动和、MACD），支持:
+       - 新K线追加: O(1) 更新
+       - 当前K线刷新（同一时间戳的未完成K线）: 回滚到上一根的状态后重新应用，仍为 O(1)
+       - feature_window(): 通过特征提取器输出最新的 60×51 特征窗口
+    3. IndicatorEngine: 全市场多只股票的引擎集合（从数据库/本地K线库初始化，按股票分发新K线），
+       另为每个板块指数维护一个日线引擎，盘中指数K线通过 on_index_bar() 刷新，
+       特征窗口使用这些引擎中的最新指数K线
+
+增量范围:
+    只有 indicators()（MACD、价格/成交量均线）是 O(1) 增量更新的；
+    feature_window() 每次调用都对缓冲区中的 120 根K线重新运行完整的特征提取器（环形缓冲区只省去数据库读取），
+    需要控制调用频率（如每根K线收盘时调用一次）
+
+使用方法:
+    engine = IndicatorEngine(period='5min', bar_store=MemmapBarStore('./bar_store'))
+    engine.seed(stock_codes, '2025-11-28 14:55:00')       # 同时初始化5个板块指数的日线
+    engine.on_bar('600000', ('2025-12-01 09:35:00', 10.1, 10.2, 10.0, 10.15, 120000))
+    engine.on_index_bar('sh.000001', ('2025-12-01', 3380.0, 3392.5, 3376.1, 3390.2, 2.1e10))  # 当日指数K线（盘中刷新）
+    features = engine.feature_windows(['600000'])    # {'600000': ndarray[60, 51]}
+"""
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ai_training.kline_window import KlineWindow, kline_dtype
+from src.ai_training.kline_data_loader import DATE_FIELD_MAP, MARKET_INDEX_CODES, StockImageAnalyzer
+
+
+# 环形缓冲区容量（特征提取使用的历史K线数）
+HISTORY_LENGTH = 120
+
+# 默认指标参数（与行情软件一致: MACD(12,26,9)、价格均线、成交量均线）
+MACD_PARAMS = (12, 26, 9)
+CLOSE_SMA_WINDOWS = (5, 10, 20, 25, 60)
+VOLUME_SMA_WINDOWS = (5, 60)
+
+# 滑动和每更新多少次后从缓冲区重新精确求和（消除浮点累积误差）
+RESYNC_EVERY = 1000
+
+
+class BarRingBuffer:
+    """K线环形缓冲区
+
+    数据写两份（位置 pos 和 pos+capacity），任意时刻最近 capacity 根K线在内存中连续，
+    window() 直接返回切片视图，不复制、不拼接。
+    """
+
+    def __init__(self, date_field: str = 'trade_date', capacity: int = HISTORY_LENGTH):
+        self.capacity = capacity
+        self._data = np.zeros(capacity * 2, dtype=kline_dtype(date_field)).view(KlineWindow)
+        self._next = 0       # 下一根K线的写入位置（0 ~ capacity-1）
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, bar: Tuple):
+        """追加一根K线 (日期, open, high, low, close, volume)"""
+        self._data[self._next] = bar
+        self._data[self._next + self.capacity] = bar
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def replace_last(self, bar: Tuple):
+        """替换最后一根K线（盘中未完成K线刷新）"""
+        last = (self._next - 1) % self.capacity
+        self._data[last] = bar
+        self._data[last + self.capacity] = bar
+
+    def ago(self, n: int):
+        """倒数第 n+1 根K线（n=0 为最新），不存在时返回 None"""
+        if n >= self.size:
+            return None
+        return self._data[(self._next - 1 - n) % self.capacity]
+
+    def window(self) -> KlineWindow:
+        """时间正序的全部K线（零拷贝视图）"""
+        end = self._next + self.capacity
+        return self._data[end - self.size:end]
+
+
+class StockIndicatorEngine:
+    """单只股票的增量指标引擎
+
+    EMA/MACD 状态覆盖所有输入过的K线（与对全部K线做 ewm(adjust=False) 一致），
+    SMA 以滑动和维护，新K线进入时加上新值、减去移出窗口的旧值。
+    """
+
+    def __init__(self, stock_code: str, period: str = '5min', capacity: int = HISTORY_LENGTH,
+                 macd_params: Tuple[int, int, int] = MACD_PARAMS,
+                 close_sma_windows: Sequence[int] = CLOSE_SMA_WINDOWS,
+                 volume_sma_windows: Sequence[int] = VOLUME_SMA_WINDOWS):
+        if max(tuple(close_sma_windows) + tuple(volume_sma_windows)) > capacity:
+            raise ValueError(f"均线周期不能超过缓冲区容量 {capacity}")
+
+        self.stock_code = stock_code
+        self.period = period
+        self.buffer = BarRingBuffer(DATE_FIELD_MAP[period], capacity)
+        self.fast, self.slow, self.signal = macd_params
+        self.close_sma_windows = tuple(close_sma_windows)
+        self.volume_sma_windows = tuple(volume_sma_windows)
+
+        self.state = None        # 当前状态（含最后一根K线）
+        self._prev_state = None  # 最后一根K线之前的状态（用于刷新最后一根K线）
+        self._last_leaving = {}  # 最后一根K线追加时各均线窗口移出的K线
+        self._updates = 0
+
+    # ------------------------------------------------------------------
+    # 状态更新
+    # ------------------------------------------------------------------
+
+    def _next_state(self, prev: Optional[Dict], bar: Tuple, leaving: Dict[int, Optional[np.void]]) -> Dict:
+        """由上一状态、新K线和各均线窗口移出的K线计算新状态（O(1)）"""
+        close = float(bar[4])
+        volume = float(bar[5])
+
+        if prev is None:
+            ema_fast = ema_slow = close
+            dea = 0.0
+            close_sums = {w: close for w in self.close_sma_windows}
+            volume_sums = {w: volume for w in self.volume_sma_windows}
+        else:
+            a_fast = 2.0 / (self.fast + 1)
+            a_slow = 2.0 / (self.slow + 1)
+            a_signal = 2.0 / (self.signal + 1)
+            ema_fast = a_fast * close + (1 - a_fast) * prev['ema_fast']
+            ema_slow = a_slow * close + (1 - a_slow) * prev['ema_slow']
+            dea = a_signal * (ema_fast - ema_slow) + (1 - a_signal) * prev['dea']
+
+            close_sums, volume_sums = {}, {}
+            for w in self.close_sma_windows:
+                out = leaving[w]
+                close_sums[w] = prev['close_sums'][w] + close - (float(out['close']) if out is not None else 0.0)
+            for w in self.volume_sma_windows:
+                out = leaving[w]
+                volume_sums[w] = prev['volume_sums'][w] + volume - (float(out['volume']) if out is not None else 0.0)
+
+        dif = ema_fast - ema_slow
+        return {
+            'ema_fast': ema_fast,
+            'ema_slow': ema_slow,
+            'dif': dif,
+            'dea': dea if prev is not None else dif,
+            'close_sums': close_sums,
+            'volume_sums': volume_sums,
+        }
+
+    def _leaving_bars(self) -> Dict[int, Optional[np.void]]:
+        """追加新K线时，各均线窗口移出的K线（追加前读取并复制，缓冲区满时最旧的K线会被覆盖）"""
+        windows = set(self.close_sma_windows) | set(self.volume_sma_windows)
+        leaving = {}
+        for w in windows:
+            record = self.buffer.ago(w - 1) if self.buffer.size >= w else None
+            leaving[w] = None if record is None else record.copy()
+        return leaving
+
+    def update(self, bar: Tuple):
+        """
+        输入一根K线 (日期, open, high, low, close, volume)
+
+        日期与最后一根相同时视为刷新未完成的K线，否则追加为新K线；日期更早的K线忽略
+        """
+        date_value = np.datetime64(bar[0]).astype(self.buffer._data.dtype[0])
+        last = self.buffer.ago(0)
+
+        if last is not None and date_value < last[0]:
+            return
+        bar = (date_value,) + tuple(float(v) for v in bar[1:])
+
+        if last is not None and date_value == last[0]:
+            # 刷新最后一根：回滚到上一根的状态，移出窗口的K线在上次追加前已确定
+            leaving = self._last_leaving
+            self.buffer.replace_last(bar)
+            self.state = self._next_state(self._prev_state, bar, leaving)
+        else:
+            leaving = self._leaving_bars()
+            self._prev_state = self.state
+            self._last_leaving = leaving
+            self.buffer.append(bar)
+            self.state = self._next_state(self._prev_state, bar, leaving)
+
+        self._updates += 1
+        if self._updates % RESYNC_EVERY == 0:
+            self._resync_sums()
+
+    def _resync_sums(self):
+        """从缓冲区重新精确计算滑动和"""
+        window = self.buffer.window()
+        for w in self.close_sma_windows:
+            self.state['close_sums'][w] = float(window.close[-w:].sum())
+        for w in self.volume_sma_windows:
+            self.state['volume_sums'][w] = float(window.volume[-w:].sum())
+
+    def seed(self, klines: KlineWindow):
+        """用历史K线初始化（时间正序）"""
+        for bar in klines:
+            self.update(tuple(bar))
+
+    # ------------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------------
+
+    def indicators(self) -> Optional[Dict[str, float]]:
+        """
+        当前指标值
+
+        返回:
+            {'dif', 'dea', 'macd', 'ma5', ..., 'vol_ma5', ...}，均线K线数不足时为 NaN；无K线时返回 None
+        """
+        if self.state is None:
+            return None
+
+        size = len(self.buffer)
+        result = {
+            'dif': self.state['dif'],
+            'dea': self.state['dea'],
+            'macd': 2 * (self.state['dif'] - self.state['dea']),
+        }
+        for w in self.close_sma_windows:
+            result[f'ma{w}'] = self.state['close_sums'][w] / w if size >= w else np.nan
+        for w in self.volume_sma_windows:
+            result[f'vol_ma{w}'] = self.state['volume_sums'][w] / w if size >= w else np.nan
+        return result
+
+    def window(self) -> KlineWindow:
+        """最近的K线窗口（零拷贝视图，最多 capacity 根）"""
+        return self.buffer.window()
+
+    def feature_window(self, market_index_klines: Optional[Dict] = None) -> Optional[np.ndarray]:
+        """
+        最新的特征窗口（60×51），K线不足 capacity 根时返回 None
+
+        不是增量计算: 每次调用对整个缓冲区重新运行特征提取器（O(capacity)）
+
+        参数:
+            market_index_klines: 5个板块指数K线字典（同 get_training_data_from_json）
+        """
+        if len(self.buffer) < self.buffer.capacity:
+            return None
+
+        from src.ai_training.feature_extractor import extract_features_sequence_from_kline_data
+
+        return extract_features_sequence_from_kline_data(
+            self.buffer.window(), self.period, market_index_klines, self.stock_code
+        )
+
+
+class IndicatorEngine:
+    """全市场增量指标引擎（每只股票一个 StockIndicatorEngine，每个板块指数一个日线 StockIndicatorEngine）"""
+
+    def __init__(self, period: str = '5min', analyzer: Optional[StockImageAnalyzer] = None,
+                 bar_store=None, capacity: int = HISTORY_LENGTH):
+        """
+        参数:
+            period: K线周期
+            analyzer: 用于初始化历史K线的 StockImageAnalyzer（未指定时按 bar_store 创建）
+            bar_store: 本地K线库（可选）
+            capacity: 每只股票保留的K线数
+        """
+        self.period = period
+        self.capacity = capacity
+        self.analyzer = analyzer or StockImageAnalyzer(enable_database=bar_store is None, bar_store=bar_store)
+        self.engines: Dict[str, StockIndicatorEngine] = {}
+        self.index_engines: Dict[str, StockIndicatorEngine] = {}
+
+    def seed(self, stock_codes: Iterable[str], trade_date, include_market_index: bool = True) -> int:
+        """
+        读取每只股票截止 trade_date 的历史K线并初始化引擎
+
+        参数:
+            include_market_index: 同时初始化板块指数日线引擎（见 seed_index）
+
+        返回:
+            成功初始化的股票数
+        """
+        if include_market_index:
+            self.seed_index(trade_date)
+
+        count = 0
+        for stock_code in stock_codes:
+            klines = self.analyzer.get_kline_data_from_db(stock_code, trade_date, self.period, self.capacity)
+            if klines is None or len(klines) == 0:
+                continue
+            engine = StockIndicatorEngine(stock_code, self.period, self.capacity)
+            engine.seed(klines)
+            self.engines[stock_code] = engine
+            count += 1
+        return count
+
+    def seed_index(self, trade_date, index_codes: Iterable[str] = MARKET_INDEX_CODES) -> int:
+        """
+        读取各板块指数截止 trade_date 所在交易日的日线并初始化指数引擎（分钟线周期取日期部分）
+
+        返回:
+            成功初始化的指数数
+        """
+        index_date = StockImageAnalyzer._index_date(self.period, str(trade_date))
+        count = 0
+        for index_code in index_codes:
+            klines = self.analyzer.get_market_index_klines(index_date, index_code, self.capacity)
+            if klines is None or len(klines) == 0:
+                continue
+            engine = StockIndicatorEngine(index_code, 'day', self.capacity)
+            engine.seed(klines)
+            self.index_engines[index_code] = engine
+            count += 1
+        return count
+
+    def on_index_bar(self, index_code: str, bar: Tuple):
+        """
+        指数日线到达 (日期, open, high, low, close, volume)
+
+        盘中用当日截至目前的开高低收量刷新当天的日线（日期相同时替换最后一根），
+        收盘后下一个交易日的K线自动追加
+        """
+        engine = self.index_engines.get(index_code)
+        if engine is None:
+            engine = self.index_engines[index_code] = StockIndicatorEngine(index_code, 'day', self.capacity)
+        engine.update(bar)
+
+    def market_index_klines(self) -> Optional[Dict[str, KlineWindow]]:
+        """各指数引擎的最新日线窗口 {指数代码: KlineWindow}（同 get_training_data_from_json），没有指数引擎时返回 None"""
+        klines = {code: engine.window() for code, engine in self.index_engines.items() if len(engine.buffer) > 0}
+        return klines or None
+
+    def on_bar(self, stock_code: str, bar: Tuple):
+        """新K线到达（未初始化的股票自动创建引擎）"""
+        engine = self.engines.get(stock_code)
+        if engine is None:
+            engine = self.engines[stock_code] = StockIndicatorEngine(stock_code, self.period, self.capacity)
+        engine.update(bar)
+
+    def feature_windows(self, stock_codes: Optional[Iterable[str]] = None,
+                        market_index_klines: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """
+        各股票最新的特征窗口（K线不足或提取失败的股票不返回）
+
+        参数:
+            market_index_klines: 指数K线字典，未指定时使用指数引擎的最新日线（market_index_klines()）；
+                同一时刻所有股票共用同一组指数K线
+        """
+        if market_index_klines is None:
+            market_index_klines = self.market_index_klines()
+        codes = self.engines.keys() if stock_codes is None else stock_codes
+        results = {}
+        for stock_code in codes:
+            engine = self.engines.get(stock_code)
+            if engine is None:
+                continue
+            try:
+                features = engine.feature_window(market_index_klines)
+            except Exception as e:
+                print(f"  ⚠️ {stock_code}: 特征提取失败 {str(e)[:50]}")
+                continue
+            if features is not None:
+                results[stock_code] = features
+        return results
@@ -0,0 +1,359 @@
+"""
+K线表索引诊断
+职责: 用读取器/标签生成器的真实查询形状检查各周期K线表的复合索引，输出执行计划、耗时和缺失索引的建表语句
+功能:
+    1. 查询形状（与 kline_data_loader / auto_label_generator 的查询一致）:
+       - history:  股票代码 = ? AND 日期 <= ? ORDER BY 日期 DESC LIMIT 120（历史窗口）
+       - future:   股票代码 = ? AND 日期 > ?  ORDER BY 日期 ASC  LIMIT 5（未来窗口）
+       - batch:    多只股票各一个日期区间 OR 组合，ORDER BY 股票代码, 日期（批量窗口）
+       - range:    单只股票全部历史 ORDER BY 日期（标签生成）
+       - distinct: SELECT DISTINCT 股票代码（股票列表）
+    2. 检查是否存在以 (股票代码, 日期) 开头的复合索引（主键、唯一约束、普通索引均可）
+    3. EXPLAIN 执行计划（SQLite: EXPLAIN QUERY PLAN，PostgreSQL/MySQL: EXPLAIN）及全表扫描标记
+    4. 每个查询形状的耗时中位数（多只样本股票 × 重复次数）
+    5. 输出缺失索引的 DDL；--apply 时创建索引并重新测试，对比前后耗时
+
+使用方法:
+    # 检查日线、5分钟线和指数日线
+    python src/ai_training/query_advisor.py --period day 5min index
+
+    # 输出缺失索引的 DDL 到文件
+    python src/ai_training/query_advisor.py --period day 5min --ddl-out kline_indexes.sql
+
+    # 创建缺失索引并对比前后耗时（建议先在本地 SQLite / PostgreSQL 副本上执行）
+    python src/ai_training/query_advisor.py --period day --apply
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.ai_training.kline_data_loader import (
+    DATE_FIELD_MAP, PERIOD_CALENDAR_DAYS_PER_BAR, get_kline_model, kline_columns
+)
+
+try:
+    from sqlalchemy import Index, and_, func, inspect, or_, select
+    from sqlalchemy.exc import NoSuchTableError
+    from sqlalchemy.schema import CreateIndex
+    HAS_SQLALCHEMY = True
+except ImportError:
+    HAS_SQLALCHEMY = False
+
+
+# 可检查的表: 各周期K线表 + 指数日线
+SUPPORTED_TABLES = ['day', 'week', '1hour', '30min', '15min', '5min', 'index']
+
+# 与读取器一致的窗口长度
+HISTORY_COUNT = 120
+FUTURE_COUNT = 5
+
+QUERY_SHAPES = ['history', 'future', 'batch', 'range', 'distinct']
+
+# 各数据库的执行计划语句
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def table_spec(name: str) -> Tuple:
+    """
+    表对应的 (模型, 代码列名, 日期列名, 周期)
+
+    参数:
+        name: 周期（day/5min/...）或 'index'（指数日线）
+    """
+    if name == 'index':
+        from database.models.index_kline_day import IndexKlineDay
+        return IndexKlineDay, 'index_code', 'trade_date', 'day'
+
+    model = get_kline_model(name)
+    if model is None:
+        raise ValueError(f"不支持的周期: {name}, 可选: {SUPPORTED_TABLES}")
+    return model, 'stock_code', DATE_FIELD_MAP[name], name
+
+
+def find_composite_index(engine, table_name: str, code_field: str, date_field: str) -> Optional[str]:
+    """
+    查找以 (代码列, 日期列) 开头的索引
+
+    返回:
+        索引名（主键返回 'PRIMARY KEY'），没有时返回 None
+    """
+    inspector = inspect(engine)
+    prefix = [code_field, date_field]
+
+    pk = inspector.get_pk_constraint(table_name)
+    if pk.get('constrained_columns', [])[:2] == prefix:
+        return pk.get('name') or 'PRIMARY KEY'
+
+    for index in inspector.get_indexes(table_name) + inspector.get_unique_constraints(table_name):
+        if list(index.get('column_names') or [])[:2] == prefix:
+            return index['name']
+    return None
+
+
+def recommended_index(model, code_field: str, date_field: str) -> 'Index':
+    """建议的复合索引 (代码列, 日期列)"""
+    table = model.__table__
+    return Index(f"ix_{table.name}_{code_field}_{date_field}",
+                 table.c[code_field], table.c[date_field])
+
+
+def index_ddl(index: 'Index', engine) -> str:
+    """索引的建表语句（按当前数据库方言生成）"""
+    return str(CreateIndex(index).compile(dialect=engine.dialect)).strip() + ';'
+
+
+def sample_keys(conn, model, code_field: str, date_field: str, samples: int) -> List[Tuple]:
+    """
+    选取样本股票: [(代码, 最早日期, 最晚日期), ...]
+
+    每只股票以最后一根K线作为样本日期（history 查询读取它之前的 120 根）
+    """
+    code_column = getattr(model, code_field)
+    date_column = getattr(model, date_field)
+    codes = conn.execute(select(code_column).distinct().limit(samples)).scalars().all()
+
+    keys = []
+    for code in codes:
+        first, last = conn.execute(
+            select(func.min(date_column), func.max(date_column)).where(code_column == code)
+        ).one()
+        if last is not None:
+            keys.append((code, first, last))
+    return keys
+
+
+def build_queries(model, code_field: str, date_field: str, period: str,
+                  keys: List[Tuple]) -> Dict[str, List]:
+    """
+    生成各查询形状的语句（每只样本股票一条，batch 为全部样本股票一条）
+
+    返回:
+        {查询形状: [select 语句, ...]}
+    """
+    code_column = getattr(model, code_field)
+    date_column = getattr(model, date_field)
+    columns = kline_columns(model, date_field)
+
+    days_per_bar = PERIOD_CALENDAR_DAYS_PER_BAR.get(period, PERIOD_CALENDAR_DAYS_PER_BAR['day'])
+    history_span = timedelta(days=math.ceil(HISTORY_COUNT * days_per_bar) + 10)
+
+    queries = {shape: [] for shape in QUERY_SHAPES}
+    for code, first, last in keys:
+        queries['history'].append(
+            select(*columns).where(code_column == code, date_column <= last)
+            .order_by(date_column.desc()).limit(HISTORY_COUNT)
+        )
+        # 未来窗口从历史窗口的起点之后读取，保证有数据返回
+        queries['future'].append(
+            select(*columns).where(code_column == code, date_column > last - history_span)
+            .order_by(date_column.asc()).limit(FUTURE_COUNT)
+        )
+        queries['range'].append(
+            select(*columns).where(code_column == code, date_column >= first, date_column <= last)
+            .order_by(date_column)
+        )
+
+    if keys:
+        queries['batch'].append(
+            select(code_column, *columns).where(or_(*[
+                and_(code_column == code, date_column >= last - history_span, date_column <= last)
+                for code, _, last in keys
+            ])).order_by(code_column, date_column)
+        )
+    queries['distinct'].append(select(code_column).distinct())
+    return queries
+
+
+def explain(conn, stmt) -> List[str]:
+    """执行计划（每行一条）"""
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name, 'EXPLAIN ')
+    rows = conn.exec_driver_sql(prefix + str(compiled), params).all()
+    if conn.dialect.name == 'sqlite':
+        # (id, parent, notused, detail)
+        return [str(row[-1]) for row in rows]
+    return [' | '.join('' if value is None else str(value) for value in row) for row in rows]
+
+
+def is_full_scan(plan: List[str], dialect_name: str) -> bool:
+    """执行计划中是否有全表扫描"""
+    for line in plan:
+        if dialect_name == 'sqlite' and line.startswith('SCAN') and 'USING' not in line:
+            return True
+        if dialect_name == 'postgresql' and 'Seq Scan' in line:
+            return True
+        if dialect_name == 'mysql' and ' | ALL | ' in f" {line} ":
+            return True
+    return False
+
+
+def time_queries(conn, statements: List, repeat: int) -> float:
+    """多条语句各执行 repeat 次，返回单次耗时的中位数（毫秒）"""
+    timings = []
+    for stmt in statements:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(stmt).all()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings) if timings else float('nan')
+
+
+def benchmark_table(engine, name: str, samples: int = 5, repeat: int = 5) -> Dict:
+    """
+    检查一张表
+
+    返回:
+        {
+            'table': 表名, 'exists': 表是否存在, 'index': 已有的复合索引名或 None, 'ddl': 缺失时的建索引语句,
+            'shapes': {查询形状: {'ms': 耗时中位数, 'full_scan': bool, 'plan': [...]}}
+        }
+        表不存在时 exists 为 False，不做其他检查
+    """
+    model, code_field, date_field, period = table_spec(name)
+    table_name = model.__table__.name
+
+    report = {
+        'name': name,
+        'table': table_name,
+        'exists': True,
+        'index': None,
+        'ddl': None,
+        'samples': 0,
+        'shapes': {},
+    }
+    try:
+        report['index'] = find_composite_index(engine, table_name, code_field, date_field)
+    except NoSuchTableError:
+        report['exists'] = False
+        return report
+
+    if report['index'] is None:
+        report['ddl'] = index_ddl(recommended_index(model, code_field, date_field), engine)
+
+    with engine.connect() as conn:
+        keys = sample_keys(conn, model, code_field, date_field, samples)
+        report['samples'] = len(keys)
+        for shape, statements in build_queries(model, code_field, date_field, period, keys).items():
+            if not statements:
+                continue
+            plan = explain(conn, statements[0])
+            report['shapes'][shape] = {
+                'ms': time_queries(conn, statements, repeat),
+                'full_scan': is_full_scan(plan, engine.dialect.name),
+                'plan': plan,
+            }
+    return report
+
+
+def create_missing_index(engine, name: str) -> Optional[str]:
+    """创建缺失的复合索引，返回索引名（已存在时返回 None）"""
+    model, code_field, date_field, _ = table_spec(name)
+    if find_composite_index(engine, model.__table__.name, code_field, date_field) is not None:
+        return None
+    index = recommended_index(model, code_field, date_field)
+    index.create(bind=engine)
+    return index.name
+
+
+def print_report(report: Dict, show_plan: bool = True):
+    """打印一张表的检查结果"""
+    if not report['exists']:
+        print(f"\n⚠️ {report['name']} ({report['table']}): 表不存在，跳过")
+        return
+
+    print(f"\n📊 {report['name']} ({report['table']}, 样本股票 {report['samples']} 只)")
+    if report['index']:
+        print(f"   ✅ 复合索引: {report['index']}")
+    else:
+        print(f"   ⚠️ 缺少复合索引: {report['ddl']}")
+
+    for shape, info in report['shapes'].items():
+        flag = '⚠️ 全表扫描' if info['full_scan'] else ''
+        print(f"   {shape:<9} {info['ms']:>9.2f} ms  {flag}")
+        if show_plan:
+            for line in info['plan']:
+                print(f"             {line}")
+
+
+def print_comparison(before: Dict, after: Dict):
+    """打印创建索引前后的耗时对比"""
+    print(f"\n📈 {before['name']} ({before['table']}) 创建索引前后:")
+    print(f"   {'查询':<9} {'之前(ms)':>10} {'之后(ms)':>10} {'加速':>8}")
+    for shape, info in before['shapes'].items():
+        new_ms = after['shapes'][shape]['ms']
+        speedup = info['ms'] / new_ms if new_ms > 0 else float('inf')
+        print(f"   {shape:<9} {info['ms']:>10.2f} {new_ms:>10.2f} {speedup:>7.1f}x")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='K线表索引诊断（执行计划 + 耗时 + 缺失索引 DDL）')
+    parser.add_argument('--period', type=str, nargs='*', default=['day', 'index'],
+                        choices=SUPPORTED_TABLES,
+                        help='要检查的表: K线周期或 index（指数日线） (默认: day index)')
+    parser.add_argument('--samples', type=int, default=5, help='样本股票数 (默认: 5)')
+    parser.add_argument('--repeat', type=int, default=5, help='每条查询重复执行次数 (默认: 5)')
+    parser.add_argument('--ddl-out', type=str, default=None, help='缺失索引的 DDL 输出文件')
+    parser.add_argument('--apply', action='store_true', help='创建缺失的索引，并重新测试对比前后耗时')
+    parser.add_argument('--no-plan', action='store_true', help='不打印执行计划')
+
+    args = parser.parse_args()
+
+    if not HAS_SQLALCHEMY:
+        print("❌ 需要 sqlalchemy，请安装: pip install sqlalchemy")
+        sys.exit(1)
+
+    from src.ai_training.db_session import get_engine
+
+    engine = get_engine()
+    print(f"🔍 数据库: {engine.url.render_as_string(hide_password=True)}")
+
+    reports = {}
+    for name in args.period:
+        reports[name] = benchmark_table(engine, name, args.samples, args.repeat)
+        print_report(reports[name], show_plan=not args.no_plan)
+
+    absent = [report['table'] for report in reports.values() if not report['exists']]
+    if absent:
+        print(f"\n⚠️ {len(absent)} 张表不存在: {', '.join(absent)}")
+
+    missing = [report for report in reports.values() if report['ddl']]
+    if not missing:
+        print(f"\n✅ 已检查的 {len(reports) - len(absent)} 张表都有 (代码, 日期) 复合索引")
+    else:
+        print(f"\n⚠️ {len(missing)} 张表缺少复合索引:")
+        for report in missing:
+            print(f"   {report['ddl']}")
+
+    if args.ddl_out and missing:
+        with open(args.ddl_out, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(report['ddl'] for report in missing) + '\n')
+        print(f"\n💾 DDL 已保存: {args.ddl_out}")
+
+    if args.apply and missing:
+        for report in missing:
+            print(f"\n🔧 创建索引: {report['table']} ...")
+            create_missing_index(engine, report['name'])
+            after = benchmark_table(engine, report['name'], args.samples, args.repeat)
+            if not args.no_plan:
+                print_report(after)
+            print_comparison(report, after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+批量特征原语与 pandas rolling/ewm 的对比测试
+
+运行: python -m pytest src/ai_training/tests -q
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+pd = pytest.importorskip('pandas')
+from src.ai_training import batch_features
+
+WINDOWS = [1, 5, 20, 60]
+SPANS = [5, 12, 26]
+
+
+def _series_batch(seed: int = 0, scale: float = 1.0) -> np.ndarray:
+    """[4, 120] 测试序列: 完整序列、左侧填充 NaN、中间缺失、全部 NaN"""
+    rng = np.random.default_rng(seed)
+    x = scale * (10 + np.cumsum(rng.normal(0, 0.2, (4, 120)), axis=-1))
+    x[1, :37] = np.nan
+    x[2, [50, 51, 80]] = np.nan
+    x[3] = np.nan
+    return x
+
+
+def _pandas_rows(x: np.ndarray, func) -> np.ndarray:
+    return np.vstack([func(pd.Series(row)).to_numpy(dtype=np.float64) for row in x])
+
+
+def test_rolling_mean_after_leading_nan():
+    x = np.concatenate([[np.nan] * 3, np.arange(10.0, 20.0)])
+    np.testing.assert_allclose(batch_features.rolling_mean(x, 5)[-3:], [15.0, 16.0, 17.0])
+    assert np.isnan(batch_features.rolling_mean(x, 5)[:7]).all()
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+@pytest.mark.parametrize('name', ['sum', 'mean', 'max', 'min'])
+def test_rolling_matches_pandas(name, window):
+    x = _series_batch()
+    expected = _pandas_rows(x, lambda s: getattr(s.rolling(window), name)())
+    actual = getattr(batch_features, f'rolling_{name}')(x, window)
+    np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+@pytest.mark.parametrize('scale', [1.0, 1e8])
+def test_rolling_std_matches_pandas(window, scale):
+    # 1e8 为成交量量级，E[x²]-E[x]² 在这个量级上误差明显
+    x = _series_batch(seed=1, scale=scale)
+    expected = _pandas_rows(x, lambda s: s.rolling(window).std(ddof=0))
+    actual = batch_features.rolling_std(x, window)
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-12 * scale, equal_nan=True)
+
+
+@pytest.mark.parametrize('span', SPANS)
+def test_ema_matches_pandas(span):
+    x = _series_batch(seed=2)
+    expected = _pandas_rows(x, lambda s: s.ewm(span=span, adjust=False).mean())
+    actual = batch_features.ema(x, span)
+    np.testing.assert_allclose(actual, expected, rtol=1e-10, equal_nan=True)
+
+
+def test_macd_matches_pandas():
+    x = _series_batch(seed=3)
+    dif, dea, hist = batch_features.macd(x)
+    for row, close in enumerate(x):
+        s = pd.Series(close)
+        expected_dif = s.ewm(span=12, adjust=False).mean() - s.ewm(span=26, adjust=False).mean()
+        expected_dea = expected_dif.ewm(span=9, adjust=False).mean()
+        np.testing.assert_allclose(dif[row], expected_dif, rtol=1e-10, atol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(dea[row], expected_dea, rtol=1e-10, atol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(hist[row], 2 * (expected_dif - expected_dea), rtol=1e-10, atol=1e-12,
+                                   equal_nan=True)
+
+
+@pytest.mark.parametrize('periods', [1, 5])
+def test_pct_change_matches_pandas(periods):
+    x = _series_batch(seed=4)
+    expected = _pandas_rows(x, lambda s: s.pct_change(periods, fill_method=None))
+    actual = batch_features.pct_change(x, periods)
+    np.testing.assert_allclose(actual, expected, rtol=1e-10, equal_nan=True)
+
+
+def test_extract_features_batch_requires_registered_kernels():
+    bars = np.ones((2, batch_features.HISTORY_LENGTH, 5))
+    with pytest.raises(ValueError):
+        batch_features.extract_features_batch(bars, feature_names=['not_registered'])
+
+
+def test_volume_ratio_matches_pandas():
+    volume = _series_batch(seed=5, scale=1e8)
+    expected = _pandas_rows(volume, lambda s: s / s.rolling(5).mean().shift(1))
+    actual = batch_features.volume_ratio(volume, 5)
+    np.testing.assert_allclose(actual, expected, rtol=1e-10, equal_nan=True)
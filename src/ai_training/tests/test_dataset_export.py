@@ -0,0 +1,85 @@
+"""
+数据集导出（Feather / Parquet）的写入与读取往返测试
+
+运行: python -m pytest src/ai_training/tests -q
+"""
+from types import SimpleNamespace
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+# data_pipeline 包的 __init__ 会导入 pipeline（依赖 feature_extractor），
+# 导出模块本身只依赖 numpy/pandas/pyarrow，按文件单独加载
+_spec = importlib.util.spec_from_file_location(
+    'dataset_export',
+    os.path.join(os.path.dirname(__file__), '..', 'data_pipeline', 'dataset_export.py')
+)
+dataset_export = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(dataset_export)
+
+SEQUENCE_LENGTH = 4
+FEATURES_PER_STEP = 3
+FEATURE_NAMES = [f'K{k}_f{j}' for k in range(SEQUENCE_LENGTH) for j in range(FEATURES_PER_STEP)]
+
+
+def _fake_pipeline(sizes):
+    """export_splits 需要的管道属性（各分割的 X/y/收益率、特征名、元数据）"""
+    rng = np.random.default_rng(0)
+    attrs = {'period': 'day', 'split_ranges': {}}
+    start = 0
+    for name, size in zip(dataset_export.SPLIT_NAMES, sizes):
+        attrs[f'X_{name}'] = rng.normal(size=(size, SEQUENCE_LENGTH, FEATURES_PER_STEP)).astype(np.float32)
+        attrs[f'y_{name}'] = rng.integers(0, 3, size).astype(np.int32)
+        returns = rng.normal(0, 0.05, size).astype(np.float32)
+        if size:
+            returns[0] = np.nan
+        attrs[f'returns_{name}'] = returns
+        attrs['split_ranges'][name] = (start, start + size)
+        start += size
+    pipeline = SimpleNamespace(**attrs)
+    pipeline.get_feature_names = lambda: list(FEATURE_NAMES)
+    pipeline.get_metadata = lambda: {'period': 'day', 'total_samples': start}
+    return pipeline
+
+
+def _expected_frame(pipeline, name):
+    X = getattr(pipeline, f'X_{name}')
+    df = pd.DataFrame(X.reshape(X.shape[0], len(FEATURE_NAMES)), columns=FEATURE_NAMES)
+    df[dataset_export.LABEL_COLUMN] = getattr(pipeline, f'y_{name}')
+    return df
+
+
+@pytest.mark.parametrize('file_format', ['feather', 'parquet'])
+@pytest.mark.parametrize('sizes', [(20, 5, 5, 6), (4, 0, 0, 2)])
+def test_round_trip(tmp_path, monkeypatch, file_format, sizes):
+    # 批大小小于分割行数，覆盖多个记录批次
+    monkeypatch.setattr(dataset_export, 'BATCH_ROWS', 8)
+    pipeline = _fake_pipeline(sizes)
+    dataset_export.export_splits(pipeline, str(tmp_path), file_format)
+
+    frames = dataset_export.load_splits(str(tmp_path))
+    assert frames[4] == pipeline.get_metadata()
+    for name, df in zip(dataset_export.SPLIT_NAMES, frames[:4]):
+        expected = _expected_frame(pipeline, name)
+        pd.testing.assert_frame_equal(df.reset_index(drop=True), expected, check_dtype=False)
+        assert list(df.columns) == FEATURE_NAMES + [dataset_export.LABEL_COLUMN]
+
+        _, returns, metadata = dataset_export.load_split(str(tmp_path), name)
+        np.testing.assert_array_equal(returns, getattr(pipeline, f'returns_{name}'))
+        assert metadata['split'] == name
+        assert metadata['shape'] == list(getattr(pipeline, f'X_{name}').shape)
+        assert metadata['feature_names'] == FEATURE_NAMES
+
+
+def test_feature_columns_are_float32(tmp_path):
+    pipeline = _fake_pipeline((3, 1, 1, 1))
+    dataset_export.export_splits(pipeline, str(tmp_path))
+    table = dataset_export.read_split_table(str(tmp_path), 'train')
+    assert table.schema.field(FEATURE_NAMES[0]).type == dataset_export.pa.float32()
+    assert table.schema.field(dataset_export.LABEL_COLUMN).type == dataset_export.pa.int32()
+    assert table.column(dataset_export.RETURN_COLUMN).null_count == 1